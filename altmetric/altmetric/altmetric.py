@@ -1,9 +1,28 @@
+import bz2
+import gzip
 import json
 import logging
+import lzma
+import multiprocessing
 import os
+import tarfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from itertools import islice
 
-from altmetric import models
+import django
+import ijson
+from django.conf import settings
+from django.db import transaction
 from django.db.utils import DataError
+from django.utils import timezone
+
+from altmetric import models
+from article.models import Article
+from core.utils.checksum import get_checksum
+from core.utils.harvest import ordered_map
+from processing_errors.models import ProcessingError
 
 
 def load(file_path, file, user):
@@ -24,7 +43,8 @@ def load(file_path, file, user):
     """
     try:
         logging.info("json_read: %s/%s" % (file_path, file))
-        json_read = open(os.path.join(file_path, file), 'r').read()
+        with open_file(os.path.join(file_path, file)) as fp:
+            json_read = fp.read()
     except Exception as e:
         logging.info(e)
 
@@ -35,15 +55,15 @@ def load(file_path, file, user):
 
             logging.info("issn_scielo %s in process", issn_scielo)
             if issn_scielo:
-                rawaltmetric = models.RawAltmetric.objects.filter(issn_scielo=issn_scielo)
-                if len(rawaltmetric) == 0:
+                rawaltmetric = models.RawAltmetric.objects.filter(
+                    issn_scielo=issn_scielo, resource_type='journal').order_by('id').first()
+                if rawaltmetric is None:
                     rawaltmetric = models.RawAltmetric()
                     rawaltmetric.issn_scielo = issn_scielo
                     rawaltmetric.extraction_date = jdata.get("extraction_date")
                     rawaltmetric.resource_type = 'journal'
                 else:
                     logging.info("json_data %s will be updated", file)
-                    rawaltmetric = rawaltmetric[0]
                     rawaltmetric.extraction_date = jdata.get("extraction_date")
 
 
@@ -51,10 +71,474 @@ def load(file_path, file, user):
                 
                 try:
                     logging.info("json_data %s will be saved", file)
-                    rawaltmetric.save()
+                    with transaction.atomic():
+                        rawaltmetric.save()
+                        models.AltmetricResult.bulk_replace([rawaltmetric])
                 except Exception as e:
                     logging.info(e)
 
         except Exception as e:
             logging.info(e)
-    
\ No newline at end of file
+
+
+def get_paths(dir_path):
+    """
+    Return the paths of the files of ``dir_path``, sorted by name.
+    """
+    return sorted(entry.path for entry in os.scandir(dir_path) if entry.is_file())
+
+
+# magic bytes of the compressed files and the functions which open them
+COMPRESSIONS = (
+    (b'\x1f\x8b', gzip.open),
+    (b'BZh', bz2.open),
+    (b'\xfd7zXZ\x00', lzma.open),
+)
+
+
+def open_file(path):
+    """
+    Return a binary file object of the content of ``path``, decompressed
+    while it is read when ``path`` is compressed by gzip, bz2 or xz.
+
+    The compression is detected by the magic bytes, whatever the name of
+    the file, so no uncompressed copy is ever written.
+    """
+    with open(path, 'rb') as fp:
+        head = fp.read(6)
+    for magic, open_compressed in COMPRESSIONS:
+        if head.startswith(magic):
+            return open_compressed(path, 'rb')
+    return open(path, 'rb')
+
+
+def is_tar(path):
+    with open_file(path) as fp:
+        return fp.read(262)[257:262] == b'ustar'
+
+
+def iter_sources(paths):
+    """
+    Yield (path, name, content) of each Altmetric file of ``paths``.
+
+    A tar archive (compressed or not) is read as a stream and each file in
+    it is yielded with its content, so only one of them is held in memory.
+    Any other file is yielded with None, to be read by read_file. An error
+    in an archive is yielded in place of the content.
+    """
+    for path in paths:
+        try:
+            if not is_tar(path):
+                yield path, path, None
+                continue
+            with open_file(path) as fp, tarfile.open(fileobj=fp, mode='r|') as tar:
+                for member in tar:
+                    if member.isfile():
+                        yield path, f"{path}/{member.name}", tar.extractfile(member).read()
+        except Exception as e:
+            yield path, path, e
+
+
+def read_file(source):
+    """
+    Return (path, name, fields of RawAltmetric, error) of an Altmetric file
+    yielded by iter_sources.
+
+    It runs in the process pool of bulk_load, so the errors are returned
+    instead of raised.
+    """
+    path, name, content = source
+    if isinstance(content, Exception):
+        return path, name, None, content
+    try:
+        if content is None:
+            with open_file(name) as fp:
+                jdata = json.load(fp)
+        else:
+            jdata = json.loads(content)
+        fields = dict(
+            issn_scielo=jdata.get("issn_scielo"),
+            extraction_date=jdata.get("extraction_date"),
+            json=jdata,
+        )
+        return path, name, fields, None
+    except Exception as e:
+        return path, name, None, e
+
+
+class Manifest:
+    """
+    Manifest of the Altmetric files loaded (see models.AltmetricFile).
+
+    A file with the same size and modification time of the manifest is
+    skipped without being opened, and a file with the same checksum is
+    skipped without being parsed. The manifest of the files loaded is saved
+    by ``save``, except the ones with errors, so they are loaded again by
+    the next load.
+
+    Usage:
+        manifest = Manifest()
+        for path in manifest.changed(paths):
+            ...
+            manifest.loaded(path, raw_id)  # or manifest.failed(path)
+        manifest.save()
+    """
+
+    def __init__(self):
+        self.files = {item.path: item for item in models.AltmetricFile.objects.all()}
+        self.unchanged = 0
+        self._pending = {}
+        self._touched = []
+        self._failed = set()
+
+    def changed(self, paths, force=False):
+        """
+        Yield the paths of ``paths`` which changed since they were loaded,
+        or all of them with ``force``.
+        """
+        for path in paths:
+            stat = os.stat(path)
+            item = self.files.get(path)
+            if not force and item and item.size == stat.st_size and item.mtime == stat.st_mtime:
+                self.unchanged += 1
+                continue
+            checksum = get_checksum(path)
+            if not force and item and item.checksum == checksum:
+                item.size = stat.st_size
+                item.mtime = stat.st_mtime
+                self._touched.append(item)
+                self.unchanged += 1
+                continue
+            self._pending[path] = item or models.AltmetricFile(path=path)
+            self._pending[path].size = stat.st_size
+            self._pending[path].mtime = stat.st_mtime
+            self._pending[path].checksum = checksum
+            self._pending[path].raw_id = None
+            yield path
+
+    def loaded(self, path, raw_id=None):
+        self._pending[path].raw_id = raw_id
+
+    def failed(self, path):
+        self._failed.add(path)
+
+    def save(self):
+        items = [item for path, item in self._pending.items() if path not in self._failed] + self._touched
+        now = timezone.now()
+        for item in items:
+            item.loaded = now
+        new = [item for item in items if item.pk is None]
+        if new:
+            models.AltmetricFile.objects.bulk_create(new, batch_size=1000)
+        changed = [item for item in items if item.pk is not None]
+        if changed:
+            models.AltmetricFile.objects.bulk_update(
+                changed, ['size', 'mtime', 'checksum', 'raw', 'loaded'], batch_size=1000)
+        self.files.update({item.path: item for item in items})
+        self._pending.clear()
+        self._touched.clear()
+        self._failed.clear()
+
+
+def register_file_error(path, e):
+    logging.error("Unable to load %s: %s", path, e)
+    error = ProcessingError()
+    error.item = path
+    error.step = "Altmetric file loading error"
+    error.description = str(e)[:509]
+    error.type = str(type(e))
+    error.save()
+
+
+def bulk_load(paths, user, workers=None, batch_size=None, force=False):
+    """
+    Bulk version of load, for the files ``paths``, which may be compressed
+    (gzip, bz2 or xz) or tar archives of Altmetric files (see iter_sources).
+
+    The files are parsed in a pool of ``workers`` processes (or in this
+    process when ``workers`` is not given), while the ids of the existing
+    records are read with one query at the start, so each batch of
+    ``batch_size`` files (default: settings.ALTMETRIC_BATCH_SIZE) is
+    recorded with one bulk_create and one bulk_update, in one transaction.
+    When several files have the same ISSN, the last one wins.
+
+    The metrics of the records are also extracted to AltmetricResult.
+
+    The files which did not change since they were loaded are skipped (see
+    Manifest), unless ``force`` is true.
+
+    Return the counts of files read, unchanged, created, updated, skipped
+    (without ISSN) and failed, and of results extracted, with the
+    throughput in files per second.
+    """
+    batch_size = batch_size or settings.ALTMETRIC_BATCH_SIZE
+    summary = dict(
+        files=0, unchanged=0, created=0, updated=0, skipped=0, failed=0, results=0, files_per_second=0)
+    manifest = Manifest()
+    started = time.monotonic()
+
+    existing = {}
+    for rawaltmetric_id, issn_scielo in models.RawAltmetric.objects.filter(
+            resource_type='journal').order_by('id').values_list('id', 'issn_scielo'):
+        existing.setdefault(issn_scielo, rawaltmetric_id)
+
+    new = {}
+    changed = {}
+    names = {}
+
+    def insert(new, changed):
+        # another partition of the load (see tasks.load_altmetric) may have inserted some of the journals
+        # meanwhile: their ids are read back, and the ones of another extraction are updated
+        models.RawAltmetric.objects.bulk_create(new, ignore_conflicts=True)
+        rows = {
+            issn_scielo: (rawaltmetric_id, extraction_date)
+            for rawaltmetric_id, issn_scielo, extraction_date in models.RawAltmetric.objects.filter(
+                resource_type='journal', issn_scielo__in=[rawaltmetric.issn_scielo for rawaltmetric in new],
+            ).values_list('id', 'issn_scielo', 'extraction_date')
+        }
+        inserted = []
+        changed = list(changed)
+        for rawaltmetric in new:
+            rawaltmetric.id, extraction_date = rows[rawaltmetric.issn_scielo]
+            (inserted if extraction_date == rawaltmetric.extraction_date else changed).append(rawaltmetric)
+        return inserted, changed
+
+    def write(new, changed):
+        with transaction.atomic():
+            if new:
+                new, changed = insert(new, changed)
+            if changed:
+                models.RawAltmetric.objects.bulk_update(changed, ['extraction_date', 'json'])
+            summary['results'] += models.AltmetricResult.bulk_replace(new + changed)
+        existing.update({rawaltmetric.issn_scielo: rawaltmetric.id for rawaltmetric in new + changed})
+        for rawaltmetric in new + changed:
+            path, name = names[rawaltmetric.issn_scielo]
+            if name == path:
+                manifest.loaded(path, rawaltmetric.id)
+        summary['created'] += len(new)
+        summary['updated'] += len(changed)
+
+    def flush():
+        try:
+            write(list(new.values()), list(changed.values()))
+        except Exception:
+            # a record failed the batch, so they are written one by one to find it
+            for rawaltmetric in new.values():
+                rawaltmetric.pk = None
+            for rawaltmetric in list(new.values()) + list(changed.values()):
+                is_new = rawaltmetric.pk is None
+                try:
+                    write([rawaltmetric] if is_new else [], [] if is_new else [rawaltmetric])
+                except Exception as e:
+                    path, name = names[rawaltmetric.issn_scielo]
+                    summary['failed'] += 1
+                    register_file_error(name, e)
+                    manifest.failed(path)
+        new.clear()
+        changed.clear()
+        names.clear()
+        summary['unchanged'] = manifest.unchanged
+        summary['files_per_second'] = round(
+            (summary['files'] + summary['unchanged']) / max(time.monotonic() - started, 1e-6), 2)
+        logging.info("Altmetric files: %s", summary)
+
+    if workers:
+        pool = ProcessPoolExecutor(
+            workers, mp_context=multiprocessing.get_context('spawn'), initializer=django.setup)
+    else:
+        pool = nullcontext()
+    with pool as executor:
+        sources = iter_sources(manifest.changed(paths, force))
+        results = ordered_map(read_file, sources, workers, executor=executor) if workers else map(read_file, sources)
+        for path, name, fields, error in results:
+            summary['files'] += 1
+            if error:
+                summary['failed'] += 1
+                register_file_error(name, error)
+                manifest.failed(path)
+                continue
+            issn_scielo = fields['issn_scielo']
+            if not issn_scielo:
+                summary['skipped'] += 1
+                continue
+            names[issn_scielo] = (path, name)
+            if issn_scielo in existing:
+                changed[issn_scielo] = models.RawAltmetric(
+                    id=existing[issn_scielo], resource_type='journal', **fields)
+            else:
+                new[issn_scielo] = models.RawAltmetric(resource_type='journal', **fields)
+            if len(new) + len(changed) >= batch_size:
+                flush()
+        flush()
+    manifest.save()
+    return summary
+
+
+def extract_results(batch_size=None):
+    """
+    Extract the AltmetricResult of all the RawAltmetric, in batches of
+    ``batch_size`` records (default: settings.ALTMETRIC_BATCH_SIZE), for
+    the records loaded before the results existed.
+
+    Return the number of results extracted.
+    """
+    batch_size = batch_size or settings.ALTMETRIC_BATCH_SIZE
+    count = 0
+    last_id = 0
+    while True:
+        raws = list(models.RawAltmetric.objects.filter(id__gt=last_id).order_by('id')[:batch_size])
+        if not raws:
+            break
+        with transaction.atomic():
+            count += models.AltmetricResult.bulk_replace(raws)
+        last_id = raws[-1].id
+        logging.info("Altmetric results extracted: %s", count)
+    return count
+
+
+# top level keys of an article dump which are copied to its records
+ARTICLE_DUMP_KEYS = ('issn_scielo', 'collection', 'extraction_date')
+
+# keys of the identifier of the article in the items of ``results``
+ARTICLE_ID_KEYS = ('pid_v2', 'pid', 'scielo_pid')
+
+
+def get_pid(entry):
+    for key in ARTICLE_ID_KEYS:
+        if entry.get(key):
+            return entry[key]
+
+
+def read_article_dump_header(path):
+    """
+    Return the values of ARTICLE_DUMP_KEYS of the article dump ``path``,
+    read as a stream, so ``results`` is never built in memory.
+
+    The keys after ``results`` are not read, so the stream stops at the
+    start of the entries, and the keys not found are None.
+    """
+    header = dict.fromkeys(ARTICLE_DUMP_KEYS)
+    found = set()
+    with open_file(path) as fp:
+        for prefix, event, value in ijson.parse(fp, use_float=True):
+            if prefix == '' and event == 'map_key' and value == 'results':
+                break
+            if prefix in header and event not in ('start_map', 'start_array', 'map_key'):
+                header[prefix] = value
+                found.add(prefix)
+                if len(found) == len(ARTICLE_DUMP_KEYS):
+                    break
+    return header
+
+
+def iter_article_entries(path, batch_size):
+    """
+    Yield the items of ``results`` of the article dump ``path`` in lists of
+    ``batch_size``, parsed one by one, so only one list is held in memory
+    whatever the size of the file.
+    """
+    with open_file(path) as fp:
+        entries = ijson.items(fp, 'results.item', use_float=True)
+        while True:
+            batch = list(islice(entries, batch_size))
+            if not batch:
+                break
+            yield batch
+
+
+def load_article_entries(entries, header):
+    """
+    Record the RawAltmetric of the article ``entries`` of a dump, keyed by
+    pid_v2 and linked to the Article of the same pid_v2, with two queries,
+    one bulk_create and one bulk_update. When several entries have the same
+    pid_v2, the last one wins.
+
+    Return the counts of entries created, updated, skipped (without pid_v2)
+    and linked to an article.
+    """
+    summary = dict(created=0, updated=0, skipped=0, linked=0)
+    records = {}
+    for entry in entries:
+        pid_v2 = get_pid(entry)
+        if pid_v2:
+            records[pid_v2] = entry
+        else:
+            summary['skipped'] += 1
+
+    articles = dict(Article.objects.filter(pid_v2__in=records).values_list('pid_v2', 'id'))
+    existing = {}
+    for rawaltmetric_id, pid_v2 in models.RawAltmetric.objects.filter(
+            resource_type='article', pid_v2__in=records).order_by('id').values_list('id', 'pid_v2'):
+        existing.setdefault(pid_v2, rawaltmetric_id)
+
+    new = []
+    changed = []
+    for pid_v2, entry in records.items():
+        rawaltmetric = models.RawAltmetric(
+            id=existing.get(pid_v2),
+            issn_scielo=header.get('issn_scielo') or '',
+            extraction_date=header.get('extraction_date') or '',
+            resource_type='article',
+            pid_v2=pid_v2,
+            article_id=articles.get(pid_v2),
+            json=entry,
+        )
+        (new if rawaltmetric.id is None else changed).append(rawaltmetric)
+
+    with transaction.atomic():
+        if new:
+            models.RawAltmetric.objects.bulk_create(new)
+        if changed:
+            models.RawAltmetric.objects.bulk_update(
+                changed, ['issn_scielo', 'extraction_date', 'article', 'json'])
+    summary['created'] = len(new)
+    summary['updated'] = len(changed)
+    summary['linked'] = sum(1 for pid_v2 in records if pid_v2 in articles)
+    return summary
+
+
+def bulk_load_articles(paths, user, batch_size=None, force=False):
+    """
+    Load the article dumps ``paths``, which may be compressed, with flat
+    memory: the header of each dump is read in a first pass and the items
+    of ``results`` are parsed one by one in a second pass and recorded in
+    batches of ``batch_size`` (default: settings.ALTMETRIC_BATCH_SIZE),
+    each one in its own transaction (see load_article_entries).
+
+    The files which did not change since they were loaded are skipped (see
+    Manifest), unless ``force`` is true.
+
+    Return the counts of files read and unchanged, of entries read,
+    created, updated, skipped (without pid_v2), failed and linked to an
+    article, with the throughput in entries per second.
+    """
+    batch_size = batch_size or settings.ALTMETRIC_BATCH_SIZE
+    summary = dict(
+        files=0, unchanged=0, entries=0, created=0, updated=0, skipped=0, failed=0, linked=0,
+        entries_per_second=0)
+    started = time.monotonic()
+    manifest = Manifest()
+    for path in manifest.changed(paths, force):
+        summary['files'] += 1
+        try:
+            header = read_article_dump_header(path)
+            for entries in iter_article_entries(path, batch_size):
+                summary['entries'] += len(entries)
+                try:
+                    for key, value in load_article_entries(entries, header).items():
+                        summary[key] += value
+                except Exception as e:
+                    summary['failed'] += len(entries)
+                    register_file_error(
+                        f"Entries {summary['entries'] - len(entries) + 1} to {summary['entries']} of {path}", e)
+                    manifest.failed(path)
+                summary['entries_per_second'] = round(summary['entries'] / max(time.monotonic() - started, 1e-6), 2)
+                logging.info("Altmetric articles: %s", summary)
+        except Exception as e:
+            register_file_error(path, e)
+            manifest.failed(path)
+            continue
+        manifest.loaded(path)
+    summary['unchanged'] = manifest.unchanged
+    manifest.save()
+    return summary
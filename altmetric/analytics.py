@@ -0,0 +1,139 @@
+import hashlib
+import json
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max
+
+from .models import AltmetricResult
+
+
+class WeeksMatrix:
+    """
+    Histograms ``weeks_by_articles`` of a selection of AltmetricResult in a
+    dense matrix, one row by result (usually one by journal) and one column
+    by week.
+
+    Attributes
+    ----------
+    issns : numpy.ndarray
+        ISSN SciELO of each row
+    collections : numpy.ndarray
+        Collection of each row
+    matrix : numpy.ndarray
+        Counts of articles, rows x weeks
+    """
+
+    def __init__(self, issns, collections, matrix):
+        self.issns = np.asarray(issns, dtype=object)
+        self.collections = np.asarray(collections, dtype=object)
+        self.matrix = matrix
+
+    @classmethod
+    def load(cls, queryset):
+        """
+        Return the WeeksMatrix of the AltmetricResult of ``queryset``, read
+        with one query. The shorter histograms are padded with zeros.
+        """
+        rows = list(queryset.order_by('issn_scielo', 'id').values_list(
+            'issn_scielo', 'collection', 'weeks_by_articles'))
+        matrix = np.zeros((len(rows), max((len(weeks) for *_, weeks in rows), default=0)), dtype=np.int64)
+        for i, (issn_scielo, collection, weeks) in enumerate(rows):
+            matrix[i, :len(weeks)] = weeks
+        return cls([row[0] for row in rows], [row[1] for row in rows], matrix)
+
+    def __len__(self):
+        return len(self.issns)
+
+    def totals(self):
+        """
+        Return the total of articles of each row.
+        """
+        return self.matrix.sum(axis=1)
+
+    def sum_by(self, labels):
+        """
+        Return a dict {label: sum of the histograms of the rows of the label},
+        where ``labels`` has the label of each row (None rows are ignored).
+        """
+        labels = np.asarray(labels, dtype=object)
+        selected = np.array([label is not None for label in labels], dtype=bool)
+        keys, inverse = np.unique(labels[selected].astype(str), return_inverse=True)
+        sums = np.zeros((len(keys), self.matrix.shape[1]), dtype=self.matrix.dtype)
+        np.add.at(sums, inverse.ravel(), self.matrix[selected])
+        return dict(zip(keys.tolist(), sums))
+
+    def sum_by_collection(self):
+        return self.sum_by(self.collections)
+
+    def sum_by_group(self, groups):
+        """
+        Return the sums of the histograms by group, where ``groups`` is a
+        dict {issn_scielo: group}, e.g. the thematic area of each journal.
+        """
+        return self.sum_by([groups.get(issn_scielo) for issn_scielo in self.issns])
+
+    def rolling(self, window, mean=False):
+        """
+        Return the sums (or means) of each row in a rolling window of
+        ``window`` weeks, rows x (weeks - window + 1).
+        Raise ValueError if ``window`` is not positive.
+        """
+        if window < 1:
+            raise ValueError("The rolling window must be of one week or more, not %s" % window)
+        cumsum = np.cumsum(np.pad(self.matrix, ((0, 0), (1, 0))), axis=1)
+        sums = cumsum[:, window:] - cumsum[:, :-window]
+        return sums / window if mean else sums
+
+    def percentiles(self, q):
+        """
+        Return the percentiles ``q`` of the rows for each week, len(q) x weeks.
+        """
+        if not len(self):
+            return np.zeros((len(q), self.matrix.shape[1]))
+        return np.percentile(self.matrix, q, axis=0)
+
+    def top(self, k, weeks=None):
+        """
+        Return the ``k`` rows with more articles, in the ``weeks`` (a slice)
+        or in all the weeks, as a list of (issn_scielo, total).
+        """
+        totals = self.matrix[:, weeks or slice(None)].sum(axis=1)
+        k = min(k, len(totals))
+        if not k:
+            return []
+        indexes = np.argpartition(-totals, k - 1)[:k]
+        indexes = indexes[np.argsort(-totals[indexes], kind='stable')]
+        return [(self.issns[i], int(totals[i])) for i in indexes]
+
+
+def get_weeks_matrix(collection=None, issns=None, extraction_date=None):
+    """
+    Return the WeeksMatrix of the AltmetricResult of ``collection``, of the
+    journals ``issns`` and extracted in ``extraction_date`` (a prefix, e.g.
+    "2022-11"), all optional.
+
+    The matrix is kept in the Django cache for
+    settings.ALTMETRIC_ANALYTICS_CACHE_TIMEOUT seconds, by selection and by
+    its last extraction date and results, so it is loaded again only when
+    data of the selection is extracted again.
+    """
+    queryset = AltmetricResult.objects.all()
+    if collection:
+        queryset = queryset.filter(collection=collection)
+    if issns:
+        queryset = queryset.filter(issn_scielo__in=sorted(issns))
+    if extraction_date:
+        queryset = queryset.filter(extraction_date__startswith=extraction_date)
+
+    # results which are extracted again are replaced, so they have new ids
+    version = queryset.aggregate(last=Max('extraction_date'), count=Count('id'), last_id=Max('id'))
+    key = hashlib.sha1(json.dumps(
+        [collection, sorted(issns or []), extraction_date, version]).encode()).hexdigest()
+    key = f"altmetric-weeks:{key}"
+    weeks_matrix = cache.get(key)
+    if weeks_matrix is None:
+        weeks_matrix = WeeksMatrix.load(queryset)
+        cache.set(key, weeks_matrix, timeout=settings.ALTMETRIC_ANALYTICS_CACHE_TIMEOUT)
+    return weeks_matrix
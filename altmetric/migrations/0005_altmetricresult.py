@@ -0,0 +1,55 @@
+# Generated by Django 4.1.6 on 2026-10-18 05:18
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('altmetric', '0004_alter_rawaltmetric_resource_type'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AltmetricResult',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveIntegerField(default=0, verbose_name='Position')),
+                ('issn_scielo', models.CharField(max_length=9, verbose_name='ISSN SciELO')),
+                ('collection', models.CharField(blank=True, max_length=10, null=True, verbose_name='Collection')),
+                ('extraction_date', models.CharField(blank=True, max_length=26, null=True, verbose_name='Extraction Date')),
+                ('title', models.TextField(blank=True, null=True, verbose_name='Title')),
+                ('count', models.IntegerField(blank=True, null=True, verbose_name='Count')),
+                ('posts', models.IntegerField(blank=True, null=True, verbose_name='Posts')),
+                ('scores_sum', models.FloatField(blank=True, null=True, verbose_name='Scores sum')),
+                ('scores_median', models.FloatField(blank=True, null=True, verbose_name='Scores median')),
+                ('scores_in_timeframe_sum', models.FloatField(blank=True, null=True, verbose_name='Scores in timeframe sum')),
+                ('scores_in_timeframe_median', models.FloatField(blank=True, null=True, verbose_name='Scores in timeframe median')),
+                ('weeks_by_articles', django.contrib.postgres.fields.ArrayField(base_field=models.IntegerField(), blank=True, default=list, size=None, verbose_name='Weeks by articles')),
+                ('source_posts', models.JSONField(blank=True, default=dict, verbose_name='Posts by source')),
+                ('raw', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='results', to='altmetric.rawaltmetric', verbose_name='Raw Altmetric')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='altmetricresult',
+            index=models.Index(fields=['issn_scielo'], name='altmetric_a_issn_sc_d88292_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='altmetricresult',
+            index=models.Index(fields=['collection'], name='altmetric_a_collect_be757d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='altmetricresult',
+            index=models.Index(fields=['posts'], name='altmetric_a_posts_70b61f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='altmetricresult',
+            index=models.Index(fields=['scores_sum'], name='altmetric_a_scores__4a5391_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='altmetricresult',
+            index=models.Index(fields=['scores_in_timeframe_sum'], name='altmetric_a_scores__1dba66_idx'),
+        ),
+    ]
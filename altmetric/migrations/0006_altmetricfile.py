@@ -0,0 +1,26 @@
+# Generated by Django 4.1.6 on 2026-10-18 05:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('altmetric', '0005_altmetricresult'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AltmetricFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(max_length=1024, unique=True, verbose_name='Path')),
+                ('size', models.BigIntegerField(verbose_name='Size')),
+                ('mtime', models.FloatField(verbose_name='Modification time')),
+                ('checksum', models.CharField(max_length=64, verbose_name='Checksum')),
+                ('loaded', models.DateTimeField(auto_now=True, verbose_name='Loaded')),
+                ('raw', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='files', to='altmetric.rawaltmetric', verbose_name='Raw Altmetric')),
+            ],
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.1.6 on 2026-10-18 05:22
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('article', '0003_fundingimport'),
+        ('altmetric', '0006_altmetricfile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rawaltmetric',
+            name='article',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='article.article', verbose_name='Article'),
+        ),
+        migrations.AddField(
+            model_name='rawaltmetric',
+            name='pid_v2',
+            field=models.CharField(blank=True, max_length=23, null=True, verbose_name='PID V2'),
+        ),
+        migrations.AddIndex(
+            model_name='rawaltmetric',
+            index=models.Index(fields=['pid_v2'], name='altmetric_r_pid_v2_a567b7_idx'),
+        ),
+    ]
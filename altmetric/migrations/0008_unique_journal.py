@@ -0,0 +1,39 @@
+# Generated by Django 4.1.6 on 2026-10-18 09:12
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def merge_duplicated_journals(apps, schema_editor):
+    """
+    Keep only the oldest RawAltmetric of each journal, which is the one the
+    loads updated, so the unique constraint can be added. The files of the
+    removed ones are moved to the kept one.
+    """
+    RawAltmetric = apps.get_model('altmetric', 'RawAltmetric')
+    AltmetricFile = apps.get_model('altmetric', 'AltmetricFile')
+
+    duplicated = (
+        RawAltmetric.objects.filter(resource_type='journal')
+        .values('issn_scielo').annotate(total=Count('id'), keep=Min('id')).filter(total__gt=1)
+    )
+    for item in duplicated:
+        removed = RawAltmetric.objects.filter(
+            resource_type='journal', issn_scielo=item['issn_scielo']).exclude(id=item['keep'])
+        AltmetricFile.objects.filter(raw__in=removed).update(raw_id=item['keep'])
+        removed.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('altmetric', '0007_rawaltmetric_article'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicated_journals, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='rawaltmetric',
+            constraint=models.UniqueConstraint(condition=models.Q(('resource_type', 'journal')), fields=('issn_scielo',), name='altmetric_rawaltmetric_unique_journal'),
+        ),
+    ]
@@ -1,3 +1,4 @@
+from django.contrib.postgres.fields import ArrayField
 from django.db import models
 from django.utils.translation import gettext as _
 
@@ -12,22 +13,166 @@ class RawAltmetric(models.Model):
     resource_type = models.CharField(_("Resource Type"), max_length=10, choices=choices.TYPE_OF_RESOURCE, null=False,
                                      blank=False)
     json = models.JSONField(_("JSON File"), null=True, blank=True)
+    pid_v2 = models.CharField(_("PID V2"), max_length=23, null=True, blank=True)
+    article = models.ForeignKey("article.Article", verbose_name=_("Article"), null=True, blank=True,
+                                on_delete=models.SET_NULL)
 
     def __unicode__(self):
-        return self.issn_scielo
+        return self.pid_v2 or self.issn_scielo
 
     def __str__(self):
-        return self.issn_scielo
+        return self.pid_v2 or self.issn_scielo
 
     class Meta:
         indexes = [
             models.Index(fields=['issn_scielo', ]),
             models.Index(fields=['resource_type', ]),
+            models.Index(fields=['pid_v2', ]),
+        ]
+        constraints = [
+            # one record of the metrics of each journal, whatever the number of loads running
+            models.UniqueConstraint(fields=['issn_scielo', ], condition=models.Q(resource_type='journal'),
+                                    name='altmetric_rawaltmetric_unique_journal'),
         ]
 
     panels = [
         FieldPanel('issn_scielo'),
+        FieldPanel('pid_v2'),
         FieldPanel('extraction_date'),
         FieldPanel('resource_type'),
         FieldPanel('json'),
-    ]
\ No newline at end of file
+    ]
+
+
+class AltmetricFile(models.Model):
+    """
+    Manifest of an Altmetric file loaded, so the next loads skip it while
+    it does not change.
+
+    Fields:
+        size, mtime: Size and modification time of the file when loaded
+        checksum: SHA-256 of the file, to skip a file touched but not changed
+        raw: RawAltmetric of the file (none for an archive of many files)
+    """
+    path = models.CharField(_("Path"), max_length=1024, unique=True)
+    size = models.BigIntegerField(_("Size"))
+    mtime = models.FloatField(_("Modification time"))
+    checksum = models.CharField(_("Checksum"), max_length=64)
+    raw = models.ForeignKey(RawAltmetric, verbose_name=_("Raw Altmetric"), related_name='files', null=True,
+                            blank=True, on_delete=models.SET_NULL)
+    loaded = models.DateTimeField(_("Loaded"), auto_now=True)
+
+    def __unicode__(self):
+        return self.path
+
+    def __str__(self):
+        return self.path
+
+    panels = [
+        FieldPanel('path'),
+        FieldPanel('size'),
+        FieldPanel('mtime'),
+        FieldPanel('checksum'),
+        FieldPanel('raw'),
+    ]
+
+
+class AltmetricResult(models.Model):
+    """
+    Metrics of one item of ``results`` of a RawAltmetric, in columns, so the
+    rankings and aggregations run in SQL instead of decoding the JSON.
+
+    Fields:
+        weeks_by_articles: Histogram of ``stats.weeks_by_articles``, the
+            value of week N is at the index N
+        source_posts: Counts of ``stats.sources.posts`` by source (accounts,
+            tweeters, patents...)
+    """
+    raw = models.ForeignKey(RawAltmetric, verbose_name=_("Raw Altmetric"), related_name='results',
+                            on_delete=models.CASCADE)
+    position = models.PositiveIntegerField(_("Position"), default=0)
+    issn_scielo = models.CharField(_("ISSN SciELO"), max_length=9)
+    collection = models.CharField(_("Collection"), max_length=10, null=True, blank=True)
+    extraction_date = models.CharField(_("Extraction Date"), max_length=26, null=True, blank=True)
+    title = models.TextField(_("Title"), null=True, blank=True)
+    count = models.IntegerField(_("Count"), null=True, blank=True)
+    posts = models.IntegerField(_("Posts"), null=True, blank=True)
+    scores_sum = models.FloatField(_("Scores sum"), null=True, blank=True)
+    scores_median = models.FloatField(_("Scores median"), null=True, blank=True)
+    scores_in_timeframe_sum = models.FloatField(_("Scores in timeframe sum"), null=True, blank=True)
+    scores_in_timeframe_median = models.FloatField(_("Scores in timeframe median"), null=True, blank=True)
+    weeks_by_articles = ArrayField(models.IntegerField(), verbose_name=_("Weeks by articles"), default=list,
+                                   blank=True)
+    source_posts = models.JSONField(_("Posts by source"), default=dict, blank=True)
+
+    def __unicode__(self):
+        return u'%s | %s' % (self.issn_scielo, self.title)
+
+    def __str__(self):
+        return u'%s | %s' % (self.issn_scielo, self.title)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['issn_scielo', ]),
+            models.Index(fields=['collection', ]),
+            models.Index(fields=['posts', ]),
+            models.Index(fields=['scores_sum', ]),
+            models.Index(fields=['scores_in_timeframe_sum', ]),
+        ]
+
+    panels = [
+        FieldPanel('issn_scielo'),
+        FieldPanel('collection'),
+        FieldPanel('extraction_date'),
+        FieldPanel('title'),
+        FieldPanel('count'),
+        FieldPanel('posts'),
+        FieldPanel('scores_sum'),
+        FieldPanel('scores_median'),
+        FieldPanel('scores_in_timeframe_sum'),
+        FieldPanel('scores_in_timeframe_median'),
+        FieldPanel('weeks_by_articles'),
+        FieldPanel('source_posts'),
+    ]
+
+    @classmethod
+    def parse(cls, jdata):
+        """
+        Return the AltmetricResult, not saved and without ``raw``, of each
+        item of ``results`` of the Altmetric data ``jdata``.
+        """
+        results = []
+        for position, result in enumerate(jdata.get("results") or []):
+            stats = result.get("stats") or {}
+            weeks = {int(week): value for week, value in (stats.get("weeks_by_articles") or {}).items()}
+            results.append(cls(
+                position=position,
+                issn_scielo=jdata.get("issn_scielo"),
+                collection=jdata.get("collection"),
+                extraction_date=jdata.get("extraction_date"),
+                title=result.get("title"),
+                count=result.get("count"),
+                posts=stats.get("posts"),
+                scores_sum=stats.get("scores_sum"),
+                scores_median=stats.get("scores_median"),
+                scores_in_timeframe_sum=stats.get("scores_in_timeframe_sum"),
+                scores_in_timeframe_median=stats.get("scores_in_timeframe_median"),
+                weeks_by_articles=[weeks.get(week, 0) for week in range(max(weeks, default=-1) + 1)],
+                source_posts=(stats.get("sources") or {}).get("posts") or {},
+            ))
+        return results
+
+    @classmethod
+    def bulk_replace(cls, raws):
+        """
+        Replace the results of the RawAltmetric ``raws`` by the ones of their
+        ``json``, with one delete and one insert.
+        """
+        results = []
+        for raw in raws:
+            for result in cls.parse(raw.json or {}):
+                result.raw_id = raw.id
+                results.append(result)
+        cls.objects.filter(raw_id__in=[raw.id for raw in raws]).delete()
+        cls.objects.bulk_create(results)
+        return len(results)
@@ -1,9 +1,22 @@
 import logging
+
+from django.contrib.auth import get_user_model
+
+from altmetric.altmetric import altmetric
 from altmetric.tasks import load_altmetric
 
 
 def run(*args):
-    if args:
+    """
+    Usage: python manage.py runscript load_altmetric --script-args USER_ID PATH [WORKERS]
+
+    With WORKERS, the files are loaded by this process, parsed by a pool of
+    that many processes. Otherwise, the load is enqueued.
+    """
+    if len(args) > 2:
+        user = get_user_model().objects.get(id=args[0])
+        altmetric.bulk_load(altmetric.get_paths(args[1]), user, workers=int(args[2]))
+    elif args:
         logging.info(args)
         try:
             load_altmetric.apply_async(kwargs={"user_id": args[0], "file_path": args[1]})
@@ -12,4 +25,4 @@ def run(*args):
             logging.info("The 'User ID' and the 'path' to Altmetric files is required.")
             logging.info("'User ID' must be an integer and 'path' must be a string")
     else:
-        logging.info("The User ID and the path to Altmetric files is required.")
\ No newline at end of file
+        logging.info("The User ID and the path to Altmetric files is required.")
@@ -1,6 +1,6 @@
 import logging
-import os
 
+from celery import group
 from django.contrib.auth import get_user_model
 
 from config import celery_app
@@ -12,7 +12,7 @@ User = get_user_model()
 
 
 @celery_app.task()
-def load_altmetric(user_id, file_path):
+def load_altmetric(user_id, file_path, partitions=None, batch_size=None, force=False, resource_type='journal'):
     """
     Load the data from Altmetric files.
 
@@ -20,12 +20,38 @@ def load_altmetric(user_id, file_path):
 
     Param file_path: String with the path of the JSON like file compressed or not.
     Param user: The user id passed by kwargs on tasks.kwargs
+    Param partitions: Number of tasks which load the files in parallel
+    Param batch_size: Number of files (or of articles) recorded in each transaction
+    Param force: Load also the files which did not change since the last load
+    Param resource_type: "journal" or "article", the level of the metrics of the files
     """
+    paths = altmetric.get_paths(file_path)
+    logging.info("list_dir : %s (%s files)" % (file_path, len(paths)))
+
+    if not paths:
+        return
+    if not partitions:
+        return load_altmetric_files(user_id, paths, batch_size, force, resource_type)
+
+    size = -(-len(paths) // partitions)
+    group(
+        load_altmetric_files.s(user_id, paths[i:i + size], batch_size, force, resource_type)
+        for i in range(0, len(paths), size)
+    ).apply_async()
+
+
+@celery_app.task()
+def load_altmetric_files(user_id, paths, batch_size=None, force=False, resource_type='journal'):
     user = User.objects.get(id=user_id)
 
-    try:
-        for file in os.listdir(file_path):
-            logging.info("list_dir : %s/%s" % (file_path, file))
-            altmetric.load(file_path, file, user)
-    except Exception as e:
-        logging.info(e)
\ No newline at end of file
+    if resource_type == 'article':
+        return altmetric.bulk_load_articles(paths, user, batch_size=batch_size, force=force)
+    return altmetric.bulk_load(paths, user, batch_size=batch_size, force=force)
+
+
+@celery_app.task()
+def extract_altmetric_results(batch_size=None):
+    """
+    Extract the metrics of the Altmetric records loaded before AltmetricResult.
+    """
+    return altmetric.extract_results(batch_size)
@@ -1,3 +1,78 @@
-from django.test import TestCase
+import json
 
-# Create your tests here.
+import numpy as np
+import pytest
+
+from altmetric import models
+from altmetric.altmetric import altmetric
+from altmetric.analytics import WeeksMatrix
+from core.users.tests.factories import UserFactory
+
+pytestmark = pytest.mark.django_db
+
+
+def write_dump(path, issn_scielo, extraction_date, results=()):
+    path.write_text(json.dumps(dict(
+        issn_scielo=issn_scielo,
+        extraction_date=extraction_date,
+        results=[dict(title=title, count=1) for title in results],
+    )))
+    return str(path)
+
+
+@pytest.fixture
+def user():
+    return UserFactory()
+
+
+@pytest.mark.parametrize("extraction_date", ["2023-01-01", "2023-02-01"])
+def test_bulk_load_updates_a_journal_inserted_by_another_load(user, tmp_path, monkeypatch, extraction_date):
+    path = write_dump(tmp_path / "a.json", "0001-0001", "2023-02-01", ["new"])
+    get_checksum = altmetric.get_checksum
+
+    def insert_meanwhile(path):
+        # another partition of the load inserts the journal after the ids were read
+        models.RawAltmetric.objects.create(
+            issn_scielo="0001-0001", extraction_date=extraction_date, resource_type="journal", json={})
+        return get_checksum(path)
+
+    monkeypatch.setattr(altmetric, "get_checksum", insert_meanwhile)
+    summary = altmetric.bulk_load([path], user)
+
+    rawaltmetric = models.RawAltmetric.objects.get()
+    assert summary["failed"] == 0
+    assert summary["created"] + summary["updated"] == 1
+    assert rawaltmetric.extraction_date == "2023-02-01"
+    assert models.AltmetricFile.objects.get().raw_id == rawaltmetric.id
+    assert list(models.AltmetricResult.objects.values_list("raw_id", "title")) == [(rawaltmetric.id, "new")]
+
+
+def test_a_journal_has_only_one_record():
+    models.RawAltmetric.objects.create(issn_scielo="0001-0001", extraction_date="1", resource_type="journal")
+    models.RawAltmetric.objects.create(issn_scielo="0001-0001", extraction_date="1", resource_type="article")
+    with pytest.raises(Exception):
+        models.RawAltmetric.objects.create(issn_scielo="0001-0001", extraction_date="2", resource_type="journal")
+
+
+def test_weeks_matrix_rolling_sums_the_weeks_of_each_window():
+    weeks = WeeksMatrix(["0001-0001", "0002-0002"], ["scl", "arg"], np.array([[1, 2, 3, 4], [0, 1, 0, 1]]))
+
+    assert weeks.rolling(2).tolist() == [[3, 5, 7], [1, 1, 1]]
+    assert weeks.rolling(4, mean=True).tolist() == [[2.5], [0.5]]
+
+
+@pytest.mark.parametrize("window", [0, -1])
+def test_weeks_matrix_rolling_needs_a_positive_window(window):
+    weeks = WeeksMatrix(["0001-0001"], ["scl"], np.array([[1, 2, 3]]))
+
+    with pytest.raises(ValueError):
+        weeks.rolling(window)
+
+
+def test_read_article_dump_header_stops_at_the_results(tmp_path):
+    path = tmp_path / "dump.json"
+    # the entries are not valid JSON, so the test fails if they are parsed
+    path.write_text('{"issn_scielo": "0001-0001", "results": [{"pid_v2": ]]], "extraction_date": "2023-01-01"}')
+
+    assert altmetric.read_article_dump_header(str(path)) == dict(
+        issn_scielo="0001-0001", collection=None, extraction_date=None)
@@ -2,7 +2,7 @@ from django.utils.translation import gettext as _
 
 from wagtail.contrib.modeladmin.options import (ModelAdmin, modeladmin_register, ModelAdminGroup)
 
-from .models import (RawAltmetric)
+from .models import (AltmetricFile, AltmetricResult, RawAltmetric)
 
 
 class RawAltmetricAdmin(ModelAdmin):
@@ -23,4 +23,48 @@ class RawAltmetricAdmin(ModelAdmin):
     search_fields = ('issn_scielo',)
 
 
-modeladmin_register(RawAltmetricAdmin)
\ No newline at end of file
+class AltmetricResultAdmin(ModelAdmin):
+    model = AltmetricResult
+    menu_label = _('Altmetric results')
+    menu_icon = 'folder'
+    add_to_settings_menu = False  # or True to add your model to the Settings sub-menu
+    exclude_from_explorer = False  # or True to exclude pages of this type from Wagtail's explorer view
+    inspect_view_enabled = True
+
+    list_display = (
+        'issn_scielo',
+        'collection',
+        'title',
+        'posts',
+        'scores_sum',
+        'scores_in_timeframe_sum',
+        'extraction_date',
+    )
+    list_filter = ('collection', )
+    search_fields = ('issn_scielo', 'title')
+
+
+class AltmetricFileAdmin(ModelAdmin):
+    model = AltmetricFile
+    menu_label = _('Altmetric files')
+    menu_icon = 'folder'
+    add_to_settings_menu = False  # or True to add your model to the Settings sub-menu
+    exclude_from_explorer = False  # or True to exclude pages of this type from Wagtail's explorer view
+    inspect_view_enabled = True
+
+    list_display = (
+        'path',
+        'size',
+        'raw',
+        'loaded',
+    )
+    search_fields = ('path', 'checksum')
+
+
+class AltmetricAdminGroup(ModelAdminGroup):
+    menu_label = _('Altmetric')
+    menu_icon = 'folder-open-inverse'
+    items = (RawAltmetricAdmin, AltmetricResultAdmin, AltmetricFileAdmin)
+
+
+modeladmin_register(AltmetricAdminGroup)
\ No newline at end of file
@@ -1,32 +1,319 @@
 import csv
+import glob
+import json
 import logging
+import os
+import tempfile
+import time
+import zlib
+from itertools import islice
 
-from .models import Article, ArticleFunding
-from institution.models import Sponsor
-
-
-def load_financial_data(row, user):
-    article_findings = []
-    for institution in row.get('funding_source').split(','):
-        sponsor = Sponsor.get_or_create(
-            inst_name=institution,
-            inst_acronym=None,
-            level_1=None,
-            level_2=None,
-            level_3=None,
-            location=None,
-            official=None,
-            is_official=None
+from django.conf import settings
+
+from .models import Article, ArticleFunding, FundingImport
+from core.utils.checksum import get_checksum
+from institution.resolver import SponsorIndex
+from processing_errors.models import ProcessingError
+
+
+def get_funding_sources(row):
+    return [name for name in (row.get('funding_source') or '').split(',') if name.strip()]
+
+
+def load_financial_chunk(rows, user, sponsors):
+    """
+    Load the funding ``rows``, dicts with pid_v2, award_id and
+    funding_source (a comma separated list of sponsor names).
+
+    The sponsors are resolved by the SponsorIndex ``sponsors``, and the
+    fundings and the articles of all ``rows`` are got or created with
+    set-based queries, and the fundings are added to the articles with one
+    insert in the through table.
+    Return the number of fundings added to the articles.
+    """
+    sponsors = sponsors.get_ids(
+        {name for row in rows for name in get_funding_sources(row)}, user)
+    fundings = ArticleFunding.bulk_get_or_create(
+        {(row.get('award_id'), sponsors[name]) for row in rows for name in get_funding_sources(row)}, user)
+    articles = Article.bulk_get_or_create({row.get('pid_v2') for row in rows}, user)
+    return Article.bulk_add_fundings(
+        (articles[row.get('pid_v2')], fundings[(row.get('award_id'), sponsors[name])])
+        for row in rows for name in get_funding_sources(row)
+    )
+
+
+def iter_records(fp, end=None):
+    """
+    Yield the CSV records of the binary file ``fp`` from its position up to
+    the byte ``end``, each one with the byte offset after it.
+
+    A line with an odd number of quotes has a line break inside a quoted
+    value, so it is joined to the next lines up to the end of the value.
+    """
+    while end is None or fp.tell() < end:
+        record = fp.readline()
+        if not record:
+            break
+        while record.count(b'"') % 2:
+            line = fp.readline()
+            if not line:
+                break
+            record += line
+        yield record.decode('utf-8'), fp.tell()
+
+
+def iter_chunks(file_path, chunk_size, start=None):
+    """
+    Yield the rows of the CSV ``file_path``, as dicts, in lists of
+    ``chunk_size`` rows, each one with the byte offset after its last row.
+
+    With ``start``, the offset returned with a previous chunk, the rows are
+    read from there.
+    """
+    header = read_header(file_path)
+    with open(file_path, 'rb') as fp:
+        if start:
+            fp.seek(start)
+        else:
+            next(iter_records(fp))
+        records = iter_records(fp)
+        while True:
+            chunk = list(islice(records, chunk_size))
+            if not chunk:
+                break
+            yield list(csv.DictReader([record for record, offset in chunk], fieldnames=header)), chunk[-1][1]
+
+
+def read_file(user, file_path, chunk_size=None, sponsors=None, job=None):
+    """
+    Load the funding CSV ``file_path`` in chunks of ``chunk_size`` rows
+    (default: settings.FUNDING_CHUNK_SIZE), each one in its own transaction.
+    The sponsors are resolved by ``sponsors`` (default: a new SponsorIndex).
+
+    A chunk which fails is recorded as a ProcessingError and the load goes
+    on with the next one.
+
+    With ``job``, a FundingImport of the file, the load starts at the offset
+    of the job, and the job is checkpointed in the transaction of each
+    chunk, so a load interrupted at any point is resumed after the last
+    chunk committed.
+
+    Return the counts of rows read and failed and of fundings added to the
+    articles, with the throughput in rows per second.
+    """
+    chunk_size = chunk_size or settings.FUNDING_CHUNK_SIZE
+    sponsors = sponsors or SponsorIndex()
+    summary = dict(rows=0, failed=0, links=0, rows_per_second=0)
+    if job:
+        summary.update(rows=job.rows, failed=job.failed, links=job.links)
+    first_row = summary['rows']
+    started = time.monotonic()
+
+    def get_summary(rows, failed=0, links=0):
+        rows = summary['rows'] + rows
+        return dict(
+            rows=rows,
+            failed=summary['failed'] + failed,
+            links=summary['links'] + links,
+            rows_per_second=round((rows - first_row) / max(time.monotonic() - started, 1e-6), 2),
         )
-        article_findings.append(ArticleFunding.get_or_create(award_id=row.get('award_id'), funding_source=sponsor, user=user))
-    article = Article.get_or_create(pid_v2=row.get('pid_v2'), fundings=article_findings, user=user)
 
-    return article
+    for rows, offset in iter_chunks(file_path, chunk_size, job and job.offset):
+        try:
+            with sponsors.atomic():
+                chunk = get_summary(len(rows), links=load_financial_chunk(rows, user, sponsors))
+                if job:
+                    job.checkpoint(offset, chunk)
+        except Exception as e:
+            logging.exception(e)
+            chunk = get_summary(len(rows), failed=len(rows))
+            error = ProcessingError()
+            error.item = f"Rows {summary['rows'] + 1} to {chunk['rows']} of {file_path}"
+            error.step = "Funding data loading error"
+            error.description = str(e)[:509]
+            error.type = str(type(e))
+            error.save()
+            if job:
+                job.checkpoint(offset, chunk)
+        summary = chunk
+        logging.info("Funding data of %s: %s", file_path, summary)
+    return summary
+
+
+def start_import(user, file_path, resume=True, partitions=None):
+    """
+    Return the FundingImport of ``file_path``, in ``partitions`` buckets if
+    any, resumed from the last import not finished of the same content and
+    mode, with ``resume``, or else a new one.
+    """
+    return FundingImport.start(
+        file_path, get_checksum(file_path), os.path.getsize(file_path), user, resume, partitions)
+
+
+def import_file(user, file_path, chunk_size=None, resume=True):
+    """
+    Load the funding CSV ``file_path`` with read_file, tracked by a
+    FundingImport, which is resumed with ``resume`` (see start_import).
+    """
+    job = start_import(user, file_path, resume)
+    try:
+        summary = read_file(user, file_path, chunk_size, job=job)
+    except BaseException:
+        job.interrupt()
+        raise
+    job.finish()
+    return summary
+
+
+def sum_summaries(summaries):
+    summary = dict(rows=0, failed=0, links=0)
+    for item in summaries:
+        for key in summary:
+            summary[key] += item[key]
+    return summary
+
+
+def read_header(file_path):
+    with open(file_path, 'r', newline='') as csvfile:
+        return next(csv.reader(csvfile))
+
+
+def split_file(file_path, partitions):
+    """
+    Return the byte ranges (start, end) of the rows of the CSV ``file_path``
+    split in ``partitions`` parts of about the same size.
+
+    Each range starts at the beginning of a record: the boundaries are found
+    by the scan of iter_records, so a quoted value with line breaks is never
+    split between two ranges.
+    """
+    size = os.path.getsize(file_path)
+    with open(file_path, 'rb') as fp:
+        next(iter_records(fp))
+        offsets = [fp.tell()]
+        positions = [offsets[0] + (size - offsets[0]) * i // partitions for i in range(1, partitions)]
+        for record, offset in iter_records(fp):
+            if not positions:
+                break
+            if offset >= positions[0]:
+                offsets.append(offset)
+                positions = [position for position in positions if position > offset]
+    offsets.append(size)
+    return [(start, end) for start, end in zip(offsets, offsets[1:]) if start < end]
+
+
+def iter_range(file_path, start, end):
+    """
+    Yield the rows, as dicts, of the byte range of the CSV ``file_path``.
+    """
+    header = read_header(file_path)
+    with open(file_path, 'rb') as fp:
+        fp.seek(start)
+        yield from csv.DictReader((record for record, offset in iter_records(fp, end)), fieldnames=header)
+
+
+def get_bucket(pid_v2, buckets):
+    # crc32, unlike hash(), is the same in every process
+    return zlib.crc32((pid_v2 or '').encode('utf-8')) % buckets
+
+
+def get_bucket_paths(work_dir, bucket):
+    return sorted(glob.glob(os.path.join(work_dir, '%04d' % bucket, '*.csv')))
+
+
+def make_work_dir(file_path):
+    """
+    Return a new directory for the partitions of ``file_path``, in
+    settings.FUNDING_WORK_DIR or else next to the file, so it is shared by
+    the workers which can read the file.
+    """
+    return tempfile.mkdtemp(
+        prefix=f"{os.path.basename(file_path)}.",
+        dir=settings.FUNDING_WORK_DIR or os.path.dirname(os.path.abspath(file_path)),
+    )
+
+
+def partition_range(file_path, work_dir, buckets, index, start, end):
+    """
+    Route the rows of a byte range of ``file_path`` to ``buckets`` files by
+    a hash of pid_v2, so all the rows of an article are loaded by the same
+    worker. The rows of bucket B are written in ``work_dir/B/index.csv``.
+
+    Return the list of the funding sources of the rows.
+    """
+    header = read_header(file_path)
+    writers = {}
+    files = []
+    names = set()
+    try:
+        for row in iter_range(file_path, start, end):
+            bucket = get_bucket(row.get('pid_v2'), buckets)
+            try:
+                writer = writers[bucket]
+            except KeyError:
+                path = os.path.join(work_dir, '%04d' % bucket, '%04d.csv' % index)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                csvfile = open(path, 'w', newline='')
+                files.append(csvfile)
+                writer = writers[bucket] = csv.DictWriter(csvfile, fieldnames=header)
+                writer.writeheader()
+            writer.writerow(row)
+            names.update(get_funding_sources(row))
+    finally:
+        for csvfile in files:
+            csvfile.close()
+    return sorted(names)
+
+
+def get_rows_size(file_path):
+    # the size of the rows, without the header
+    with open(file_path, 'rb') as fp:
+        fp.readline()
+        return os.path.getsize(file_path) - fp.tell()
+
+
+def load_bucket(user, work_dir, bucket, chunk_size=None, job=None):
+    """
+    Load the rows of ``bucket`` written by partition_range.
+
+    With ``job``, the partitioned FundingImport of the file, each part of
+    the bucket is recorded in the job when it is loaded, and the parts
+    loaded by a previous run of the job are skipped.
+    """
+    sponsors = SponsorIndex()
+    loaded = job.get_loaded_parts(bucket) if job else set()
+    summaries = []
+    for path in get_bucket_paths(work_dir, bucket):
+        part = int(os.path.splitext(os.path.basename(path))[0])
+        if part in loaded:
+            continue
+        summaries.append(read_file(user, path, chunk_size, sponsors))
+        if job:
+            job.add_part(bucket, part, summaries[-1], get_rows_size(path))
+    return sum_summaries(summaries)
+
 
+def export_data(file_path, queryset=None, chunk_size=1000):
+    """
+    Write the ``data`` of the articles of ``queryset`` (default: all) in
+    ``file_path``, one JSON object by line.
 
-def read_file(user, file_path):
-    with open(file_path, 'r') as csvfile:
-        data = csv.DictReader(csvfile)
-        for row in data:
-            logging.debug(row)
-            load_financial_data(row, user)
+    The articles are serialized by Article.iter_data, so the export is
+    streamed with a fixed number of queries by chunk. The file is replaced
+    only when the export is complete.
+    Return the number of articles written.
+    """
+    count = 0
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(file_path)))
+    try:
+        with os.fdopen(fd, 'w') as fp:
+            for data in Article.iter_data(queryset, chunk_size):
+                fp.write(json.dumps(data, ensure_ascii=False))
+                fp.write('\n')
+                count += 1
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    logging.info("Exported %s articles to %s", count, file_path)
+    return count
@@ -0,0 +1,45 @@
+# Generated by Django 4.1.6 on 2026-10-18 04:52
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def merge_duplicated_fundings(apps, schema_editor):
+    """
+    Keep only the oldest funding of each (award_id, funding_source), so the
+    unique constraint can be added. The articles of the removed ones are
+    linked to the kept one.
+    """
+    ArticleFunding = apps.get_model('article', 'ArticleFunding')
+    through = apps.get_model('article', 'Article').fundings.through
+
+    duplicated = (
+        ArticleFunding.objects.filter(award_id__isnull=False, funding_source__isnull=False)
+        .values('award_id', 'funding_source').annotate(total=Count('id'), keep=Min('id')).filter(total__gt=1)
+    )
+    for item in duplicated.iterator():
+        removed = ArticleFunding.objects.filter(
+            award_id=item['award_id'], funding_source=item['funding_source']).exclude(id=item['keep'])
+        article_ids = set(through.objects.filter(articlefunding__in=removed).values_list('article_id', flat=True))
+        through.objects.bulk_create(
+            [through(article_id=article_id, articlefunding_id=item['keep']) for article_id in article_ids],
+            ignore_conflicts=True,
+        )
+        removed.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('article', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicated_fundings, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='articlefunding',
+            constraint=models.UniqueConstraint(fields=('award_id', 'funding_source'), name='article_articlefunding_unique_award_id_funding_source'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.1.6 on 2026-10-18 05:13
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('article', '0002_unique_articlefunding'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FundingImport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Creation date')),
+                ('updated', models.DateTimeField(auto_now=True, verbose_name='Last update date')),
+                ('file_path', models.CharField(max_length=1024, verbose_name='File path')),
+                ('checksum', models.CharField(db_index=True, max_length=64, verbose_name='Checksum')),
+                ('size', models.BigIntegerField(default=0, verbose_name='Size')),
+                ('offset', models.BigIntegerField(default=0, verbose_name='Offset')),
+                ('rows', models.BigIntegerField(default=0, verbose_name='Rows')),
+                ('failed', models.BigIntegerField(default=0, verbose_name='Failed rows')),
+                ('links', models.BigIntegerField(default=0, verbose_name='Links')),
+                ('rows_per_second', models.FloatField(default=0, verbose_name='Rows per second')),
+                ('status', models.CharField(choices=[('running', 'Running'), ('interrupted', 'Interrupted'), ('finished', 'Finished')], default='running', max_length=16, verbose_name='Status')),
+                ('started', models.DateTimeField(blank=True, null=True, verbose_name='Started')),
+                ('finished', models.DateTimeField(blank=True, null=True, verbose_name='Finished')),
+                ('creator', models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='%(class)s_creator', to=settings.AUTH_USER_MODEL, verbose_name='Creator')),
+                ('updated_by', models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='%(class)s_last_mod_user', to=settings.AUTH_USER_MODEL, verbose_name='Updater')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
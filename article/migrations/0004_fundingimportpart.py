@@ -0,0 +1,42 @@
+# Generated by Django 4.1.6 on 2026-10-18 05:38
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('article', '0003_fundingimport'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fundingimport',
+            name='partitions',
+            field=models.PositiveSmallIntegerField(blank=True, null=True, verbose_name='Partitions'),
+        ),
+        migrations.AddField(
+            model_name='fundingimport',
+            name='processed',
+            field=models.BigIntegerField(default=0, verbose_name='Processed bytes'),
+        ),
+        migrations.CreateModel(
+            name='FundingImportPart',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.PositiveSmallIntegerField(verbose_name='Bucket')),
+                ('part', models.PositiveSmallIntegerField(verbose_name='Part')),
+                ('rows', models.BigIntegerField(default=0, verbose_name='Rows')),
+                ('failed', models.BigIntegerField(default=0, verbose_name='Failed rows')),
+                ('links', models.BigIntegerField(default=0, verbose_name='Links')),
+                ('processed', models.BigIntegerField(default=0, verbose_name='Processed bytes')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Creation date')),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='parts', to='article.fundingimport')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='fundingimportpart',
+            constraint=models.UniqueConstraint(fields=('job', 'bucket', 'part'), name='article_fundingimportpart_unique_part'),
+        ),
+    ]
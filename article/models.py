@@ -1,4 +1,6 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, Prefetch, Q
+from django.utils import timezone
 from django.utils.translation import gettext as _
 
 from wagtail.admin.edit_handlers import FieldPanel
@@ -6,7 +8,7 @@ from wagtail.core.fields import RichTextField
 
 from core.models import CommonControlField, RichTextWithLang, FlexibleDate
 from core.forms import CoreAdminModelForm
-from core.choices import LANGUAGE
+from core.choices import HARVEST_STATUS, LANGUAGE
 
 from institution.models import Sponsor
 
@@ -30,11 +32,35 @@ class Article(CommonControlField):
     def data(self):
         _data = {
             'article__pid_v2': self.pid_v2,
-            'article__fundings': [f.data for f in self.fundings.iterator()],
+            'article__fundings': [f.data for f in self.fundings.all()],
         }
 
         return _data
 
+    @classmethod
+    def iter_data(cls, queryset=None, chunk_size=1000):
+        """
+        Yield the ``data`` of the articles of ``queryset`` (default: all),
+        in chunks of ``chunk_size`` articles ordered by id.
+
+        The fundings, their sponsors and the chains of ``official`` of the
+        sponsors of each chunk are loaded together, so the number of queries
+        by chunk does not depend on the number of articles.
+        """
+        queryset = (cls.objects.all() if queryset is None else queryset).order_by('id').prefetch_related(
+            Prefetch('fundings', queryset=ArticleFunding.objects.select_related('funding_source').order_by('id')))
+        last_id = None
+        while True:
+            chunk = queryset if last_id is None else queryset.filter(id__gt=last_id)
+            articles = list(chunk[:chunk_size])
+            if not articles:
+                break
+            Sponsor.load_official(
+                funding.funding_source for article in articles for funding in article.fundings.all())
+            for article in articles:
+                yield article.data
+            last_id = articles[-1].id
+
     @classmethod
     def get_or_create(cls, pid_v2, fundings, user):
         try:
@@ -50,9 +76,215 @@ class Article(CommonControlField):
 
             return article
 
+    @classmethod
+    def bulk_get_or_create(cls, pids, user):
+        """
+        Get or create the articles ``pids`` with one query and one insert,
+        whatever the number of pids.
+
+        Return a dict {pid_v2: article id}
+        """
+        pids = set(pids)
+        articles = {}
+        for article_id, pid_v2 in cls.objects.filter(pid_v2__in=pids).order_by('id').values_list('id', 'pid_v2'):
+            articles.setdefault(pid_v2, article_id)
+        missing = [cls(pid_v2=pid_v2, creator=user) for pid_v2 in pids if pid_v2 not in articles]
+        if missing:
+            cls.objects.bulk_create(missing)
+            articles.update({article.pid_v2: article.id for article in missing})
+        return articles
+
+    @classmethod
+    def bulk_add_fundings(cls, links):
+        """
+        Add the fundings to the articles with one query and one insert.
+
+        Param links: iterable of tuples (article id, article funding id)
+        Return the number of links added
+        """
+        links = set(links)
+        through = cls.fundings.through
+        existing = set(
+            through.objects.filter(article_id__in={article_id for article_id, funding_id in links}).values_list(
+                'article_id', 'articlefunding_id'))
+        missing = [
+            through(article_id=article_id, articlefunding_id=funding_id)
+            for article_id, funding_id in links - existing
+        ]
+        if missing:
+            through.objects.bulk_create(missing, ignore_conflicts=True)
+        return len(missing)
+
     base_form_class = CoreAdminModelForm
 
 
+class FundingImport(CommonControlField):
+    """
+    Progress of the import of a funding CSV, so an interrupted import can be
+    resumed.
+
+    Fields:
+        file_path: Path of the CSV
+        checksum: SHA-256 of the CSV, to resume only the import of the same file
+        size: Size of the CSV in bytes
+        partitions: Number of buckets of a partitioned import, empty in a
+            serial import
+        offset: Byte offset of the CSV after the last chunk committed, in a
+            serial import
+        processed: Bytes of the bucket parts loaded, in a partitioned import
+        rows, failed, links: Rows read, rows of failed chunks and fundings
+            added to the articles
+        rows_per_second: Throughput of the last run of the import
+        status: running, interrupted or finished
+        started: Date time when the last run of the import started
+        finished: Date time when the import was finished
+    """
+
+    file_path = models.CharField(_("File path"), max_length=1024)
+    checksum = models.CharField(_("Checksum"), max_length=64, db_index=True)
+    size = models.BigIntegerField(_("Size"), default=0)
+    partitions = models.PositiveSmallIntegerField(_("Partitions"), null=True, blank=True)
+    offset = models.BigIntegerField(_("Offset"), default=0)
+    processed = models.BigIntegerField(_("Processed bytes"), default=0)
+    rows = models.BigIntegerField(_("Rows"), default=0)
+    failed = models.BigIntegerField(_("Failed rows"), default=0)
+    links = models.BigIntegerField(_("Links"), default=0)
+    rows_per_second = models.FloatField(_("Rows per second"), default=0)
+    status = models.CharField(_("Status"), max_length=16, choices=HARVEST_STATUS, default='running')
+    started = models.DateTimeField(_("Started"), null=True, blank=True)
+    finished = models.DateTimeField(_("Finished"), null=True, blank=True)
+
+    panels = [
+        FieldPanel('file_path'),
+        FieldPanel('checksum'),
+        FieldPanel('size'),
+        FieldPanel('partitions'),
+        FieldPanel('offset'),
+        FieldPanel('processed'),
+        FieldPanel('rows'),
+        FieldPanel('failed'),
+        FieldPanel('links'),
+        FieldPanel('rows_per_second'),
+        FieldPanel('status'),
+        FieldPanel('started'),
+        FieldPanel('finished'),
+    ]
+
+    def __str__(self):
+        return u'%s %s (%s)' % (self.file_path, self.created, self.status)
+
+    def progress(self):
+        if not self.size:
+            return '-'
+        # the parts are written again by partition_range, so their size is about the size of the CSV
+        done = self.processed if self.partitions else self.offset
+        return '%.1f%%' % min(100, 100 * done / self.size)
+
+    progress.short_description = _("Progress")
+
+    @classmethod
+    def start(cls, file_path, checksum, size, user, resume=True, partitions=None):
+        """
+        Return a new import of ``file_path``, or with ``resume``, the last
+        import not finished of a file with the same ``checksum``, if any.
+
+        A serial import only resumes a serial import, and a partitioned one
+        only resumes an import in the same number of ``partitions``, whose
+        bucket parts are the same (see FundingImportPart).
+        """
+        job = None
+        if resume:
+            job = cls.objects.filter(checksum=checksum, partitions=partitions).exclude(
+                status='finished').order_by('-id').first()
+        if job:
+            job.file_path = file_path
+            job.status = 'running'
+            job.updated_by = user
+        else:
+            job = cls(file_path=file_path, checksum=checksum, size=size, partitions=partitions, creator=user)
+        job.started = timezone.now()
+        job.save()
+        return job
+
+    def checkpoint(self, offset, summary):
+        """
+        Save the offset and the counts of a serial import. It must be called
+        in the transaction of the chunk which ends at ``offset``.
+        """
+        self.offset = offset
+        self.rows = summary['rows']
+        self.failed = summary['failed']
+        self.links = summary['links']
+        self.rows_per_second = summary['rows_per_second']
+        self.save(update_fields=['offset', 'rows', 'failed', 'links', 'rows_per_second', 'updated'])
+
+    def get_loaded_parts(self, bucket):
+        """
+        Return the indexes of the parts of ``bucket`` already loaded by a
+        partitioned import.
+        """
+        return set(self.parts.filter(bucket=bucket).values_list('part', flat=True))
+
+    def add_part(self, bucket, part, summary, processed):
+        """
+        Record the part ``part`` of ``bucket`` of a partitioned import as
+        loaded, with its counts and its size in bytes, and add them to the
+        counts of the import.
+        """
+        with transaction.atomic():
+            FundingImportPart.objects.create(
+                job=self, bucket=bucket, part=part, processed=processed,
+                rows=summary['rows'], failed=summary['failed'], links=summary['links'])
+            type(self).objects.filter(pk=self.pk).update(
+                processed=F('processed') + processed,
+                rows=F('rows') + summary['rows'],
+                failed=F('failed') + summary['failed'],
+                links=F('links') + summary['links'],
+                updated=timezone.now(),
+            )
+
+    def finish(self, rows_per_second=None):
+        self.refresh_from_db()
+        if not self.partitions:
+            self.offset = self.size
+        if rows_per_second is not None:
+            self.rows_per_second = rows_per_second
+        self.status = 'finished'
+        self.finished = timezone.now()
+        self.save(update_fields=['offset', 'rows_per_second', 'status', 'finished', 'updated'])
+
+    def interrupt(self):
+        self.status = 'interrupted'
+        self.save(update_fields=['status', 'updated'])
+
+
+class FundingImportPart(models.Model):
+    """
+    Part of a bucket loaded by a partitioned FundingImport, so a resumed
+    import loads only the parts not loaded yet.
+
+    The part ``part`` of the bucket ``bucket`` has the rows of the byte range
+    ``part`` of the CSV routed to that bucket (see
+    article.controller.partition_range).
+    """
+    job = models.ForeignKey(FundingImport, related_name='parts', on_delete=models.CASCADE)
+    bucket = models.PositiveSmallIntegerField(_("Bucket"))
+    part = models.PositiveSmallIntegerField(_("Part"))
+    rows = models.BigIntegerField(_("Rows"), default=0)
+    failed = models.BigIntegerField(_("Failed rows"), default=0)
+    links = models.BigIntegerField(_("Links"), default=0)
+    processed = models.BigIntegerField(_("Processed bytes"), default=0)
+    created = models.DateTimeField(_("Creation date"), auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['job', 'bucket', 'part'], name='article_fundingimportpart_unique_part'),
+        ]
+
+    def __str__(self):
+        return u'%s %s/%s' % (self.job_id, self.bucket, self.part)
+
+
 class ArticleFunding(CommonControlField):
     award_id = models.CharField(_("Award ID"), blank=True, null=True, max_length=50)
     funding_source = models.ForeignKey(Sponsor, null=True, blank=True, on_delete=models.SET_NULL)
@@ -62,6 +294,10 @@ class ArticleFunding(CommonControlField):
             models.Index(fields=['award_id', ]),
             models.Index(fields=['funding_source', ]),
         ]
+        constraints = [
+            models.UniqueConstraint(fields=['award_id', 'funding_source', ],
+                                    name='article_articlefunding_unique_award_id_funding_source'),
+        ]
 
     panels = [
         FieldPanel('award_id'),
@@ -97,6 +333,43 @@ class ArticleFunding(CommonControlField):
 
             return article_funding
 
+    @classmethod
+    def bulk_get_or_create(cls, keys, user):
+        """
+        Get or create the article fundings ``keys`` with one query and one
+        insert, whatever the number of keys.
+
+        Param keys: iterable of tuples (award_id, sponsor id)
+        Return a dict {(award_id, sponsor id): article funding id}
+        """
+        keys = set(keys)
+
+        def load(keys):
+            awards = {award_id for award_id, sponsor_id in keys}
+            query = Q(award_id__in=awards - {None})
+            if None in awards:
+                query |= Q(award_id__isnull=True)
+            fundings = {}
+            for funding_id, award_id, sponsor_id in cls.objects.filter(
+                    query, funding_source_id__in={sponsor_id for award_id, sponsor_id in keys}).order_by(
+                    'id').values_list('id', 'award_id', 'funding_source_id'):
+                if (award_id, sponsor_id) in keys:
+                    fundings.setdefault((award_id, sponsor_id), funding_id)
+            return fundings
+
+        fundings = load(keys)
+        # sorted, so concurrent imports lock the keys in the same order and do not deadlock
+        missing = [
+            cls(award_id=award_id, funding_source_id=sponsor_id, creator=user)
+            for award_id, sponsor_id in sorted(keys, key=lambda key: (key[0] or '', key[1]))
+            if (award_id, sponsor_id) not in fundings
+        ]
+        if missing:
+            # a concurrent import may have inserted some of them meanwhile
+            cls.objects.bulk_create(missing, ignore_conflicts=True)
+            fundings.update(load({(item.award_id, item.funding_source_id) for item in missing}))
+        return fundings
+
     base_form_class = CoreAdminModelForm
 
 
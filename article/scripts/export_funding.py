@@ -0,0 +1,10 @@
+from article import controller
+
+
+def run(file_path, chunk_size=None):
+    """
+    Usage: python manage.py runscript export_funding --script-args FILE_PATH [CHUNK_SIZE]
+
+    Write the fundings of all the articles in FILE_PATH as JSON lines.
+    """
+    controller.export_data(file_path, chunk_size=int(chunk_size or 1000))
@@ -1,7 +1,16 @@
-from article import tasks, controller
+from article import tasks
 
 
-def run(user, file_path):
-    #tasks.load_funding_data.apply_async(args=(user, file_path))
-    controller.read_file(user, file_path)
+def run(user, file_path, partitions=None, resume='yes'):
+    """
+    Usage: python manage.py runscript load_financial --script-args USER_ID FILE_PATH [PARTITIONS] [RESUME]
 
+    Enqueue the import of FILE_PATH, whose progress is shown in the admin
+    (Funding imports). With PARTITIONS, the file is loaded by that many
+    parallel tasks. With RESUME "no", a new import is started even if an
+    import of the same file was interrupted.
+    """
+    tasks.load_funding_data.apply_async(
+        args=(int(user), file_path),
+        kwargs=dict(partitions=int(partitions or 0) or None, resume=resume != 'no'),
+    )
@@ -1,15 +1,89 @@
+import logging
+import shutil
+import time
+
+from celery import chord
 from django.contrib.auth import get_user_model
 
 from config import celery_app
 
+from institution.resolver import SponsorIndex
+
 from . import controller
+from .models import FundingImport
 
 
 User = get_user_model()
 
 
 @celery_app.task()
-def load_funding_data(user, file_path):
+def load_funding_data(user, file_path, partitions=None, chunk_size=None, resume=True):
+    """
+    Load the funding CSV ``file_path``, tracked by a FundingImport.
+
+    The import is resumed from the last chunk committed of the last import
+    not finished of the same file, unless ``resume`` is false.
+
+    With ``partitions``, the file is split in byte ranges read by parallel
+    tasks, which route the rows by pid_v2 to ``partitions`` buckets, each one
+    loaded by its own task (see controller.partition_range). The
+    partitions are written in settings.FUNDING_WORK_DIR, which must be
+    shared by the workers. A parallel import is resumed by bucket part: the
+    file is partitioned again, in the same parts, since the split and the
+    routing only depend on the file and ``partitions``, and only the parts
+    not loaded yet are loaded.
+    """
     user = User.objects.get(pk=user)
 
-    controller.read_file(user, file_path)
+    if not partitions:
+        return controller.import_file(user, file_path, chunk_size, resume)
+
+    started = time.time()
+    job = controller.start_import(user, file_path, resume, partitions)
+    work_dir = controller.make_work_dir(file_path)
+    chord(
+        partition_funding_range.s(file_path, work_dir, partitions, index, start, end)
+        for index, (start, end) in enumerate(controller.split_file(file_path, partitions))
+    )(load_funding_buckets.s(user.id, file_path, work_dir, partitions, chunk_size, started, job.id))
+
+
+@celery_app.task()
+def partition_funding_range(file_path, work_dir, buckets, index, start, end):
+    return controller.partition_range(file_path, work_dir, buckets, index, start, end)
+
+
+@celery_app.task()
+def load_funding_buckets(names, user_id, file_path, work_dir, buckets, chunk_size, started, job_id):
+    user = User.objects.get(pk=user_id)
+
+    # one task creates the sponsors, so the bucket tasks never race to insert them
+    SponsorIndex().get_ids({name for items in names for name in items}, user)
+
+    chord(
+        load_funding_bucket.s(user_id, work_dir, bucket, chunk_size, job_id) for bucket in range(buckets)
+    )(summarize_funding_import.s(file_path, work_dir, started, job_id))
+
+
+@celery_app.task()
+def load_funding_bucket(user_id, work_dir, bucket, chunk_size=None, job_id=None):
+    user = User.objects.get(pk=user_id)
+    job = job_id and FundingImport.objects.get(pk=job_id)
+
+    try:
+        return controller.load_bucket(user, work_dir, bucket, chunk_size, job)
+    except BaseException:
+        if job:
+            job.interrupt()
+        raise
+
+
+@celery_app.task()
+def summarize_funding_import(summaries, file_path, work_dir, started, job_id=None):
+    shutil.rmtree(work_dir, ignore_errors=True)
+    summary = controller.sum_summaries(summaries)
+    summary['rows_per_second'] = round(summary['rows'] / max(time.time() - started, 1e-6), 2)
+    if job_id:
+        FundingImport.objects.get(pk=job_id).finish(summary['rows_per_second'])
+
+    logging.info("Funding data of %s: %s", file_path, summary)
+    return summary
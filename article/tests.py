@@ -1,3 +1,273 @@
-from django.test import TestCase
+import csv
+import json
 
-# Create your tests here.
+import pytest
+
+from article import controller, tasks
+from article.models import Article, ArticleFunding, FundingImport
+from config import celery_app
+from core.users.tests.factories import UserFactory
+from institution.models import Institution, Sponsor
+from processing_errors.models import ProcessingError
+
+pytestmark = pytest.mark.django_db
+
+HEADER = ["pid_v2", "award_id", "funding_source"]
+
+
+def write_csv(path, rows):
+    with open(path, "w", newline="") as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(HEADER)
+        writer.writerows(rows)
+    return str(path)
+
+
+def read_csv(path):
+    with open(path, newline="") as csvfile:
+        return list(csv.DictReader(csvfile))
+
+
+def test_split_file_does_not_split_a_quoted_value_with_line_breaks(tmp_path):
+    rows = [[f"S0000-000020230001{n:05d}", f"award {n}", "Sponsor"] for n in range(20)]
+    # the middle of the rows is inside the quoted value
+    rows[10][2] = "x" * 200 + "\nSponsor with\na name in several lines"
+    file_path = write_csv(tmp_path / "funding.csv", rows)
+
+    ranges = controller.split_file(file_path, 2)
+
+    assert len(ranges) == 2
+    assert [row for start, end in ranges for row in controller.iter_range(file_path, start, end)] == read_csv(
+        file_path)
+
+
+@pytest.fixture
+def user():
+    return UserFactory()
+
+
+def get_fundings():
+    return sorted(
+        (article.pid_v2, funding.award_id, funding.funding_source.name)
+        for article in Article.objects.prefetch_related("fundings__funding_source")
+        for funding in article.fundings.all()
+    )
+
+
+def test_iter_records_joins_the_lines_of_a_quoted_value(tmp_path):
+    path = tmp_path / "funding.csv"
+    path.write_bytes(b'pid_v2,award_id,funding_source\nA,1,"One\nTwo, ""Three""\n"\nB,2,Four\n')
+
+    with open(path, "rb") as fp:
+        records = list(controller.iter_records(fp))
+
+    assert [record for record, offset in records] == [
+        "pid_v2,award_id,funding_source\n", 'A,1,"One\nTwo, ""Three""\n"\n', "B,2,Four\n"]
+    assert records[-1][1] == path.stat().st_size
+    assert list(csv.reader(record for record, offset in records))[1] == ["A", "1", 'One\nTwo, "Three"\n']
+
+
+def test_read_file_loads_the_rows_in_chunks(user, tmp_path):
+    file_path = write_csv(tmp_path / "funding.csv", [
+        ["S1", "a1", "CNPq,FAPESP"],
+        ["S1", "a2", "CNPq"],
+        ["S2", "a1", "CNPq"],
+        ["S3", "a3", "Capes"],
+        ["S3", "a3", "Capes"],
+    ])
+
+    summary = controller.read_file(user, file_path, chunk_size=2)
+
+    assert {key: summary[key] for key in ("rows", "failed", "links")} == dict(rows=5, failed=0, links=5)
+    assert get_fundings() == [
+        ("S1", "a1", "CNPq"), ("S1", "a1", "FAPESP"), ("S1", "a2", "CNPq"), ("S2", "a1", "CNPq"),
+        ("S3", "a3", "Capes"),
+    ]
+    assert Sponsor.objects.count() == 3
+    assert ArticleFunding.objects.count() == 4
+
+    summary = controller.read_file(user, file_path, chunk_size=2)
+    assert summary["links"] == 0
+    assert (Article.objects.count(), ArticleFunding.objects.count(), Sponsor.objects.count()) == (3, 4, 3)
+
+
+def test_read_file_records_a_failed_chunk_and_goes_on(user, tmp_path, monkeypatch):
+    file_path = write_csv(tmp_path / "funding.csv", [["S1", "a1", "CNPq"], ["S2", "a2", "CNPq"]])
+    load_financial_chunk = controller.load_financial_chunk
+
+    def fail_the_first_chunk(rows, user, sponsors):
+        if rows[0]["pid_v2"] == "S1":
+            raise ValueError("failed chunk")
+        return load_financial_chunk(rows, user, sponsors)
+
+    monkeypatch.setattr(controller, "load_financial_chunk", fail_the_first_chunk)
+    summary = controller.read_file(user, file_path, chunk_size=1)
+
+    assert {key: summary[key] for key in ("rows", "failed", "links")} == dict(rows=2, failed=1, links=1)
+    assert get_fundings() == [("S2", "a2", "CNPq")]
+    assert ProcessingError.objects.filter(step="Funding data loading error").count() == 1
+
+
+def test_article_funding_bulk_get_or_create_returns_the_existing_fundings(user):
+    sponsor = Sponsor.objects.create(name="CNPq")
+    other = Sponsor.objects.create(name="FAPESP")
+    existing = ArticleFunding.objects.create(award_id="a1", funding_source=sponsor)
+    # the same award of another sponsor is another funding
+    ArticleFunding.objects.create(award_id="a2", funding_source=other)
+
+    fundings = ArticleFunding.bulk_get_or_create(
+        [("a1", sponsor.id), ("a2", sponsor.id), (None, sponsor.id), ("a1", sponsor.id)], user)
+
+    assert fundings[("a1", sponsor.id)] == existing.id
+    assert set(fundings) == {("a1", sponsor.id), ("a2", sponsor.id), (None, sponsor.id)}
+    assert ArticleFunding.objects.count() == 4
+    assert ArticleFunding.bulk_get_or_create([("a2", sponsor.id), (None, sponsor.id)], user) == {
+        key: fundings[key] for key in (("a2", sponsor.id), (None, sponsor.id))}
+    assert ArticleFunding.objects.count() == 4
+
+
+def get_funding_rows(count=60):
+    # the same sponsors are in the rows of every bucket
+    return [[f"S{n // 2:05d}", f"a{n % 7}", f"Sponsor {n % 5},Sponsor {(n + 1) % 5}"] for n in range(count)]
+
+
+def test_partition_range_routes_the_rows_of_an_article_to_one_bucket(tmp_path):
+    file_path = write_csv(tmp_path / "funding.csv", get_funding_rows())
+    work_dir = tmp_path / "work"
+
+    names = set()
+    for index, (start, end) in enumerate(controller.split_file(file_path, 3)):
+        names.update(controller.partition_range(file_path, str(work_dir), 4, index, start, end))
+
+    assert names == {f"Sponsor {n}" for n in range(5)}
+    routed = []
+    for bucket in range(4):
+        for path in controller.get_bucket_paths(str(work_dir), bucket):
+            for row in read_csv(path):
+                assert controller.get_bucket(row["pid_v2"], 4) == bucket
+                routed.append(row)
+    assert sorted(routed, key=lambda row: list(row.values())) == sorted(
+        read_csv(file_path), key=lambda row: list(row.values()))
+
+
+def test_a_partitioned_import_creates_each_sponsor_once(user, tmp_path, settings, monkeypatch):
+    monkeypatch.setattr(celery_app.conf, "task_always_eager", True)
+    settings.FUNDING_WORK_DIR = str(tmp_path)
+    file_path = write_csv(tmp_path / "funding.csv", get_funding_rows())
+    bulk_create_by_names = Sponsor.bulk_create_by_names
+    created = []
+
+    def create(names, user):
+        created.append(sorted(names))
+        return bulk_create_by_names(names, user)
+
+    monkeypatch.setattr(Sponsor, "bulk_create_by_names", create)
+    tasks.load_funding_data(user.id, file_path, partitions=3, chunk_size=4)
+
+    # the sponsors are created before the buckets are loaded in parallel
+    assert created == [[f"Sponsor {n}" for n in range(5)]]
+    assert Sponsor.objects.count() == 5
+    partitioned = get_fundings()
+    job = FundingImport.objects.get()
+    assert (job.status, job.rows, job.failed) == ("finished", 60, 0)
+
+    Article.objects.all().delete()
+    ArticleFunding.objects.all().delete()
+    controller.read_file(user, file_path)
+    assert get_fundings() == partitioned
+
+
+def create_articles(count):
+    official = Institution.objects.create(name="Ministry")
+    sponsor = Sponsor.objects.create(name="CNPq", official=Institution.objects.create(name="Agency", official=official))
+    for n in range(count):
+        article = Article.objects.create(pid_v2=f"S{n:05d}")
+        article.fundings.add(
+            ArticleFunding.objects.create(award_id=f"a{n}", funding_source=sponsor),
+            ArticleFunding.objects.create(award_id=f"b{n}", funding_source=Sponsor.objects.create(name=f"S{n}")),
+        )
+
+
+def test_iter_data_returns_the_data_of_the_articles_with_a_fixed_number_of_queries(django_assert_max_num_queries):
+    create_articles(6)
+    expected = [article.data for article in Article.objects.order_by("id")]
+
+    with django_assert_max_num_queries(12):
+        assert list(Article.iter_data(chunk_size=4)) == expected
+
+
+def test_export_data_writes_one_article_by_line(tmp_path):
+    create_articles(3)
+    file_path = tmp_path / "articles.jsonl"
+
+    assert controller.export_data(str(file_path), Article.objects.filter(pid_v2__lt="S00002")) == 2
+    assert [json.loads(line) for line in file_path.read_text().splitlines()] == [
+        article.data for article in Article.objects.filter(pid_v2__lt="S00002").order_by("id")]
+
+
+def interrupt_at(monkeypatch, chunk):
+    load_financial_chunk = controller.load_financial_chunk
+    loaded = []
+
+    def load(rows, user, sponsors):
+        loaded.append(rows)
+        if len(loaded) == chunk:
+            raise KeyboardInterrupt
+        return load_financial_chunk(rows, user, sponsors)
+
+    monkeypatch.setattr(controller, "load_financial_chunk", load)
+    return loaded
+
+
+def test_an_interrupted_import_is_resumed_after_the_last_chunk_committed(user, tmp_path, monkeypatch):
+    file_path = write_csv(tmp_path / "funding.csv", get_funding_rows())
+    loaded = interrupt_at(monkeypatch, 4)
+    with pytest.raises(KeyboardInterrupt):
+        controller.import_file(user, file_path, chunk_size=10)
+
+    job = FundingImport.objects.get()
+    assert (job.status, job.rows) == ("interrupted", 30)
+    assert 0 < job.offset < job.size
+
+    loaded.clear()
+    monkeypatch.undo()
+    summary = controller.import_file(user, file_path, chunk_size=10)
+
+    job.refresh_from_db()
+    assert (job.status, job.rows, job.offset, job.progress()) == ("finished", 60, job.size, "100.0%")
+    assert summary["rows"] == 60
+    partial = get_fundings()
+    Article.objects.all().delete()
+    controller.read_file(user, file_path)
+    assert get_fundings() == partial
+    assert not controller.import_file(user, file_path, resume=False)["failed"]
+    assert FundingImport.objects.count() == 2
+
+
+def test_an_interrupted_partitioned_import_loads_only_the_missing_parts(user, tmp_path, settings, monkeypatch):
+    monkeypatch.setattr(celery_app.conf, "task_always_eager", True)
+    settings.FUNDING_WORK_DIR = str(tmp_path)
+    file_path = write_csv(tmp_path / "funding.csv", get_funding_rows())
+    interrupt_at(monkeypatch, 5)
+    with pytest.raises(KeyboardInterrupt):
+        tasks.load_funding_data(user.id, file_path, partitions=3, chunk_size=4)
+
+    job = FundingImport.objects.get()
+    parts = set(job.parts.values_list("bucket", "part"))
+    assert job.status == "interrupted"
+    assert parts
+
+    # a serial import does not resume the partitioned one
+    monkeypatch.setattr(controller, "load_financial_chunk", lambda rows, user, sponsors: 0)
+    controller.import_file(user, file_path)
+    assert FundingImport.objects.count() == 2
+
+    monkeypatch.undo()
+    monkeypatch.setattr(celery_app.conf, "task_always_eager", True)
+    tasks.load_funding_data(user.id, file_path, partitions=3, chunk_size=4)
+
+    job.refresh_from_db()
+    # the rows of the parts loaded before the interruption are not counted again
+    assert (job.status, job.rows, job.failed) == ("finished", 60, 0)
+    assert parts < set(job.parts.values_list("bucket", "part"))
+    assert sum(job.parts.values_list("rows", flat=True)) == 60
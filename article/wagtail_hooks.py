@@ -4,7 +4,7 @@ from django.utils.translation import gettext as _
 from wagtail.contrib.modeladmin.views import CreateView
 from wagtail.contrib.modeladmin.options import ModelAdmin, modeladmin_register, ModelAdminGroup
 
-from article.models import Article, ArticleFunding
+from article.models import Article, ArticleFunding, FundingImport
 
 
 class ArticleCreateView(CreateView):
@@ -49,11 +49,25 @@ class ArticleFundingAdmin(ModelAdmin):
     search_fields = ('award_id', 'funding_source__name', 'funding_source__institution_type')
 
 
+class FundingImportAdmin(ModelAdmin):
+    model = FundingImport
+    inspect_view_enabled = True
+    menu_label = _('Funding imports')
+    menu_icon = 'folder'
+    menu_order = 300
+    add_to_settings_menu = False  # or True to add your model to the Settings sub-menu
+    exclude_from_explorer = False  # or True to exclude pages of this type from Wagtail's explorer view
+
+    list_display = ('file_path', 'status', 'progress', 'rows', 'failed', 'rows_per_second', 'started', 'updated')
+    list_filter = ('status', )
+    search_fields = ('file_path', 'checksum')
+
+
 class ArticleAdminGroup(ModelAdminGroup):
     menu_label = _('Articles')
     menu_icon = 'folder-open-inverse'  # change as required
     menu_order = 100  # will put in 3rd place (000 being 1st, 100 2nd)
-    items = (ArticleAdmin, ArticleFundingAdmin)
+    items = (ArticleAdmin, ArticleFundingAdmin, FundingImportAdmin)
 
 
 modeladmin_register(ArticleAdminGroup)
@@ -1,40 +1,145 @@
 from .models import Collection, CollectionName
 
 import json
-import requests
+import logging
+import os
+import tempfile
 
+from django.db import transaction
+from django.utils import timezone
 
-def load(user):
-    response = requests.get("https://articlemeta.scielo.org/api/v1/collection/identifiers/")
+from core.utils.harvest_client import get_client
 
+
+COLLECTIONS_URL = "https://articlemeta.scielo.org/api/v1/collection/identifiers/"
+
+# fields of Collection and the keys of the articlemeta payload
+FIELDS = {
+    'acron3': 'acron',
+    'acron2': 'acron2',
+    'code': 'code',
+    'domain': 'domain',
+    'status': 'status',
+    'has_analytics': 'has_analytics',
+    'type': 'type',
+    'is_active': 'is_active',
+}
+
+
+def get_collections_data(payload_file=None, offline=False, client=None):
+    """
+    Return the list of collections of articlemeta.
+
+    The payload is written in ``payload_file``, if any, and with ``offline``
+    it is read from there instead of articlemeta.
+    Raise ValueError if ``offline`` is given without ``payload_file``.
+    """
+    if offline and not payload_file:
+        raise ValueError("An offline collection sync needs the payload_file to read")
+    if offline:
+        with open(payload_file, 'rb') as fp:
+            return json.load(fp)
+
+    # the shared client applies the rate limit, the timeout and the circuit breaker of the site
+    response = (client or get_client()).get(COLLECTIONS_URL)
     collections_data = json.loads(response.text)
+    if payload_file:
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(payload_file)))
+        with os.fdopen(fd, 'w') as fp:
+            json.dump(collections_data, fp)
+        os.replace(tmp_path, payload_file)
+    return collections_data
+
+
+def sync(user, collections_data):
+    """
+    Record ``collections_data`` with a fixed number of queries.
 
+    All the collections and names are read at once and compared with the
+    payload, so only the new collections are inserted, only the changed
+    fields are updated and only the missing names and links are inserted.
+    Return the counts of created, updated and unchanged collections and of
+    created names and links.
+    """
+    summary = dict(created=0, updated=0, unchanged=0, names=0, links=0)
+    collections = {}
+    for collection in Collection.objects.order_by('id'):
+        collections.setdefault(collection.main_name, collection)
+    names = {}
+    for collection_name in CollectionName.objects.order_by('id'):
+        names.setdefault((collection_name.language, collection_name.text), collection_name)
+
+    new_collections = []
+    changed_collections = []
+    changed_fields = set()
+    new_names = {}
+    now = timezone.now()
     for collection_data in collections_data:
-        collection_object = Collection.objects.filter(main_name=collection_data.get('original_name'))
+        values = {field: collection_data.get(key) for field, key in FIELDS.items()}
+        main_name = collection_data.get('original_name')
         try:
-            collection_object = collection_object[0]
-        except IndexError:
-            collection_object = Collection()
-            collection_object.main_name = collection_data.get('original_name')
-        collection_object.acron3 = collection_data.get('acron')
-        collection_object.acron2 = collection_data.get('acron2')
-        collection_object.code = collection_data.get('code')
-        collection_object.domain = collection_data.get('domain')
-        collection_object.save()
-        names = collection_data.get('name')
-        for language in names:
-            collection_name = CollectionName.objects.filter(language=language, text=names.get(language))
-            try:
-                collection_name = collection_name[0]
-            except IndexError:
-                collection_name = CollectionName()
-                collection_name.text = names.get(language)
-                collection_name.language = language
-            collection_name.save()
-            collection_object.name.add(collection_name)
-        collection_object.status = collection_data.get('status')
-        collection_object.has_analytics = collection_data.get('has_analytics')
-        collection_object.type = collection_data.get('type')
-        collection_object.is_active = collection_data.get('is_active')
-        collection_object.creator = user
-        collection_object.save()
+            collection = collections[main_name]
+        except KeyError:
+            collection = collections[main_name] = Collection(main_name=main_name, creator=user, **values)
+            new_collections.append(collection)
+        else:
+            fields = [field for field, value in values.items() if getattr(collection, field) != value]
+            if collection.pk is None:
+                # repeated in the payload, the last values are kept
+                for field in fields:
+                    setattr(collection, field, values[field])
+            elif fields:
+                for field in fields:
+                    setattr(collection, field, values[field])
+                collection.updated_by = user
+                collection.updated = now
+                changed_fields.update(fields)
+                changed_collections.append(collection)
+            else:
+                summary['unchanged'] += 1
+
+        for language, text in (collection_data.get('name') or {}).items():
+            if (language, text) not in names:
+                names[(language, text)] = new_names[(language, text)] = CollectionName(language=language, text=text)
+
+    with transaction.atomic():
+        if new_collections:
+            Collection.objects.bulk_create(new_collections)
+        if changed_collections:
+            Collection.objects.bulk_update(
+                changed_collections, sorted(changed_fields) + ['updated_by', 'updated'])
+        if new_names:
+            CollectionName.objects.bulk_create(new_names.values())
+
+        through = Collection.name.through
+        collection_ids = [collections[item.get('original_name')].id for item in collections_data]
+        links = set(through.objects.filter(collection_id__in=collection_ids).values_list(
+            'collection_id', 'collectionname_id'))
+        new_links = {}
+        for collection_data in collections_data:
+            collection = collections[collection_data.get('original_name')]
+            for language, text in (collection_data.get('name') or {}).items():
+                link = (collection.id, names[(language, text)].id)
+                if link not in links:
+                    new_links[link] = through(collection_id=link[0], collectionname_id=link[1])
+        if new_links:
+            through.objects.bulk_create(new_links.values(), ignore_conflicts=True)
+
+    summary['created'] = len(new_collections)
+    summary['updated'] = len(changed_collections)
+    summary['names'] = len(new_names)
+    summary['links'] = len(new_links)
+    return summary
+
+
+def load(user, payload_file=None, offline=False):
+    """
+    Synchronize the collections with articlemeta.
+
+    With ``payload_file``, the payload of articlemeta is kept in that file,
+    and with ``offline``, the collections are synchronized from the file
+    with no network.
+    """
+    summary = sync(user, get_collections_data(payload_file, offline))
+    logging.info("Collection sync: %s", summary)
+    return summary
@@ -4,15 +4,23 @@ from django.utils.translation import gettext as _
 from config import celery_app
 
 from collection import controller
+from core.utils.rate_limit import CircuitOpenError
 
 
 User = get_user_model()
 
 
-@celery_app.task(name=_("Carga de metadados de coleções"))
-def task_load_collection(*args):
+@celery_app.task(bind=True, name=_("Carga de metadados de coleções"))
+def task_load_collection(self, *args, payload_file=None, offline=False):
+    """
+    Param payload_file: file where the articlemeta payload is kept
+    Param offline: synchronize from ``payload_file``, with no network
+    """
     user_id = args[0] if args else 1
 
     user = User.objects.get(id=user_id)
 
-    controller.load(user)
+    try:
+        controller.load(user, payload_file=payload_file, offline=offline)
+    except CircuitOpenError as e:
+        raise self.retry(exc=e, countdown=e.retry_after)
@@ -1,3 +1,91 @@
-from django.test import TestCase
+import json
 
-# Create your tests here.
+import pytest
+
+from collection import controller
+from collection.models import Collection, CollectionName
+from core.users.tests.factories import UserFactory
+
+pytestmark = pytest.mark.django_db
+
+PAYLOAD = [
+    {
+        "acron": "scl", "acron2": "br", "code": "scl", "domain": "www.scielo.br", "status": "certified",
+        "has_analytics": True, "type": "journals", "is_active": True, "original_name": "Brasil",
+        "name": {"en": "Brazil", "es": "Brasil", "pt": "Brasil"},
+    },
+    {
+        "acron": "arg", "acron2": "ar", "code": "arg", "domain": "www.scielo.org.ar", "status": "certified",
+        "has_analytics": True, "type": "journals", "is_active": True, "original_name": "Argentina",
+        "name": {"en": "Argentina", "es": "Argentina", "pt": "Argentina"},
+    },
+]
+
+
+class Response:
+
+    def __init__(self, text):
+        self.text = text
+
+
+class Client:
+
+    def __init__(self, payload):
+        self.payload = payload
+        self.urls = []
+
+    def get(self, url):
+        self.urls.append(url)
+        return Response(json.dumps(self.payload))
+
+
+@pytest.fixture
+def user():
+    return UserFactory()
+
+
+def get_collections():
+    return sorted(
+        (collection.main_name, collection.acron3, sorted(collection.name.values_list("language", "text")))
+        for collection in Collection.objects.all()
+    )
+
+
+def test_sync_records_the_collections_and_their_names(user):
+    summary = controller.sync(user, PAYLOAD)
+
+    assert summary == dict(created=2, updated=0, unchanged=0, names=6, links=6)
+    assert get_collections() == [
+        ("Argentina", "arg", [("en", "Argentina"), ("es", "Argentina"), ("pt", "Argentina")]),
+        ("Brasil", "scl", [("en", "Brazil"), ("es", "Brasil"), ("pt", "Brasil")]),
+    ]
+
+
+def test_sync_writes_only_the_changes(user):
+    controller.sync(user, PAYLOAD)
+    payload = [dict(PAYLOAD[0], status="diffusion", name=dict(PAYLOAD[0]["name"], fr="Brésil")), PAYLOAD[1]]
+
+    summary = controller.sync(user, payload)
+
+    assert summary == dict(created=0, updated=1, unchanged=1, names=1, links=1)
+    brasil = Collection.objects.get(main_name="Brasil")
+    assert (brasil.status, brasil.updated_by) == ("diffusion", user)
+    assert CollectionName.objects.count() == 7
+    assert controller.sync(user, payload) == dict(created=0, updated=0, unchanged=2, names=0, links=0)
+
+
+def test_get_collections_data_keeps_the_payload_to_be_read_offline(tmp_path):
+    payload_file = str(tmp_path / "collections.json")
+    client = Client(PAYLOAD)
+
+    assert controller.get_collections_data(payload_file, client=client) == PAYLOAD
+    assert client.urls == [controller.COLLECTIONS_URL]
+
+    client.payload = []
+    assert controller.get_collections_data(payload_file, offline=True, client=client) == PAYLOAD
+    assert client.urls == [controller.COLLECTIONS_URL]
+
+
+def test_get_collections_data_offline_needs_the_payload_file():
+    with pytest.raises(ValueError):
+        controller.get_collections_data(offline=True, client=Client(PAYLOAD))
@@ -380,3 +380,38 @@ NOCAPTCHA = True
 
 RECAPTCHA_PUBLIC_KEY = env.str("RECAPTCHA_PUBLIC_KEY", default='')
 RECAPTCHA_PRIVATE_KEY = env.str("RECAPTCHA_PRIVATE_KEY", default='')
+
+# Harvesting of the SciELO sites (journal and issue loaders)
+# ------------------------------------------------------------------------------
+# Number of threads fetching records (1 means serial harvest)
+HARVEST_WORKERS = env.int("HARVEST_WORKERS", default=1)
+# Maximum number of simultaneous requests to the same collection site
+HARVEST_WORKERS_PER_HOST = env.int("HARVEST_WORKERS_PER_HOST", default=4)
+# Directory of the on-disk cache of the harvested pages (empty disables the cache)
+HARVEST_CACHE_DIR = env("HARVEST_CACHE_DIR", default="")
+# Seconds a cached page is used without asking the site if it has changed
+HARVEST_CACHE_TTL = env.int("HARVEST_CACHE_TTL", default=0)
+# Number of harvested journals recorded in each transaction
+HARVEST_BATCH_SIZE = env.int("HARVEST_BATCH_SIZE", default=100)
+# Maximum number of requests per second to each collection site, shared by all workers (0 disables it)
+HARVEST_RATE_LIMIT = env.float("HARVEST_RATE_LIMIT", default=0)
+# Number of requests to a collection site which may be sent at once within the rate limit
+HARVEST_RATE_BURST = env.int("HARVEST_RATE_BURST", default=1)
+# Initial and maximum timeout (seconds) of the requests to a collection site
+HARVEST_TIMEOUT = env.float("HARVEST_TIMEOUT", default=10)
+# Minimum timeout (seconds), the timeout adapts to 3x the p95 latency of each site
+HARVEST_MIN_TIMEOUT = env.float("HARVEST_MIN_TIMEOUT", default=2)
+# Consecutive failures which open the circuit of a collection site (0 disables it)
+HARVEST_BREAKER_THRESHOLD = env.int("HARVEST_BREAKER_THRESHOLD", default=5)
+# Seconds a collection site with an open circuit is not requested
+HARVEST_BREAKER_COOLDOWN = env.int("HARVEST_BREAKER_COOLDOWN", default=300)
+
+# Number of rows of the funding CSV recorded in each transaction
+FUNDING_CHUNK_SIZE = env.int("FUNDING_CHUNK_SIZE", default=5000)
+# Directory of the partitions of a parallel funding import, shared by the workers (empty: next to the file)
+FUNDING_WORK_DIR = env("FUNDING_WORK_DIR", default="")
+
+# Number of Altmetric files recorded in each transaction
+ALTMETRIC_BATCH_SIZE = env.int("ALTMETRIC_BATCH_SIZE", default=500)
+# Seconds an altmetric weeks matrix is kept in the cache (it is also renewed by a new extraction)
+ALTMETRIC_ANALYTICS_CACHE_TIMEOUT = env.int("ALTMETRIC_ANALYTICS_CACHE_TIMEOUT", default=86400)
@@ -1,3 +1,5 @@
+from django.utils.translation import gettext as _
+
 
 LANGUAGE = [
     ('aa', 'Afar'),
@@ -183,3 +185,15 @@ LANGUAGE = [
     ('za', 'Zhuang, Chuang'),
     ('zu', 'Zulu'),
 ]
+
+
+HARVEST_KIND = [
+    ('journal', _('Journal')),
+    ('issue', _('Issue')),
+]
+
+HARVEST_STATUS = [
+    ('running', _('Running')),
+    ('interrupted', _('Interrupted')),
+    ('finished', _('Finished')),
+]
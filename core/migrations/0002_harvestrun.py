@@ -0,0 +1,34 @@
+# Generated by Django 4.1.6 on 2026-10-18 04:44
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HarvestRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Creation date')),
+                ('updated', models.DateTimeField(auto_now=True, verbose_name='Last update date')),
+                ('kind', models.CharField(choices=[('journal', 'Journal'), ('issue', 'Issue')], max_length=16, verbose_name='Kind')),
+                ('status', models.CharField(choices=[('running', 'Running'), ('interrupted', 'Interrupted'), ('finished', 'Finished')], default='running', max_length=16, verbose_name='Status')),
+                ('cursor', models.JSONField(blank=True, default=dict, verbose_name='Cursor')),
+                ('summary', models.JSONField(blank=True, default=dict, verbose_name='Summary')),
+                ('finished', models.DateTimeField(blank=True, null=True, verbose_name='Finished')),
+                ('creator', models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='%(class)s_creator', to=settings.AUTH_USER_MODEL, verbose_name='Creator')),
+                ('updated_by', models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='%(class)s_last_mod_user', to=settings.AUTH_USER_MODEL, verbose_name='Updater')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
@@ -1,5 +1,6 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 from django.utils.translation import gettext as _
 
 from wagtail.admin.edit_handlers import FieldPanel
@@ -101,3 +102,142 @@ class FlexibleDate(models.Model):
             date__month=self.month,
             date__day=self.day,
         )
+
+
+class HarvestRun(CommonControlField):
+    """
+    Progress of a harvest, so an interrupted harvest can be resumed.
+
+    Fields:
+        kind: What is harvested (journals or issues)
+        status: running, interrupted or finished
+        cursor: Position of the harvest by collection domain,
+            {domain: {"issn": last ISSN processed, "finished": bool}}, and
+            in a harvest split in tasks, "reported": bool
+        summary: Counts of the harvest by collection domain (or in total)
+        finished: Date time when the harvest was finished
+    """
+
+    kind = models.CharField(_('Kind'), max_length=16, choices=choices.HARVEST_KIND)
+    status = models.CharField(_('Status'), max_length=16, choices=choices.HARVEST_STATUS, default='running')
+    cursor = models.JSONField(_('Cursor'), default=dict, blank=True)
+    summary = models.JSONField(_('Summary'), default=dict, blank=True)
+    finished = models.DateTimeField(_('Finished'), null=True, blank=True)
+
+    panels = [
+        FieldPanel('kind'),
+        FieldPanel('status'),
+        FieldPanel('cursor'),
+        FieldPanel('summary'),
+        FieldPanel('finished'),
+    ]
+
+    def __str__(self):
+        return u'%s %s (%s)' % (self.kind, self.created, self.status)
+
+    @classmethod
+    def start(cls, kind, user, resume=False):
+        """
+        Return a new run of ``kind``, or with ``resume``, the last one not
+        finished, if any.
+        """
+        if resume:
+            run = cls.objects.filter(kind=kind).exclude(status='finished').order_by('-id').first()
+            if run:
+                run.status = 'running'
+                run.updated_by = user
+                run.save(update_fields=['status', 'updated_by', 'updated'])
+                return run
+        return cls.objects.create(kind=kind, creator=user)
+
+    def remaining(self, domain, items, key=None):
+        """
+        Yield the items of the collection ``domain`` after the one in the
+        cursor, identified by ``key(item)``.
+
+        When the item of the cursor is not found, because the collection
+        changed since the interruption, all the items are yielded.
+        """
+        position = self.cursor.get(domain) or {}
+        if position.get('finished'):
+            return
+        items = iter(items)
+        last = position.get('issn')
+        if not last:
+            yield from items
+            return
+
+        skipped = []
+        for item in items:
+            skipped.append(item)
+            if (key(item) if key else item) == last:
+                break
+        else:
+            yield from skipped
+            return
+        yield from items
+
+    def advance(self, domain, issn):
+        self.cursor[domain] = {'issn': issn, 'finished': False}
+
+    def finish_collection(self, domain):
+        self.cursor[domain] = {'issn': None, 'finished': True}
+
+    def checkpoint(self, summary):
+        """
+        Save the cursor and the summary. It must be called only when all the
+        items before the cursor are committed.
+        """
+        self.summary = summary
+        self.save(update_fields=['cursor', 'summary', 'updated'])
+
+    def finish(self, summary):
+        self.summary = summary
+        self.status = 'finished'
+        self.finished = timezone.now()
+        self.save(update_fields=['summary', 'status', 'finished', 'updated'])
+
+    def interrupt(self):
+        self.status = 'interrupted'
+        self.save(update_fields=['status', 'updated'])
+
+    def dispatch(self, domains):
+        """
+        Start a harvest split in tasks by collection: each one of ``domains``
+        is expected to send its summary to ``report``.
+        """
+        for domain in domains:
+            self.cursor[domain] = {'issn': None, 'finished': False}
+        if domains:
+            self.save(update_fields=['cursor', 'updated'])
+        else:
+            self.finish(self.summary)
+
+    def report(self, domain, summary, finished=True, key=None):
+        """
+        Record the ``summary`` of the collection ``domain`` of a harvest
+        split in tasks (see ``dispatch``), by domain, or with ``key``, added
+        to the counts of ``summary[key]``.
+
+        A collection not ``finished`` (e.g. its list failed) is left to be
+        resumed. When every collection is reported, the run is finished, or
+        interrupted if any collection is not finished.
+        """
+        with transaction.atomic():
+            run = type(self).objects.select_for_update().get(pk=self.pk)
+            if key:
+                total = run.summary.setdefault(key, {})
+                for name, value in summary.items():
+                    total[name] = total.get(name, 0) + value
+            else:
+                run.summary[domain] = summary
+            run.cursor[domain] = {'issn': None, 'finished': finished, 'reported': True}
+            positions = run.cursor.values()
+            if all(position.get('reported') for position in positions):
+                if all(position.get('finished') for position in positions):
+                    run.status = 'finished'
+                    run.finished = timezone.now()
+                else:
+                    run.status = 'interrupted'
+            run.save(update_fields=['cursor', 'summary', 'status', 'finished', 'updated'])
+        return run
@@ -0,0 +1,13 @@
+import hashlib
+
+
+def get_checksum(file_path, algorithm='sha256', block_size=1024 * 1024):
+    """
+    Return the hex digest of the content of ``file_path``, read in blocks of
+    ``block_size`` bytes, so a file of any size is never held in memory.
+    """
+    digest = hashlib.new(algorithm)
+    with open(file_path, 'rb') as fp:
+        for block in iter(lambda: fp.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
@@ -0,0 +1,74 @@
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from itertools import zip_longest
+
+
+_EMPTY = object()
+
+
+class HostLimiter:
+    """
+    Bound the number of simultaneous requests sent to each host.
+
+    Usage:
+        limiter = HostLimiter(4)
+        with limiter.slot("www.scielo.br"):
+            requests.get(...)
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self._lock = threading.Lock()
+        self._semaphores = {}
+
+    def _get_semaphore(self, host):
+        with self._lock:
+            try:
+                return self._semaphores[host]
+            except KeyError:
+                semaphore = threading.BoundedSemaphore(self.limit)
+                self._semaphores[host] = semaphore
+                return semaphore
+
+    @contextmanager
+    def slot(self, host):
+        semaphore = self._get_semaphore(host)
+        with semaphore:
+            yield
+
+
+def interleave(*iterables):
+    """
+    Yield the items of the iterables in round-robin order.
+
+    Spreading the items of different collections keeps the worker pool busy
+    even when one collection host is limited or slow.
+    """
+    for items in zip_longest(*iterables, fillvalue=_EMPTY):
+        for item in items:
+            if item is not _EMPTY:
+                yield item
+
+
+def ordered_map(func, items, workers, window=None, executor=None):
+    """
+    Apply ``func`` to each item of ``items`` in a pool of ``workers`` threads,
+    or in ``executor`` if given (e.g. a ProcessPoolExecutor of ``workers``).
+
+    The results are yielded in the same order of ``items`` and at most
+    ``window`` calls are in flight at any time, so the memory is bounded even
+    when the consumer (usually the database writer) is slower than the pool.
+
+    ``func`` is expected to handle its own exceptions.
+    """
+    window = window or workers * 2
+    pending = deque()
+    with nullcontext(executor) if executor else ThreadPoolExecutor(max_workers=workers) as executor:
+        for item in items:
+            pending.append(executor.submit(func, item))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
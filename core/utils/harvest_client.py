@@ -0,0 +1,387 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+import requests
+import xmltodict
+
+from django.conf import settings
+
+from core.utils.rate_limit import AdaptiveTimeout, CircuitBreaker, wait_for_slot
+
+# bodies opened without cache are kept in memory up to this size, and in a temporary file beyond it
+SPOOL_SIZE = 1024 * 1024
+
+
+class HarvestResponse:
+    """
+    Body of a harvested URL, either downloaded or read from the cache.
+
+    Attributes
+    ----------
+    status : str
+        "hit" (fresh in cache), "not_modified" (revalidated with 304),
+        "unchanged" (downloaded again, same body), "miss" (new body),
+        "uncached" (not cacheable) or "replay" (read from a capture)
+    status_code : int
+        HTTP status code (200 when the body comes from the cache)
+    """
+
+    def __init__(self, url, content, encoding, status, status_code=200):
+        self.url = url
+        self.content = content
+        self.encoding = encoding
+        self.status = status
+        self.status_code = status_code
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding or "utf-8", errors="replace")
+
+
+def get_capture_path(root, url):
+    """
+    Return the path of the page ``url`` in a capture directory.
+
+    The tree is laid out by collection and ISSN:
+        {root}/{collection}/sci_alphabetic.xml
+        {root}/{collection}/{issn}/sci_serial.xml
+        {root}/{collection}/{issn}/sci_issues.xml
+    """
+    parsed = urlparse(url)
+    query = parse_qs(parsed.query)
+    parts = [root, parsed.netloc]
+    if query.get("pid"):
+        parts.append(query["pid"][0])
+    parts.append(f"{query['script'][0]}.xml")
+    return os.path.join(*parts)
+
+
+class HarvestClient:
+    """
+    HTTP client shared by the harvesters of the SciELO sites.
+
+    Keep-alive connections are reused through one ``requests.Session`` per
+    thread. When ``cache_dir`` is set, the successful responses are stored
+    by URL together with their ``ETag``/``Last-Modified`` headers:
+
+        - within ``ttl`` seconds the cached body is returned without any request
+        - after that, a conditional request is made and a 304 reuses the body
+        - the parsed XML is also stored, so an unchanged body is not parsed again
+
+    ``rate_limit`` is the maximum number of requests per second to each
+    site, with bursts of ``rate_burst`` requests, shared by all workers. The
+    timeout of each site adapts to its latency, between ``min_timeout`` and
+    ``timeout``, and after ``breaker_threshold`` consecutive failures (errors
+    or 5xx responses) a site is not requested for ``breaker_cooldown``
+    seconds: CircuitOpenError is raised instead (see core.utils.rate_limit).
+
+    When ``capture_dir`` is set, every page successfully harvested is also
+    written in that directory (see get_capture_path), to be used later by
+    ReplayClient.
+
+    ``stats`` counts how each request was served.
+    """
+
+    STATUSES = ("hit", "not_modified", "unchanged", "miss", "uncached", "replay")
+
+    def __init__(self, cache_dir=None, ttl=0, timeout=10, rate_limit=None, capture_dir=None, min_timeout=None,
+                 rate_burst=1, breaker_threshold=None, breaker_cooldown=300):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.rate_limit = rate_limit
+        self.rate_burst = rate_burst
+        self.capture_dir = capture_dir
+        self.timeouts = AdaptiveTimeout(min_timeout or timeout, timeout)
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_cooldown)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._stats = dict.fromkeys(self.STATUSES, 0)
+
+    @property
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+    def _count(self, status):
+        with self._lock:
+            self._stats[status] += 1
+
+    @property
+    def session(self):
+        try:
+            return self._local.session
+        except AttributeError:
+            self._local.session = requests.Session()
+            return self._local.session
+
+    def _cache_path(self, url, suffix):
+        key = hashlib.sha1(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, key[:2], f"{key}.{suffix}")
+
+    def _read_meta(self, url):
+        try:
+            with open(self._cache_path(url, "json"), "r") as fp:
+                return json.load(fp)
+        except (OSError, ValueError):
+            return None
+
+    def _read(self, url, suffix):
+        with open(self._cache_path(url, suffix), "rb") as fp:
+            return fp.read()
+
+    def _write(self, url, suffix, content):
+        path = self._cache_path(url, suffix)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as fp:
+            fp.write(content)
+        os.replace(tmp_path, path)
+
+    def _write_meta(self, url, meta):
+        self._write(url, "json", json.dumps(meta).encode("utf-8"))
+
+    def _lookup(self, url):
+        meta = self.cache_dir and self._read_meta(url)
+        if meta and os.path.exists(self._cache_path(url, "body")):
+            return meta
+
+    def _is_fresh(self, meta):
+        return time.time() - meta["fetched_at"] < self.ttl
+
+    def _send(self, url, meta, stream=False):
+        headers = {}
+        if meta:
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+        domain = urlparse(url).netloc
+        self.breaker.check(domain)
+        wait_for_slot(domain, self.rate_limit, self.rate_burst)
+        timeout = self.timeouts.get(domain)
+        started = time.monotonic()
+        try:
+            http_response = self.session.get(url, headers=headers, timeout=timeout, stream=stream)
+        except requests.RequestException as e:
+            if isinstance(e, requests.Timeout):
+                self.timeouts.observe(domain, timeout)
+            self.breaker.failure(domain)
+            raise
+        self.timeouts.observe(domain, time.monotonic() - started)
+        if http_response.status_code >= 500 or http_response.status_code == 429:
+            self.breaker.failure(domain)
+        else:
+            self.breaker.success(domain)
+        return http_response
+
+    def _revalidated(self, url, meta):
+        meta["fetched_at"] = time.time()
+        self._write_meta(url, meta)
+
+    def _store(self, url, meta, http_response, chunks, encoding):
+        """
+        Write the body of a 200 response in the cache and return its status.
+        """
+        path = self._cache_path(url, "body")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        digest = hashlib.sha1()
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as fp:
+            for chunk in chunks:
+                digest.update(chunk)
+                fp.write(chunk)
+        os.replace(tmp_path, path)
+
+        digest = digest.hexdigest()
+        status = "unchanged" if meta and meta.get("digest") == digest else "miss"
+        if status == "miss":
+            try:
+                os.remove(self._cache_path(url, "parsed"))
+            except OSError:
+                pass
+        self._write_meta(url, {
+            "url": url,
+            "etag": http_response.headers.get("ETag"),
+            "last_modified": http_response.headers.get("Last-Modified"),
+            "encoding": encoding,
+            "digest": digest,
+            "fetched_at": time.time(),
+        })
+        return status
+
+    def _capture(self, url, chunks):
+        path = get_capture_path(self.capture_dir, url)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as fp:
+            for chunk in chunks:
+                fp.write(chunk)
+        os.replace(tmp_path, path)
+        return path
+
+    def get(self, url):
+        """
+        Return the HarvestResponse of ``url``.
+
+        Responses other than 200 are returned as they are and never cached.
+        """
+        response = self._get(url)
+        if self.capture_dir and response.status_code == 200:
+            self._capture(url, [response.content])
+        return response
+
+    def _get(self, url):
+        meta = self._lookup(url)
+        if meta and self._is_fresh(meta):
+            status = "hit"
+        else:
+            http_response = self._send(url, meta)
+            if meta and http_response.status_code == 304:
+                self._revalidated(url, meta)
+                status = "not_modified"
+            else:
+                # the same fallback of requests.Response.text
+                encoding = http_response.encoding or http_response.apparent_encoding
+                if not self.cache_dir or http_response.status_code != 200:
+                    status = "uncached"
+                else:
+                    status = self._store(url, meta, http_response, [http_response.content], encoding)
+                self._count(status)
+                return HarvestResponse(url, http_response.content, encoding, status, http_response.status_code)
+
+        self._count(status)
+        return HarvestResponse(url, self._read(url, "body"), meta["encoding"], status)
+
+    def open(self, url):
+        """
+        Return a binary file-like object with the body of ``url``.
+
+        The body is streamed to the cache (or, when it is not cacheable, to a
+        temporary file spooled in memory up to SPOOL_SIZE), so it is never
+        held in memory as a whole, and the connection is released before the
+        body is read, however slowly it is consumed.
+        """
+        stream, status_code = self._open(url)
+        if not self.capture_dir or status_code != 200:
+            return stream
+        with stream:
+            path = self._capture(url, iter(lambda: stream.read(64 * 1024), b""))
+        return open(path, "rb")
+
+    def _open(self, url):
+        meta = self._lookup(url)
+        if meta and self._is_fresh(meta):
+            status = "hit"
+        else:
+            http_response = self._send(url, meta, stream=True)
+            if meta and http_response.status_code == 304:
+                http_response.close()
+                self._revalidated(url, meta)
+                status = "not_modified"
+            elif not self.cache_dir or http_response.status_code != 200:
+                self._count("uncached")
+                spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+                try:
+                    with http_response:
+                        for chunk in http_response.iter_content(64 * 1024):
+                            spool.write(chunk)
+                except BaseException:
+                    spool.close()
+                    raise
+                spool.seek(0)
+                return spool, http_response.status_code
+            else:
+                status = self._store(url, meta, http_response, http_response.iter_content(64 * 1024),
+                                     http_response.encoding)
+        self._count(status)
+        return open(self._cache_path(url, "body"), "rb"), 200
+
+    def get_xml(self, url):
+        """
+        Return ``url`` parsed by ``xmltodict``.
+
+        The parsed data is cached next to the body and reused while the body
+        does not change.
+        """
+        response = self.get(url)
+        if response.status in ("hit", "not_modified", "unchanged"):
+            try:
+                return json.loads(self._read(url, "parsed"))
+            except (OSError, ValueError):
+                pass
+        data = xmltodict.parse(response.text)
+        if response.status != "uncached":
+            self._write(url, "parsed", json.dumps(data).encode("utf-8"))
+        return data
+
+
+class ReplayClient(HarvestClient):
+    """
+    Client which serves the pages from a directory written by a capture
+    (see HarvestClient.capture_dir), with no network at all.
+
+    A page missing in the directory raises FileNotFoundError, which is
+    handled by the harvesters as any other request error.
+    """
+
+    def __init__(self, replay_dir):
+        super().__init__()
+        self.replay_dir = replay_dir
+
+    def get(self, url):
+        with open(get_capture_path(self.replay_dir, url), "rb") as fp:
+            content = fp.read()
+        self._count("replay")
+        return HarvestResponse(url, content, None, "replay")
+
+    def open(self, url):
+        stream = open(get_capture_path(self.replay_dir, url), "rb")
+        self._count("replay")
+        return stream
+
+    def get_xml(self, url):
+        with self.open(url) as stream:
+            return xmltodict.parse(stream)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def _get_options():
+    return dict(
+        cache_dir=settings.HARVEST_CACHE_DIR or None,
+        ttl=settings.HARVEST_CACHE_TTL,
+        timeout=settings.HARVEST_TIMEOUT,
+        min_timeout=settings.HARVEST_MIN_TIMEOUT,
+        rate_limit=settings.HARVEST_RATE_LIMIT,
+        rate_burst=settings.HARVEST_RATE_BURST,
+        breaker_threshold=settings.HARVEST_BREAKER_THRESHOLD,
+        breaker_cooldown=settings.HARVEST_BREAKER_COOLDOWN,
+    )
+
+
+def get_client(replay_dir=None, capture_dir=None):
+    """
+    Return the HarvestClient of the process, configured by the HARVEST_*
+    settings. It is shared by the collection, journal and issue harvesters,
+    so they share its limits.
+
+    With ``replay_dir``, return a ReplayClient of that directory instead.
+    With ``capture_dir``, return a new client which also writes the pages
+    in that directory.
+    """
+    global _client
+    if replay_dir:
+        return ReplayClient(replay_dir)
+    if capture_dir:
+        return HarvestClient(capture_dir=capture_dir, **_get_options())
+    with _client_lock:
+        if _client is None:
+            _client = HarvestClient(**_get_options())
+        return _client
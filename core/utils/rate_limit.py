@@ -0,0 +1,142 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from django.core.cache import cache
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of sending a request to a site whose circuit is open.
+
+    ``retry_after`` is the number of seconds until the site is tried again.
+    """
+
+    def __init__(self, domain, retry_after):
+        super().__init__(f"Circuit open for {domain}, retry after {retry_after:.0f}s")
+        self.domain = domain
+        self.retry_after = retry_after
+
+
+@contextmanager
+def _cache_lock(key, timeout=5):
+    # cache.add is atomic (SETNX in Redis), the timeout releases the lock of a dead worker
+    while not cache.add(key, 1, timeout=timeout):
+        time.sleep(0.005)
+    try:
+        yield
+    finally:
+        cache.delete(key)
+
+
+def wait_for_slot(domain, rate, burst=1):
+    """
+    Block until a new request to ``domain`` is allowed by ``rate``.
+
+    ``rate`` is the maximum number of requests per second to the domain. The
+    requests take tokens of a bucket of ``burst`` tokens, refilled at ``rate``
+    tokens per second. The bucket is stored in the Django cache, so the limit
+    is shared by all the workers which use the same cache (Redis in
+    production). A false ``rate`` disables the limit.
+    """
+    if not rate:
+        return
+    burst = max(1, burst or 1)
+    key = f"harvest-bucket:{domain}"
+    timeout = int(burst / rate) + 60
+    while True:
+        with _cache_lock(f"{key}:lock"):
+            now = time.time()
+            tokens, updated = cache.get(key) or (burst, now)
+            tokens = min(burst, tokens + (now - updated) * rate)
+            if tokens >= 1:
+                cache.set(key, (tokens - 1, now), timeout=timeout)
+                return
+            cache.set(key, (tokens, now), timeout=timeout)
+        time.sleep((1 - tokens) / rate)
+
+
+class CircuitBreaker:
+    """
+    Stop sending requests to a site after ``threshold`` consecutive failures.
+
+    The circuit of the domain is then open for ``cooldown`` seconds, for all
+    the workers which use the same Django cache: ``check`` raises
+    CircuitOpenError instead of waiting for the timeout of each request. After
+    the cooldown, one more failure opens the circuit again, while a success
+    closes it. A false ``threshold`` disables the breaker.
+
+    Usage:
+        breaker.check(domain)
+        try:
+            response = send(...)
+        except requests.RequestException:
+            breaker.failure(domain)
+            raise
+        breaker.success(domain)
+    """
+
+    def __init__(self, threshold, cooldown):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._failures = {}
+
+    def _key(self, domain):
+        return f"harvest-breaker:{domain}"
+
+    def check(self, domain):
+        if not self.threshold:
+            return
+        until = cache.get(self._key(domain))
+        if until and until > time.time():
+            raise CircuitOpenError(domain, until - time.time())
+
+    def success(self, domain):
+        with self._lock:
+            self._failures.pop(domain, None)
+
+    def failure(self, domain):
+        if not self.threshold:
+            return
+        with self._lock:
+            failures = self._failures[domain] = self._failures.get(domain, 0) + 1
+        if failures >= self.threshold:
+            cache.set(self._key(domain), time.time() + self.cooldown, timeout=int(self.cooldown) + 1)
+
+
+class AdaptiveTimeout:
+    """
+    Timeout of the requests to each site, adapted to its latency.
+
+    Until ``min_samples`` latencies of the domain are observed, the timeout is
+    ``max_timeout``. After that, it is ``factor`` times the 95th percentile of
+    the last ``window`` latencies, between ``min_timeout`` and ``max_timeout``,
+    so a slow site fails fast instead of holding a worker for the maximum.
+    """
+
+    def __init__(self, min_timeout, max_timeout, factor=3, window=200, min_samples=20):
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.factor = factor
+        self.window = window
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+        self._latencies = {}
+
+    def observe(self, domain, seconds):
+        with self._lock:
+            try:
+                latencies = self._latencies[domain]
+            except KeyError:
+                latencies = self._latencies[domain] = deque(maxlen=self.window)
+            latencies.append(seconds)
+
+    def get(self, domain):
+        with self._lock:
+            latencies = sorted(self._latencies.get(domain) or ())
+        if len(latencies) < self.min_samples:
+            return self.max_timeout
+        p95 = latencies[int(0.95 * (len(latencies) - 1))]
+        return min(self.max_timeout, max(self.min_timeout, p95 * self.factor))
@@ -0,0 +1,66 @@
+"""
+Pages of two collections, as read by ReplayClient, for the tests of the
+journal and issue harvests.
+"""
+import os
+
+from collection.models import Collection
+
+DOMAINS = ("www.scielo.test", "www.scielo.other")
+
+SERIAL = """<?xml version="1.0" encoding="ISO-8859-1"?>
+<SERIAL>
+<CONTROLINFO><LANGUAGE>es</LANGUAGE></CONTROLINFO>
+<ISSN_AS_ID>{issn}</ISSN_AS_ID>
+<TITLEGROUP><TITLE>Journal {issn}</TITLE><SHORTTITLE>J {issn}</SHORTTITLE></TITLEGROUP>
+<TITLE_ISSN TYPE="PRINT">{issn}</TITLE_ISSN>
+<MISSION>Mission of {issn}</MISSION>
+<PUBLISHERS><PUBLISHER><NAME>Publisher {n}</NAME></PUBLISHER></PUBLISHERS>
+<AVAILISSUES>
+<YEARISSUE YEAR="2020"><VOLISSUE VOL="{n}">
+<ISSUE NUM="1" PUBDATE="202001"/><ISSUE NUM="2" PUBDATE="202006"/>
+</VOLISSUE></YEARISSUE>
+<YEARISSUE YEAR="2021"><VOLISSUE VOL="{n}"><ISSUE NUM="1" PUBDATE="202101"/></VOLISSUE></YEARISSUE>
+</AVAILISSUES>
+</SERIAL>
+"""
+
+
+def get_issns(domain, count=6):
+    offset = DOMAINS.index(domain) * 100
+    return ["%04d-%04d" % (offset + n, offset + n) for n in range(1, count + 1)]
+
+
+def write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="iso-8859-1") as fp:
+        fp.write(content)
+
+
+def write_issn_list(replay_dir, domain, issns, truncated=False):
+    content = '<?xml version="1.0" encoding="ISO-8859-1"?><SERIALLIST><LIST>' + "".join(
+        f'<SERIAL><TITLE ISSN="{issn}">Journal {issn}</TITLE></SERIAL>' for issn in issns
+    ) + "</LIST></SERIALLIST>"
+    if truncated:
+        # cut off in the SERIAL after the first three
+        content = content[:content.index(issns[3]) + 4]
+    write(os.path.join(replay_dir, domain, "sci_alphabetic.xml"), content)
+
+
+def write_replay(replay_dir):
+    """
+    Write the pages of the collections DOMAINS as read by ReplayClient (see
+    core.utils.harvest_client.get_capture_path).
+    """
+    for domain in DOMAINS:
+        issns = get_issns(domain)
+        write_issn_list(replay_dir, domain, issns)
+        for n, issn in enumerate(issns, 1):
+            # the same record answers the journal (sci_serial) and the issues (sci_issues) harvests
+            for script in ("sci_serial", "sci_issues"):
+                write(os.path.join(replay_dir, domain, issn, f"{script}.xml"), SERIAL.format(issn=issn, n=n))
+    return replay_dir
+
+
+def create_collections():
+    return [Collection.objects.create(domain=domain, main_name=domain) for domain in DOMAINS]
@@ -2,9 +2,13 @@
 
 from django.templatetags.static import static
 from django.utils.html import format_html
+from django.utils.translation import gettext as _
 
+from wagtail.contrib.modeladmin.options import ModelAdmin, modeladmin_register
 from wagtail.core import hooks
 
+from .models import HarvestRun
+
 
 @hooks.register("insert_global_admin_css", order=100)
 def global_admin_css():
@@ -24,3 +28,28 @@ def global_admin_js():
         '<script src="{}"></script>',
         static("admin/js/custom.js")
     )
+
+
+class HarvestRunAdmin(ModelAdmin):
+    model = HarvestRun
+    inspect_view_enabled = True
+    menu_label = _('Harvest Runs')
+    menu_icon = 'folder'
+    menu_order = 950
+    add_to_settings_menu = False
+    exclude_from_explorer = False
+
+    list_display = (
+        'kind',
+        'status',
+        'created',
+        'updated',
+        'finished',
+    )
+    list_filter = (
+        'kind',
+        'status',
+    )
+
+
+modeladmin_register(HarvestRunAdmin)
@@ -0,0 +1,32 @@
+# Generated by Django 4.1.6 on 2026-10-18 05:08
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('institution', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SponsorAlias',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Creation date')),
+                ('updated', models.DateTimeField(auto_now=True, verbose_name='Last update date')),
+                ('name', models.CharField(max_length=255, unique=True, verbose_name='Name')),
+                ('creator', models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='%(class)s_creator', to=settings.AUTH_USER_MODEL, verbose_name='Creator')),
+                ('sponsor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='aliases', to='institution.sponsor', verbose_name='Sponsor')),
+                ('updated_by', models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='%(class)s_last_mod_user', to=settings.AUTH_USER_MODEL, verbose_name='Updater')),
+            ],
+            options={
+                'verbose_name': 'Sponsor alias',
+                'verbose_name_plural': 'Sponsor aliases',
+            },
+        ),
+    ]
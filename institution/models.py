@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import connection, models
 from django.utils.translation import gettext as _
 from modelcluster.models import ClusterableModel
 from wagtail.admin.edit_handlers import FieldPanel, InlinePanel
@@ -83,6 +83,30 @@ class Institution(CommonControlField, ClusterableModel):
 
         return _data
 
+    @classmethod
+    def load_official(cls, institutions):
+        """
+        Load the chains of ``official`` of ``institutions`` with one query by
+        level, so their ``data`` does not run one query by institution.
+        """
+        loaded = {}
+        field = cls.official.field
+        institutions = [institution for institution in institutions if institution]
+        while institutions:
+            loaded.update({institution.id: institution for institution in institutions})
+            missing = {
+                institution.official_id for institution in institutions
+                if institution.official_id and not field.is_cached(institution)
+            }
+            loaded.update(Institution.objects.in_bulk(missing - loaded.keys()))
+            level = []
+            for institution in institutions:
+                if institution.official_id and not field.is_cached(institution):
+                    official = loaded.get(institution.official_id)
+                    field.set_cached_value(institution, official)
+                    level.append(official)
+            institutions = [institution for institution in level if institution]
+
     @classmethod
     def get_or_create(cls, inst_name, inst_acronym, level_1, level_2, level_3,
                       location, official, is_official):
@@ -103,9 +127,11 @@ class Institution(CommonControlField, ClusterableModel):
         if level_3:
             parms['level_3'] = level_3
 
-        try:
-            return cls.objects.get(**parms)
-        except:
+        # the oldest one when there are several, to not create another duplicate
+        institution = parms and cls.objects.filter(**parms).order_by('id').first()
+        if institution:
+            return institution
+        else:
             institution = cls()
             institution.name = inst_name
             institution.acronym = inst_acronym
@@ -149,4 +175,55 @@ class InstitutionHistory(models.Model):
 class Sponsor(Institution):
     panels = Institution.panels
 
+    @classmethod
+    def bulk_create_by_names(cls, names, user):
+        """
+        Create one sponsor for each one of ``names`` with two inserts.
+        Return a dict {name: sponsor id}
+        """
+        missing = [Institution(name=name, creator=user) for name in names]
+        if missing:
+            # bulk_create does not support multi-table inheritance, so the
+            # institutions are inserted first and then the rows of the child table
+            Institution.objects.bulk_create(missing)
+            with connection.cursor() as cursor:
+                cursor.executemany(
+                    'INSERT INTO %s (%s) VALUES (%%s)' % (
+                        connection.ops.quote_name(cls._meta.db_table),
+                        connection.ops.quote_name(cls._meta.pk.column)),
+                    [(institution.id,) for institution in missing],
+                )
+        return {institution.name: institution.id for institution in missing}
+
+    base_form_class = CoreAdminModelForm
+
+
+class SponsorAlias(CommonControlField):
+    """
+    Other name of a sponsor, found in the funding data.
+
+    The names are compared without accents, case and repeated spaces (see
+    institution.resolver.SponsorIndex).
+    """
+    name = models.CharField(_("Name"), max_length=255, unique=True)
+    sponsor = models.ForeignKey(Sponsor, verbose_name=_("Sponsor"), related_name='aliases',
+                                on_delete=models.CASCADE)
+
+    autocomplete_search_field = 'name'
+
+    def autocomplete_label(self):
+        return self.name
+
+    panels = [
+        FieldPanel('name'),
+        AutocompletePanel('sponsor'),
+    ]
+
+    class Meta:
+        verbose_name = _("Sponsor alias")
+        verbose_name_plural = _("Sponsor aliases")
+
+    def __str__(self):
+        return u'%s | %s' % (self.name, self.sponsor)
+
     base_form_class = CoreAdminModelForm
@@ -0,0 +1,204 @@
+import unicodedata
+from contextlib import contextmanager
+
+from django.db import transaction
+
+from .models import Institution, InstitutionHistory, Sponsor, SponsorAlias
+
+
+def normalize_name(name):
+    """
+    Return ``name`` without accents, case and repeated spaces, so trivial
+    variations of the same name are resolved to the same institution.
+    """
+    if not name:
+        return None
+    name = unicodedata.normalize("NFKD", name)
+    name = "".join(c for c in name if not unicodedata.combining(c))
+    return " ".join(name.split()).casefold() or None
+
+
+class TransactionalCache:
+    """
+    Base of the caches of ids which are filled while records are created.
+
+    The ids registered inside ``atomic`` are forgotten if it is rolled back,
+    so the cache never returns the id of a row which does not exist.
+    """
+
+    def __init__(self):
+        self._created = []
+
+    @contextmanager
+    def atomic(self):
+        created = []
+        self._created.append(created)
+        try:
+            with transaction.atomic():
+                yield
+        except Exception:
+            for cache, key in created:
+                cache.pop(key, None)
+            raise
+        finally:
+            self._created.pop()
+        if self._created:
+            self._created[-1].extend(created)
+
+    def _register(self, cache, key, value):
+        cache[key] = value
+        if self._created:
+            self._created[-1].append((cache, key))
+
+
+class InstitutionResolver(TransactionalCache):
+    """
+    Cache of institution ids by normalized name, scoped to one harvest.
+
+    It is warmed with one query at the first lookup. When several
+    institutions have the same normalized name, the oldest one is used, so
+    the resolution is deterministic and no other duplicate is created.
+
+    Usage:
+        resolver = InstitutionResolver()
+        with resolver.atomic():
+            institution_id = resolver.get_institution_id(name)
+            history_id = resolver.get_history_id(institution_id)
+
+    The ids created inside ``atomic`` are forgotten if it is rolled back.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._institutions = None
+        self._histories = None
+
+    def warm(self):
+        self._institutions = {}
+        for institution_id, name in Institution.objects.filter(name__isnull=False).order_by('id').values_list(
+                'id', 'name'):
+            key = normalize_name(name)
+            if key:
+                self._institutions.setdefault(key, institution_id)
+
+        self._histories = {}
+        for history_id, institution_id in InstitutionHistory.objects.filter(
+                institution__isnull=False, initial_date__isnull=True, final_date__isnull=True).order_by(
+                'id').values_list('id', 'institution_id'):
+            self._histories.setdefault(institution_id, history_id)
+
+    def get_institution_id(self, name):
+        """
+        Return the id of the institution named ``name``, created if needed,
+        or None if ``name`` is empty.
+        """
+        key = normalize_name(name)
+        if not key:
+            # a nameless institution could not be found again, so it is not created
+            return None
+        if self._institutions is None:
+            self.warm()
+        try:
+            return self._institutions[key]
+        except KeyError:
+            institution = Institution.get_or_create(
+                inst_name=name,
+                inst_acronym=None,
+                level_1=None,
+                level_2=None,
+                level_3=None,
+                location=None,
+                official=None,
+                is_official=None,
+            )
+            self._register(self._institutions, key, institution.id)
+            return institution.id
+
+    def get_history_id(self, institution_id):
+        """
+        Return the id of the InstitutionHistory of ``institution_id`` with no
+        dates, created if needed, or None if ``institution_id`` is None.
+        """
+        if institution_id is None:
+            return None
+        if self._histories is None:
+            self.warm()
+        try:
+            return self._histories[institution_id]
+        except KeyError:
+            history = InstitutionHistory.objects.create(institution_id=institution_id)
+            self._register(self._histories, institution_id, history.id)
+            return history.id
+
+
+class SponsorIndex(TransactionalCache):
+    """
+    Index of sponsor ids by normalized name, scoped to one funding import.
+
+    It is built with two queries at the first lookup, from the names and the
+    acronyms of the sponsors and from SponsorAlias, plus the ``aliases``
+    given as a dict {alias: name of the sponsor}. A name wins over an
+    acronym, and the oldest sponsor wins among several with the same key.
+    Known funders are then resolved with no query, and the unknown ones of
+    each call to ``get_ids`` are created together, one sponsor by
+    normalized name.
+
+    Usage:
+        sponsors = SponsorIndex()
+        with sponsors.atomic():
+            ids = sponsors.get_ids(names, user)
+    """
+
+    def __init__(self, aliases=None):
+        super().__init__()
+        self.aliases = aliases or {}
+        self._sponsors = None
+
+    def warm(self):
+        self._sponsors = {}
+        acronyms = {}
+        for sponsor_id, name, acronym in Sponsor.objects.order_by('id').values_list('id', 'name', 'acronym'):
+            key = normalize_name(name)
+            if key:
+                self._sponsors.setdefault(key, sponsor_id)
+            key = normalize_name(acronym)
+            if key:
+                acronyms.setdefault(key, sponsor_id)
+        for key, sponsor_id in acronyms.items():
+            self._sponsors.setdefault(key, sponsor_id)
+
+        for name, sponsor_id in SponsorAlias.objects.order_by('id').values_list('name', 'sponsor_id'):
+            key = normalize_name(name)
+            if key:
+                self._sponsors.setdefault(key, sponsor_id)
+        for alias, name in self.aliases.items():
+            key = normalize_name(alias)
+            sponsor_id = self._sponsors.get(normalize_name(name))
+            if key and sponsor_id:
+                self._sponsors.setdefault(key, sponsor_id)
+
+    def get_id(self, name):
+        """
+        Return the id of the sponsor named ``name``, or None if it is unknown.
+        """
+        if self._sponsors is None:
+            self.warm()
+        return self._sponsors.get(normalize_name(name))
+
+    def get_ids(self, names, user):
+        """
+        Return a dict {name: sponsor id} of ``names``, with the unknown
+        sponsors created with two inserts.
+        """
+        if self._sponsors is None:
+            self.warm()
+        missing = {}
+        for name in names:
+            key = normalize_name(name)
+            if key and key not in self._sponsors:
+                missing.setdefault(key, " ".join(name.split()))
+        if missing:
+            created = Sponsor.bulk_create_by_names(missing.values(), user)
+            for key, name in missing.items():
+                self._register(self._sponsors, key, created[name])
+        return {name: self._sponsors.get(normalize_name(name)) for name in names}
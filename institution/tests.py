@@ -1,3 +1,85 @@
-from django.test import TestCase
+import pytest
 
-# Create your tests here.
+from core.users.tests.factories import UserFactory
+from institution.models import Institution, InstitutionHistory, Sponsor, SponsorAlias
+from institution.resolver import InstitutionResolver, SponsorIndex
+
+pytestmark = pytest.mark.django_db
+
+
+def test_resolver_resolves_the_variations_of_a_name_to_the_oldest_institution():
+    oldest = Institution.objects.create(name="Universidade de São Paulo")
+    Institution.objects.create(name="UNIVERSIDADE DE SAO PAULO")
+    resolver = InstitutionResolver()
+
+    assert resolver.get_institution_id("universidade  de sao paulo") == oldest.id
+    assert resolver.get_institution_id("Other") == resolver.get_institution_id("other")
+    assert Institution.objects.count() == 3
+
+
+@pytest.mark.parametrize("name", [None, "", "  "])
+def test_resolver_does_not_create_a_nameless_institution(name):
+    resolver = InstitutionResolver()
+
+    assert resolver.get_institution_id(name) is None
+    assert resolver.get_history_id(None) is None
+    assert not Institution.objects.exists()
+    assert not InstitutionHistory.objects.exists()
+
+
+@pytest.fixture
+def user():
+    return UserFactory()
+
+
+def test_sponsor_bulk_create_by_names_inserts_the_sponsors_and_their_institutions(user):
+    ids = Sponsor.bulk_create_by_names(["CNPq", "FAPESP"], user)
+
+    sponsors = {sponsor.name: sponsor for sponsor in Sponsor.objects.all()}
+    assert {name: sponsor.id for name, sponsor in sponsors.items()} == ids
+    assert sponsors["CNPq"].creator == user
+    assert set(Institution.objects.values_list("id", flat=True)) == set(ids.values())
+    assert Sponsor.bulk_create_by_names([], user) == {}
+
+
+def test_sponsor_index_resolves_names_acronyms_and_aliases(user, django_assert_num_queries):
+    cnpq = Sponsor.objects.create(name="Conselho Nacional de Desenvolvimento Científico e Tecnológico", acronym="CNPq")
+    fapesp = Sponsor.objects.create(name="FAPESP")
+    SponsorAlias.objects.create(name="São Paulo Research Foundation", sponsor=fapesp)
+    sponsors = SponsorIndex(aliases={"Fundação de Amparo à Pesquisa do Estado de São Paulo": "fapesp"})
+    sponsors.warm()
+
+    with django_assert_num_queries(0):
+        assert sponsors.get_ids([
+            "conselho nacional de desenvolvimento cientifico e  tecnologico",
+            " cnpq",
+            "SAO PAULO RESEARCH FOUNDATION",
+            "Fundacao de Amparo a Pesquisa do Estado de Sao Paulo",
+        ], user) == {
+            "conselho nacional de desenvolvimento cientifico e  tecnologico": cnpq.id,
+            " cnpq": cnpq.id,
+            "SAO PAULO RESEARCH FOUNDATION": fapesp.id,
+            "Fundacao de Amparo a Pesquisa do Estado de Sao Paulo": fapesp.id,
+        }
+
+
+def test_sponsor_index_creates_one_sponsor_by_normalized_name(user):
+    sponsors = SponsorIndex()
+
+    ids = sponsors.get_ids(["Capes", "CAPES ", "Cápes", "Other"], user)
+
+    assert len({ids["Capes"], ids["CAPES "], ids["Cápes"]}) == 1
+    assert sorted(Sponsor.objects.values_list("name", flat=True)) == ["Capes", "Other"]
+    assert SponsorIndex().get_id("capes") == ids["Capes"]
+
+
+def test_sponsor_index_forgets_the_sponsors_of_a_rolled_back_transaction(user):
+    sponsors = SponsorIndex()
+
+    with pytest.raises(ValueError):
+        with sponsors.atomic():
+            sponsors.get_ids(["Capes"], user)
+            raise ValueError
+
+    assert sponsors.get_id("Capes") is None
+    assert sponsors.get_ids(["Capes"], user)["Capes"] == Sponsor.objects.get().id
@@ -4,7 +4,7 @@ from django.utils.translation import gettext as _
 from wagtail.contrib.modeladmin.views import CreateView
 from wagtail.contrib.modeladmin.options import ModelAdmin, modeladmin_register, ModelAdminGroup
 
-from .models import Institution, Sponsor
+from .models import Institution, Sponsor, SponsorAlias
 
 
 class InstitutionCreateView(CreateView):
@@ -49,11 +49,32 @@ class SponsorAdmin(ModelAdmin):
     export_filename = 'sponsor'
 
 
+class SponsorAliasCreateView(CreateView):
+
+    def form_valid(self, form):
+        self.object = form.save_all(self.request.user)
+        return HttpResponseRedirect(self.get_success_url())
+
+
+class SponsorAliasAdmin(ModelAdmin):
+    model = SponsorAlias
+    create_view_class = SponsorAliasCreateView
+    menu_label = _('Sponsor alias')
+    menu_icon = 'folder'
+    menu_order = 1000
+    add_to_settings_menu = False  # or True to add your model to the Settings sub-menu
+    exclude_from_explorer = False  # or True to exclude pages of this type from Wagtail's explorer view
+    list_display = ('name', 'sponsor', 'creator', 'updated', 'created', 'updated_by')
+    search_fields = ('name', 'sponsor__name', 'sponsor__acronym')
+    list_export = ('name', 'sponsor', 'creator', 'updated', 'created', 'updated_by')
+    export_filename = 'sponsor_aliases'
+
+
 class InstitutionsAdminGroup(ModelAdminGroup):
     menu_label = _('Institutions')
     menu_icon = 'folder-open-inverse'  # change as required
     menu_order = 100  # will put in 3rd place (000 being 1st, 100 2nd)
-    items = (InstitutionAdmin, SponsorAdmin)
+    items = (InstitutionAdmin, SponsorAdmin, SponsorAliasAdmin)
 
 
 modeladmin_register(InstitutionsAdminGroup)
@@ -1,86 +1,319 @@
-import requests
-import xmltodict
 import json
+import logging
+import time
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
 
 from .models import ScieloJournal, Issue
+from collection.models import Collection
+from core.models import HarvestRun
 from processing_errors.models import ProcessingError
+from core.utils.harvest import HostLimiter, interleave, ordered_map
+from core.utils.harvest_client import get_client
+from core.utils.rate_limit import CircuitOpenError
+
+
+def fetch_journal_xml(collection, issn, client=None):
+    return (client or get_client()).get_xml(
+        f"http://{collection}/scielo.php?script=sci_issues&pid={issn}&lng=es&nrm=iso&debug=xml"
+    )
+
+
+def register_journal_xml_error(collection, issn, e):
+    error = ProcessingError()
+    error.item = f"Error getting the ISSN {issn} of the {collection} collection"
+    error.step = "Journal record search error"
+    error.description = str(e)[:509]
+    error.type = str(type(e))
+    error.save()
+
+
+def get_journal_xml(collection, issn, client=None):
+    try:
+        return fetch_journal_xml(collection, issn, client)
+    except CircuitOpenError:
+        raise
+    except Exception as e:
+        register_journal_xml_error(collection, issn, e)
+
+
+def register_issue_error(issn_scielo, e):
+    error = ProcessingError()
+    error.item = f"Error getting or creating issue for {issn_scielo}"
+    error.step = "Issue record creating error"
+    error.description = str(e)[:509]
+    error.type = str(type(e))
+    error.save()
+
+
+def register_collection_error(collection, e):
+    error = ProcessingError()
+    error.item = f"Issues of the {collection} collection"
+    error.step = "Collection issues harvest error"
+    error.description = str(e)[:509]
+    error.type = str(type(e))
+    error.save()
+
+
+def as_list(value):
+    """
+    Return ``value`` as a list, since xmltodict returns a single element as
+    a dict and repeated ones as a list.
+    """
+    if value is None:
+        return []
+    if isinstance(value, list):
+        return value
+    return [value]
 
 
-def get_journal_xml(collection, issn):
+def as_int(value):
     try:
-        journal = requests.get(
-            f"http://{collection}/scielo.php?script=sci_issues&pid={issn}&lng=es&nrm=iso&debug=xml", timeout=10
-        )
+        return int(value)
+    except (TypeError, ValueError):
+        return None
 
-        return xmltodict.parse(journal.text)
 
+def parse_issues(journal_xml):
+    """
+    Return the list of issues of AVAILISSUES, as dicts with the keys volume,
+    number, supplement, year and month.
+    """
+    issues = []
+    for year_issue in as_list(journal_xml['SERIAL']['AVAILISSUES']['YEARISSUE']):
+        for vol_issue in as_list(year_issue['VOLISSUE']):
+            volume = vol_issue.get('@VOL')
+            for item in as_list(vol_issue.get('ISSUE')):
+                pubdate = str(item.get('@PUBDATE') or '')
+                issues.append(dict(
+                    volume=volume,
+                    number=item.get('@NUM'),
+                    # value not available in XML file
+                    supplement=None,
+                    year=as_int(pubdate[:4]),
+                    month=as_int(pubdate[4:6]),
+                ))
+    return issues
+
+
+def get_issue(user, journal_xml, journal=None):
+    issn_scielo = journal_xml['SERIAL']['ISSN_AS_ID']
+    try:
+        journal = journal or ScieloJournal.objects.filter(issn_scielo=issn_scielo)[0]
+        issues = parse_issues(journal_xml)
     except Exception as e:
         error = ProcessingError()
-        error.item = f"Error getting the ISSN {issn} of the {collection} collection"
-        error.step = "Journal record search error"
+        error.item = f"Error getting SciELO journal for {journal_xml['SERIAL']['ISSN_AS_ID']}"
+        error.step = "SciELO journal record recovery error"
         error.description = str(e)[:509]
         error.type = str(type(e))
         error.save()
+        return
 
-
-def get_issue(user, journal_xml):
-    issn_scielo = journal_xml['SERIAL']['ISSN_AS_ID']
     try:
-        journal = ScieloJournal.objects.filter(issn_scielo=issn_scielo)[0]
-        for issue in journal_xml['SERIAL']['AVAILISSUES']['YEARISSUE']:
-            try:
-                volume = issue['VOLISSUE']['@VOL']
-            except KeyError:
-                volume = None
-            for item in issue['VOLISSUE']['ISSUE']:
-                try:
-                    number = item['@NUM']
-                except KeyError:
-                    number = None
-                try:
-                    year = str(item['@PUBDATE'])[:4]
-                    month = str(item['@PUBDATE'])[4:6]
-                except KeyError:
-                    year = None
-                    month = None
-                # value not available in XML file
-                supplement = None
-                try:
-                    Issue.get_or_create(
-                        journal=journal,
-                        number=number,
-                        volume=volume,
-                        year=year,
-                        month=month,
-                        user=user,
-                        supplement=supplement,
-                    )
-                except Exception as e:
-                    error = ProcessingError()
-                    error.item = f"Error getting or creating issue for {journal_xml['SERIAL']['ISSN_AS_ID']}"
-                    error.step = "Issue record creating error"
-                    error.description = str(e)[:509]
-                    error.type = str(type(e))
-                    error.save()
+        Issue.bulk_get_or_create(journal, issues, user)
+    except Exception as e:
+        register_issue_error(issn_scielo, e)
+
 
+def load_journals(user, journals, client=None):
+    """
+    Harvest the issues of ``journals``.
+
+    Return the counts of harvested and failed journals.
+    """
+    summary = dict(harvested=0, failed=0)
+    for journal in journals:
+        summary['harvested' if load_journal(user, journal, client) else 'failed'] += 1
+    return summary
+
+
+def load_journal(user, journal, client=None):
+    """
+    Harvest the issues of ``journal``.
+
+    Return False if the journal record could not be got.
+    """
+    try:
+        journal_xml = get_journal_xml(journal.collection.domain, journal.issn_scielo, client)
+        get_issue(user, journal_xml, journal)
+        return True
+    except CircuitOpenError:
+        raise
     except Exception as e:
         error = ProcessingError()
-        error.item = f"Error getting SciELO journal for {journal_xml['SERIAL']['ISSN_AS_ID']}"
+        error.item = f"Error getting record XML"
         error.step = "SciELO journal record recovery error"
         error.description = str(e)[:509]
         error.type = str(type(e))
         error.save()
+        return False
+
+
+class IssueWriter:
+    """
+    Record the issues of the harvested journals in batches.
+
+    The harvesters ``add`` the parsed issues of each journal and call
+    ``advance`` after each journal. Every ``batch_size`` journals the batch
+    is committed in one transaction, each journal in its own savepoint, and
+    the cursor of the HarvestRun, if any, is checkpointed.
+
+    Attributes
+    ----------
+    summary : dict
+        counts of "harvested" and "failed" journals and of "issues" read and
+        "created"
+    """
+
+    def __init__(self, user, batch_size=None, run=None):
+        self.user = user
+        self.batch_size = batch_size or settings.HARVEST_BATCH_SIZE
+        self.batch = []
+        self.run = run
+        self.summary = dict(harvested=0, failed=0, issues=0, created=0)
+        # a resumed harvest keeps counting from the interruption
+        self.summary.update((run.summary.get('total') or {}) if run else {})
+        self.pending = 0
+
+    def add(self, journal, issues):
+        self.batch.append((journal, issues))
+
+    def failed(self):
+        self.summary['failed'] += 1
+
+    def advance(self, journal):
+        """
+        Mark ``journal`` as processed.
+        """
+        if self.run:
+            self.run.advance(journal.collection.domain, journal.issn_scielo)
+        self.pending += 1
+        if self.pending >= self.batch_size:
+            self.flush()
+
+    def finish_collection(self, collection):
+        if self.run:
+            self.run.finish_collection(collection.domain)
 
+    def flush(self):
+        if self.batch:
+            self._write()
+        if self.run:
+            self.run.checkpoint({'total': self.summary})
+        self.pending = 0
 
-def load(user):
-    for journal in ScieloJournal.objects.all().iterator():
+    def _write(self):
+        with transaction.atomic():
+            for journal, issues in self.batch:
+                try:
+                    with transaction.atomic():
+                        created = Issue.bulk_get_or_create(journal, issues, self.user)
+                except Exception as e:
+                    register_issue_error(journal.issn_scielo, e)
+                    self.summary['failed'] += 1
+                    continue
+                self.summary['harvested'] += 1
+                self.summary['issues'] += len(issues)
+                self.summary['created'] += created
+        self.batch = []
+
+
+def load(user, workers=None, workers_per_host=None, batch_size=None, replay_dir=None, capture_dir=None,
+         resume=False):
+    """
+    Harvest the issues of all journals.
+
+    The harvest is a pipeline: a pool of ``workers`` threads (at most
+    ``workers_per_host`` at the same time for each collection site) fetches
+    and parses the records of the upcoming journals, while the caller thread
+    writes the issues in batches of ``batch_size`` journals (see IssueWriter).
+    At most ``2 * workers`` parsed records wait for the writer, so the memory
+    is bounded.
+
+    With ``replay_dir``, the pages are read from a directory written by a
+    previous run with ``capture_dir`` (see core.utils.harvest_client), so the
+    harvest runs with no network.
+
+    The journals are harvested by collection and ISSN and the progress is
+    checkpointed in a HarvestRun at every batch. With ``resume``, the last
+    harvest not finished continues from its cursor.
+
+    The rest of a collection whose site circuit opens (see
+    core.utils.rate_limit) is skipped. Then, after the other collections,
+    CircuitOpenError is raised and the run is left to be resumed.
+    Return the counts of the harvest, with the throughput in journals and
+    issues per second.
+    """
+    workers = workers or settings.HARVEST_WORKERS
+    host_limiter = HostLimiter(workers_per_host or settings.HARVEST_WORKERS_PER_HOST)
+    client = get_client(replay_dir, capture_dir)
+    run = HarvestRun.start('issue', user, resume)
+    writer = IssueWriter(user, batch_size, run)
+
+    def list_journals(collection):
+        journals = list(
+            ScieloJournal.objects.filter(collection=collection).select_related('collection').order_by(
+                'issn_scielo', 'id'))
+        for journal in run.remaining(collection.domain, journals, key=lambda j: j.issn_scielo):
+            yield collection, journal
+        # marks the end of the collection for the writer
+        yield collection, None
+
+    def fetch(item):
+        # runs in the pool, so the errors are registered by the writer
+        collection, journal = item
+        if journal is None:
+            return collection, journal, None, None, None
+        with host_limiter.slot(collection.domain):
+            try:
+                journal_xml = fetch_journal_xml(collection.domain, journal.issn_scielo, client)
+            except Exception as e:
+                return collection, journal, None, e, partial(
+                    register_journal_xml_error, collection.domain, journal.issn_scielo)
         try:
-            journal_xml = get_journal_xml(journal.collection.domain, journal.issn_scielo)
-            get_issue(user, journal_xml)
+            return collection, journal, parse_issues(journal_xml), None, None
         except Exception as e:
-            error = ProcessingError()
-            error.item = f"Error getting record XML"
-            error.step = "SciELO journal record recovery error"
-            error.description = str(e)[:509]
-            error.type = str(type(e))
-            error.save()
+            return collection, journal, None, e, partial(register_issue_error, journal.issn_scielo)
+
+    started = time.monotonic()
+    before = dict(writer.summary)
+    deferred = {}
+    try:
+        items = interleave(*[list_journals(collection) for collection in Collection.objects.order_by('id')])
+        for collection, journal, issues, error, register_error in ordered_map(fetch, items, workers):
+            if collection.domain in deferred:
+                continue
+            if isinstance(error, CircuitOpenError):
+                logging.warning("Issue harvest of %s deferred: %s", collection.domain, error)
+                deferred[collection.domain] = error.retry_after
+                continue
+            if journal is None:
+                writer.finish_collection(collection)
+                continue
+            if error is not None:
+                register_error(error)
+                writer.failed()
+            else:
+                writer.add(journal, issues)
+            writer.advance(journal)
+        writer.flush()
+    except BaseException:
+        run.interrupt()
+        raise
+
+    elapsed = max(time.monotonic() - started, 1e-6)
+    summary = dict(writer.summary)
+    summary['journals_per_second'] = round(
+        (summary['harvested'] + summary['failed'] - before['harvested'] - before['failed']) / elapsed, 2)
+    summary['issues_per_second'] = round((summary['issues'] - before['issues']) / elapsed, 2)
+    logging.info("Issue harvest: %s", summary)
+    logging.info("Issue harvest HTTP stats: %s", client.stats)
+    if deferred:
+        # the run is resumed later for the collections which were skipped
+        run.interrupt()
+        raise CircuitOpenError(", ".join(deferred), max(deferred.values()))
+    run.finish({'total': writer.summary})
+    return summary
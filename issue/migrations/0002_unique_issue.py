@@ -0,0 +1,42 @@
+# Generated by Django 4.1.6 on 2026-10-18 04:45
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.functions.comparison
+
+
+def remove_duplicated_issues(apps, schema_editor):
+    """
+    Keep only the oldest issue of each natural key, so the unique constraint
+    can be added. Empty and null values are the same, as in the constraint.
+    """
+    Issue = apps.get_model('issue', 'Issue')
+
+    keep = {}
+    removed = []
+    for item in Issue.objects.filter(journal__isnull=False).order_by('id').values(
+            'id', 'journal', 'volume', 'number', 'supplement', 'year', 'month').iterator():
+        key = (item['journal'], item['volume'] or '', item['number'] or '', item['supplement'] or '',
+               item['year'] or 0, item['month'] or 0)
+        if keep.setdefault(key, item['id']) != item['id']:
+            removed.append(item['id'])
+    for i in range(0, len(removed), 1000):
+        Issue.objects.filter(id__in=removed[i:i + 1000]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('issue', '0001_initial'),
+        # the journals merged there take their issues along
+        ('journal', '0003_unique_officialjournal_scielojournal'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicated_issues, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='issue',
+            constraint=models.UniqueConstraint(models.F('journal'), django.db.models.functions.comparison.Coalesce('volume', models.Value('')), django.db.models.functions.comparison.Coalesce('number', models.Value('')), django.db.models.functions.comparison.Coalesce('supplement', models.Value('')), django.db.models.functions.comparison.Coalesce('year', models.Value(0)), django.db.models.functions.comparison.Coalesce('month', models.Value(0)), name='issue_issue_unique_natural_key'),
+        ),
+    ]
@@ -1,4 +1,6 @@
 from django.db import models
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce
 from django.utils.translation import gettext_lazy as _
 from wagtail.admin.edit_handlers import FieldPanel
 
@@ -9,6 +11,15 @@ from core.forms import CoreAdminModelForm
 from journal.models import ScieloJournal
 
 
+def get_natural_key(volume, number, supplement, year, month):
+    """
+    Return the key which identifies an issue in its journal.
+
+    Empty and null values are the same, as in the unique constraint of Issue.
+    """
+    return (volume or '', number or '', supplement or '', year or 0, month or 0)
+
+
 class Issue(CommonControlField):
     """
     Class that represent an Issue
@@ -41,6 +52,17 @@ class Issue(CommonControlField):
             models.Index(fields=['month', ]),
             models.Index(fields=['supplement', ]),
         ]
+        constraints = [
+            models.UniqueConstraint(
+                F('journal'),
+                Coalesce('volume', Value('')),
+                Coalesce('number', Value('')),
+                Coalesce('supplement', Value('')),
+                Coalesce('year', Value(0)),
+                Coalesce('month', Value(0)),
+                name='issue_issue_unique_natural_key',
+            ),
+        ]
 
     @property
     def data(self):
@@ -59,7 +81,6 @@ class Issue(CommonControlField):
     @classmethod
     def get_or_create(cls, journal, number, volume, year, month, supplement, user):
         issues = cls.objects.filter(
-            creator=user,
             journal=journal,
             number=number,
             volume=volume,
@@ -77,10 +98,37 @@ class Issue(CommonControlField):
             issue.year = year
             issue.month = month
             issue.supplement = supplement
+            issue.creator = user
             issue.save()
 
         return issue
 
+    @classmethod
+    def bulk_get_or_create(cls, journal, records, user):
+        """
+        Get or create the issues ``records`` of ``journal`` with one query and
+        one insert, whatever the number of records.
+
+        Param records: list of dicts with the keys volume, number, supplement,
+            year and month
+        Return the number of issues created
+        """
+        existing = {
+            get_natural_key(*item)
+            for item in cls.objects.filter(journal=journal).values_list(
+                'volume', 'number', 'supplement', 'year', 'month')
+        }
+        missing = {}
+        for record in records:
+            key = get_natural_key(
+                record['volume'], record['number'], record['supplement'], record['year'], record['month'])
+            if key not in existing:
+                missing.setdefault(key, cls(journal=journal, creator=user, **record))
+        if missing:
+            # a concurrent harvest may have inserted some of them meanwhile
+            cls.objects.bulk_create(missing.values(), ignore_conflicts=True)
+        return len(missing)
+
     def __unicode__(self):
         return u'%s - (%s %s %s %s)' % (self.journal, self.number, self.volume, self.year, self.supplement) or ''
 
@@ -2,4 +2,4 @@ from issue import tasks
 
 
 def run():
-    tasks.load_issue.apply_async()
+    tasks.harvest_issues.apply_async()
@@ -1,21 +1,116 @@
+import logging
+
+from celery import chord
+from django.conf import settings
 from django.contrib.auth import get_user_model
 
 from config import celery_app
 
+from collection.models import Collection
+from core.models import HarvestRun
+from core.utils.rate_limit import CircuitOpenError
 from issue import controller
+from journal.models import ScieloJournal
 
 
 User = get_user_model()
 
 
-@celery_app.task()
-def load_issue(*args):
+@celery_app.task(bind=True)
+def load_issue(self, *args, workers=None, replay_dir=None, capture_dir=None, resume=False):
     """
     Load issue record.
 
     Sync or Async function
+
+    Param workers: number of threads fetching the records (default: settings.HARVEST_WORKERS)
+    Param replay_dir: directory of captured pages to harvest from, instead of the SciELO sites
+    Param capture_dir: directory where the harvested pages are written
+    Param resume: continue the last harvest which was not finished
+
+    The collections skipped because their site is failing (circuit open) are
+    harvested again by a retry of the task, when the circuit closes.
     """
 
     user = User.objects.get(id=args[0] if args else 1)
 
-    controller.load(user)
+    try:
+        return controller.load(user, workers=workers, replay_dir=replay_dir, capture_dir=capture_dir,
+                               resume=resume)
+    except CircuitOpenError as e:
+        raise self.retry(exc=e, countdown=e.retry_after, kwargs=dict(self.request.kwargs, resume=True))
+
+
+@celery_app.task()
+def harvest_issues(*args, batch_size=None):
+    """
+    Load issue records split in tasks.
+
+    One task by collection dispatches a task by batch of ``batch_size``
+    journals, joined by a chord which adds the summary of the collection to
+    the total of a HarvestRun. The requests to each site are limited by
+    settings.HARVEST_RATE_LIMIT, so more workers do not overload any SciELO
+    site.
+    """
+    user_id = args[0] if args else 1
+
+    collections = list(Collection.objects.values_list('id', 'domain'))
+    run = HarvestRun.start('issue', User.objects.get(id=user_id))
+    run.dispatch([domain for collection_id, domain in collections])
+    for collection_id, domain in collections:
+        harvest_issue_collection.apply_async(
+            args=(user_id, collection_id), kwargs={'batch_size': batch_size, 'run_id': run.id})
+
+
+@celery_app.task()
+def harvest_issue_collection(user_id, collection_id, batch_size=None, run_id=None):
+    batch_size = batch_size or settings.HARVEST_BATCH_SIZE
+
+    journal_ids = list(ScieloJournal.objects.filter(collection_id=collection_id).values_list('id', flat=True))
+    batches = [journal_ids[i:i + batch_size] for i in range(0, len(journal_ids), batch_size)]
+    if not batches:
+        return summarize_issue_harvest([], collection_id, run_id)
+
+    chord(
+        harvest_issue_batch.s(user_id, batch) for batch in batches
+    )(summarize_issue_harvest.s(collection_id, run_id))
+
+
+@celery_app.task(bind=True)
+def harvest_issue_batch(self, user_id, journal_ids):
+    """
+    Harvest the issues of a batch of journals. When it fails, after the
+    retries of a failing site, its journals are counted as failed, so the
+    chord of the collection still reports the summary.
+    """
+    user = User.objects.get(id=user_id)
+    journals = ScieloJournal.objects.filter(id__in=journal_ids).select_related('collection')
+
+    try:
+        return controller.load_journals(user, journals)
+    except CircuitOpenError as e:
+        if self.request.retries < self.max_retries:
+            raise self.retry(exc=e, countdown=e.retry_after)
+        error = e
+    except Exception as e:
+        logging.exception(e)
+        error = e
+    collection = journals[0].collection.domain if journals else None
+    controller.register_collection_error(collection, error)
+    return dict(harvested=0, failed=len(journal_ids), unfinished=1)
+
+
+@celery_app.task()
+def summarize_issue_harvest(summaries, collection_id, run_id=None):
+    collection = Collection.objects.get(id=collection_id)
+    summary = dict(harvested=0, failed=0, unfinished=0)
+    for item in summaries:
+        for key, value in item.items():
+            summary[key] += value
+
+    # the collection of a failed batch is left to be harvested again
+    unfinished = summary.pop('unfinished')
+    logging.info("Issue harvest of %s: %s", collection.domain, summary)
+    if run_id:
+        HarvestRun.objects.get(id=run_id).report(collection.domain, summary, not unfinished, key='total')
+    return {collection.domain: summary}
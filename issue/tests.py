@@ -1,3 +1,87 @@
-from django.test import TestCase
+import pytest
 
-# Create your tests here.
+from config import celery_app
+from core.models import HarvestRun
+from core.users.tests.factories import UserFactory
+from core.utils.harvest_client import ReplayClient
+from core.utils.tests.harvest import create_collections, write_replay
+from issue import controller, tasks
+from issue.models import Issue
+from journal import controller as journal_controller
+
+pytestmark = pytest.mark.django_db
+
+COUNTS = ("harvested", "failed", "issues", "created")
+
+
+def get_issues():
+    return sorted(Issue.objects.values_list("journal__issn_scielo", "volume", "number", "year", "month"))
+
+
+@pytest.fixture
+def user():
+    return UserFactory()
+
+
+@pytest.fixture
+def replay_dir(tmp_path, user):
+    replay_dir = write_replay(str(tmp_path))
+    create_collections()
+    journal_controller.load(user, workers=1, replay_dir=replay_dir)
+    return replay_dir
+
+
+def test_serial_and_concurrent_harvests_record_the_same_issues(user, replay_dir):
+    serial = controller.load(user, workers=1, batch_size=4, replay_dir=replay_dir)
+    issues = get_issues()
+    Issue.objects.all().delete()
+    concurrent = controller.load(user, workers=3, batch_size=4, replay_dir=replay_dir)
+
+    assert len(issues) == 36
+    assert get_issues() == issues
+    assert {key: serial[key] for key in COUNTS} == {key: concurrent[key] for key in COUNTS}
+    assert {key: serial[key] for key in COUNTS} == dict(harvested=12, failed=0, issues=36, created=36)
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_an_interrupted_harvest_is_resumed_from_its_cursor(user, replay_dir, monkeypatch, workers):
+    fetch_journal_xml = controller.fetch_journal_xml
+    fetched = []
+    interrupt_at = [8]
+
+    def fetch(collection, issn, client=None):
+        fetched.append(issn)
+        if len(fetched) == interrupt_at[0]:
+            raise KeyboardInterrupt
+        return fetch_journal_xml(collection, issn, client)
+
+    monkeypatch.setattr(controller, "fetch_journal_xml", fetch)
+    with pytest.raises(KeyboardInterrupt):
+        controller.load(user, workers=workers, batch_size=2, replay_dir=replay_dir)
+
+    run = HarvestRun.objects.get(kind="issue")
+    assert run.status == "interrupted"
+    assert run.cursor
+
+    fetched.clear()
+    interrupt_at[0] = None
+    summary = controller.load(user, workers=workers, batch_size=2, replay_dir=replay_dir, resume=True)
+
+    run.refresh_from_db()
+    assert run.status == "finished"
+    assert HarvestRun.objects.filter(kind="issue").count() == 1
+    assert len(get_issues()) == 36
+    # the journals committed before the interruption are not fetched again
+    assert len(fetched) < 12
+    assert summary["harvested"] == 12
+
+
+def test_the_harvest_split_in_tasks_adds_the_summaries_to_a_run(user, replay_dir, monkeypatch):
+    monkeypatch.setattr(celery_app.conf, "task_always_eager", True)
+    monkeypatch.setattr(controller, "get_client", lambda *args, **kwargs: ReplayClient(replay_dir))
+    tasks.harvest_issues(user.id, batch_size=4)
+
+    run = HarvestRun.objects.get(kind="issue")
+    assert run.status == "finished"
+    assert run.summary == {"total": dict(harvested=12, failed=0)}
+    assert len(get_issues()) == 36
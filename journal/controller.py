@@ -1,23 +1,71 @@
-import requests
-import xmltodict
+import hashlib
 import json
+import logging
+from xml.etree import ElementTree
+
+from django.conf import settings
+from django.db import transaction
 
 from .models import OfficialJournal, ScieloJournal, Mission
 from institution.models import Institution, InstitutionHistory
+from institution.resolver import InstitutionResolver, normalize_name
 from collection.models import Collection
+from core.models import HarvestRun
 from processing_errors.models import ProcessingError
+from core.utils.harvest import HostLimiter, interleave, ordered_map
+from core.utils.harvest_client import get_client
+from core.utils.rate_limit import CircuitOpenError
 
 
-def get_issn(collection):
-    try:
-        collections = requests.get(f"http://{collection}/scielo.php?script=sci_alphabetic&lng=es&nrm=iso&debug=xml",
-                                   timeout=10)
-        data = xmltodict.parse(collections.text)
+def iter_serial_issns(stream):
+    """
+    Yield ``(issn, error)`` for each SERIAL of a sci_alphabetic SERIALLIST.
 
-        for issn in data['SERIALLIST']['LIST']['SERIAL']:
-            try:
-                yield issn['TITLE']['@ISSN']
-            except Exception as e:
+    The XML is parsed incrementally and each SERIAL is discarded as soon as
+    it is read, so the memory does not grow with the size of the list.
+    """
+    has_list = False
+    parents = []
+    for event, element in ElementTree.iterparse(stream, events=("start", "end")):
+        if event == "start":
+            parents.append(element)
+            if element.tag == "LIST" and [e.tag for e in parents] == ["SERIALLIST", "LIST"]:
+                has_list = True
+            continue
+
+        parents.pop()
+        if element.tag != "SERIAL":
+            continue
+        title = element.find("TITLE")
+        if title is None:
+            yield None, KeyError("TITLE")
+        elif "ISSN" not in title.attrib:
+            yield None, KeyError("@ISSN")
+        else:
+            yield title.attrib["ISSN"], None
+        if parents:
+            parents[-1].remove(element)
+
+    if not has_list:
+        raise KeyError("LIST")
+
+
+def get_issn(collection, client=None):
+    """
+    Yield the ISSNs of the sci_alphabetic list of ``collection``.
+
+    The SERIALs without ISSN are recorded as ProcessingError and skipped.
+    An error reading the list (e.g. the request fails or the XML is cut
+    off) is recorded and raised, so the collection is not taken as fully
+    listed.
+    """
+    try:
+        with (client or get_client()).open(
+                f"http://{collection}/scielo.php?script=sci_alphabetic&lng=es&nrm=iso&debug=xml") as stream:
+            for issn, e in iter_serial_issns(stream):
+                if e is None:
+                    yield issn
+                    continue
                 error = ProcessingError()
                 error.item = f"ISSN's list of {collection} collection error"
                 error.step = "Get an ISSN from a collection error"
@@ -25,80 +73,123 @@ def get_issn(collection):
                 error.type = str(type(e))
                 error.save()
 
+    except CircuitOpenError:
+        raise
     except Exception as e:
         error = ProcessingError()
+        error.item = f"ISSN's list of {collection} collection error"
         error.step = "Collection ISSN's list search error"
         error.description = str(e)[:509]
         error.type = str(type(e))
         error.save()
+        raise
 
 
-def get_journal_xml(collection, issn):
-    try:
-        official_journal = requests.get(
-            f"http://{collection}/scielo.php?script=sci_serial&pid={issn}&lng=es&nrm=iso&debug=xml", timeout=10)
-        return xmltodict.parse(official_journal.text)
+def fetch_journal_xml(collection, issn, client=None):
+    return (client or get_client()).get_xml(
+        f"http://{collection}/scielo.php?script=sci_serial&pid={issn}&lng=es&nrm=iso&debug=xml")
+
+
+def register_journal_xml_error(collection, issn, e):
+    error = ProcessingError()
+    error.item = f"Error getting the ISSN {issn} of the {collection} collection"
+    error.step = "Journal record search error"
+    error.description = str(e)[:509]
+    error.type = str(type(e))
+    error.save()
+
 
+def get_journal_xml(collection, issn, client=None):
+    try:
+        return fetch_journal_xml(collection, issn, client)
+    except CircuitOpenError:
+        raise
     except Exception as e:
-        error = ProcessingError()
-        error.item = f"Error getting the ISSN {issn} of the {collection} collection"
-        error.step = "Journal record search error"
-        error.description = str(e)[:509]
-        error.type = str(type(e))
-        error.save()
+        register_journal_xml_error(collection, issn, e)
+
+
+def parse_official_journal(journal_xml):
+    issnl = journal_xml['SERIAL']['ISSN_AS_ID']
+    title = journal_xml['SERIAL']['TITLEGROUP']['TITLE']
+    # this value are not available in the XML file
+    foundation_year = None
+    issns = journal_xml['SERIAL']['TITLE_ISSN']
+    issns_list = issns if type(issns) is list else [issns]
+    issn_print = None
+    issn_electronic = None
+
+    for issn in issns_list:
+        if issn['@TYPE'] == 'PRINT':
+            issn_print = issn['#text']
+        if issn['@TYPE'] == 'ONLIN':
+            issn_electronic = issn['#text']
+
+    return dict(
+        title=title,
+        foundation_year=foundation_year,
+        issn_print=issn_print,
+        issn_electronic=issn_electronic,
+        issnl=issnl,
+    )
+
+
+def register_official_journal_error(journal_xml, e):
+    error = ProcessingError()
+    error.item = f"Error getting or creating official journal for {journal_xml['SERIAL']['ISSN_AS_ID']}"
+    error.step = "Official journal record creation error"
+    error.description = str(e)[:509]
+    error.type = str(type(e))
+    error.save()
+
+
+def register_scielo_journal_error(journal_xml, e):
+    error = ProcessingError()
+    error.item = f"Error getting or creating SciELO journal for {journal_xml['SERIAL']['ISSN_AS_ID']}"
+    error.step = "SciELO journal record creation error"
+    error.description = str(e)[:509]
+    error.type = str(type(e))
+    error.save()
 
 
 def get_official_journal(user, journal_xml):
     try:
-        issnl = journal_xml['SERIAL']['ISSN_AS_ID']
-        title = journal_xml['SERIAL']['TITLEGROUP']['TITLE']
-        # this value are not available in the XML file
-        foundation_year = None
-        issns = journal_xml['SERIAL']['TITLE_ISSN']
-        issns_list = issns if type(issns) is list else [issns]
-        issn_print = None
-        issn_electronic = None
+        record = parse_official_journal(journal_xml)
+        return OfficialJournal.bulk_get_or_create([record], user)[record['issnl']]
+    except Exception as e:
+        register_official_journal_error(journal_xml, e)
 
-        for issn in issns_list:
-            if issn['@TYPE'] == 'PRINT':
-                issn_print = issn['#text']
-            if issn['@TYPE'] == 'ONLIN':
-                issn_electronic = issn['#text']
 
-        official_journal = OfficialJournal.get_or_create(title, foundation_year, issn_print,
-                                                         issn_electronic, issnl, user)
+def get_fingerprint(journal_xml):
+    """
+    Return the SHA-256 of the normalized sci_serial record.
 
-        return official_journal
+    CONTROLINFO describes the page request (date, server, ...) and changes
+    at every request, so only its LANGUAGE is taken into account.
+    """
+    serial = dict(journal_xml['SERIAL'])
+    control_info = serial.pop('CONTROLINFO', None) or {}
+    serial['CONTROLINFO'] = {'LANGUAGE': control_info.get('LANGUAGE')}
+    normalized = json.dumps(serial, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
 
-    except Exception as e:
-        error = ProcessingError()
-        error.item = f"Error getting or creating official journal for {journal_xml['SERIAL']['ISSN_AS_ID']}"
-        error.step = "Official journal record creation error"
-        error.description = str(e)[:509]
-        error.type = str(type(e))
-        error.save()
 
+def complete_scielo_journal(user, journal_xml, scielo_journal, institutions=None):
+    """
+    Add or update the mission and add the publisher of ``journal_xml`` to
+    ``scielo_journal``, then store the fingerprint of ``journal_xml``, which
+    must be the last write, so a journal is never skipped as unchanged before
+    its record is written.
 
-def get_scielo_journal(user, journal_xml, collection):
-    try:
-        official_journal = get_official_journal(user, journal_xml)
-        issn_scielo = official_journal.issnl
-        title = journal_xml['SERIAL']['TITLEGROUP']['TITLE']
-        short_title = journal_xml['SERIAL']['TITLEGROUP']['SHORTTITLE']
-        scielo_journal = ScieloJournal.get_or_create(
-            official_journal=official_journal,
-            issn_scielo=issn_scielo,
-            title=title,
-            short_title=short_title,
-            collection=collection,
-            user=user)
-
-        mission_text = journal_xml['SERIAL']['MISSION']
-        language = journal_xml['SERIAL']['CONTROLINFO']['LANGUAGE']
-        scielo_journal.panels_mission.append(Mission.get_or_create(scielo_journal, issn_scielo, mission_text,
-                                                                   language, user))
-
-        institution_name = journal_xml['SERIAL']['PUBLISHERS']['PUBLISHER']['NAME']
+    ``institutions`` is the InstitutionResolver of the harvest, if any
+    """
+    mission_text = journal_xml['SERIAL']['MISSION']
+    language = journal_xml['SERIAL']['CONTROLINFO']['LANGUAGE']
+    Mission.create_or_update(scielo_journal, mission_text, language, user)
+
+    institution_name = (journal_xml['SERIAL']['PUBLISHERS']['PUBLISHER'] or {}).get('NAME')
+    if institutions:
+        institutions.get_history_id(institutions.get_institution_id(institution_name))
+    elif normalize_name(institution_name):
         # the other parameters are not available in the XML file
         institution = Institution.get_or_create(
                 inst_name=institution_name,
@@ -106,28 +197,371 @@ def get_scielo_journal(user, journal_xml, collection):
                 level_1=None,
                 level_2=None,
                 level_3=None,
-                location=None
+                location=None,
+                official=None,
+                is_official=None,
             )
-        history = InstitutionHistory.get_or_create(institution=institution, initial_date=None, final_date=None)
-        scielo_journal.panels_publisher.append(history)
-        scielo_journal.creator = user
-        scielo_journal.save()
-        return scielo_journal
+        InstitutionHistory.get_or_create(institution=institution, initial_date=None, final_date=None)
+    scielo_journal.creator = user
+    scielo_journal.fingerprint = get_fingerprint(journal_xml)
+    scielo_journal.save()
+    return scielo_journal
+
+
+def get_scielo_journal(user, journal_xml, collection, institutions=None):
+    try:
+        official_journal = get_official_journal(user, journal_xml)
+        issn_scielo = official_journal.issnl
+        title = journal_xml['SERIAL']['TITLEGROUP']['TITLE']
+        short_title = journal_xml['SERIAL']['TITLEGROUP']['SHORTTITLE']
+        scielo_journals = ScieloJournal.bulk_get_or_create(
+            [dict(
+                official=official_journal,
+                issn_scielo=issn_scielo,
+                title=title,
+                short_title=short_title,
+                collection=collection,
+            )],
+            user)
+        scielo_journal = scielo_journals[(official_journal.id, collection.id)]
+        return complete_scielo_journal(user, journal_xml, scielo_journal, institutions)
 
     except Exception as e:
-        error = ProcessingError()
-        error.item = f"Error getting or creating SciELO journal for {journal_xml['SERIAL']['ISSN_AS_ID']}"
-        error.step = "SciELO journal record creation error"
-        error.description = str(e)[:509]
-        error.type = str(type(e))
-        error.save()
+        register_scielo_journal_error(journal_xml, e)
+
+
+def get_scielo_journals(user, items, institutions=None):
+    """
+    Bulk version of get_scielo_journal.
+
+    The official and the SciELO journals of all items are created or updated
+    with a few queries, then each journal is completed in its own savepoint.
+    If the bulk step fails, the items are recorded one by one.
 
+    Param items: list of tuples (journal_xml, collection)
+    Param institutions: InstitutionResolver of the harvest, if any
+    Return the list of ScieloJournal of the items (None for the failures)
+    """
+    try:
+        with transaction.atomic():
+            records = []
+            for journal_xml, collection in items:
+                try:
+                    record = parse_official_journal(journal_xml)
+                    short_title = journal_xml['SERIAL']['TITLEGROUP']['SHORTTITLE']
+                except Exception as e:
+                    register_official_journal_error(journal_xml, e)
+                    record = short_title = None
+                records.append((record, short_title))
+
+            official_journals = OfficialJournal.bulk_get_or_create(
+                [record for record, short_title in records if record], user)
+            scielo_records = [
+                dict(
+                    official=official_journals[record['issnl']],
+                    issn_scielo=record['issnl'],
+                    title=record['title'],
+                    short_title=short_title,
+                    collection=collection,
+                )
+                for (journal_xml, collection), (record, short_title) in zip(items, records)
+                if record
+            ]
+            scielo_journals = ScieloJournal.bulk_get_or_create(scielo_records, user)
+    except Exception as e:
+        logging.exception(e)
+        return [_get_scielo_journal_in_savepoint(user, journal_xml, collection, institutions)
+                for journal_xml, collection in items]
+
+    results = []
+    for (journal_xml, collection), (record, short_title) in zip(items, records):
+        scielo_journal = None
+        if record:
+            scielo_journal = scielo_journals[(official_journals[record['issnl']].id, collection.id)]
+            try:
+                with _atomic(institutions):
+                    scielo_journal = complete_scielo_journal(user, journal_xml, scielo_journal, institutions)
+            except Exception as e:
+                register_scielo_journal_error(journal_xml, e)
+                scielo_journal = None
+        results.append(scielo_journal)
+    return results
+
+
+def _atomic(institutions):
+    # the ids cached by the resolver must be forgotten when the savepoint rolls back
+    return institutions.atomic() if institutions else transaction.atomic()
+
+
+def _get_scielo_journal_in_savepoint(user, journal_xml, collection, institutions=None):
+    try:
+        with _atomic(institutions):
+            return get_scielo_journal(user, journal_xml, collection, institutions)
+    except Exception as e:
+        register_scielo_journal_error(journal_xml, e)
+
+
+class JournalWriter:
+    """
+    Record the harvested journals in batches.
+
+    Each batch of ``batch_size`` changed journals is committed in its own
+    transaction. Journals whose record did not change since the last
+    harvest are skipped (see get_fingerprint). The publishers are resolved
+    through one InstitutionResolver for the whole harvest.
+
+    The harvesters call ``advance`` after each ISSN, which flushes the batch
+    when it is full. With a HarvestRun, its cursor is checkpointed at every
+    flush, after the batch is committed, so a resumed harvest never skips a
+    journal which was not recorded.
+
+    Attributes
+    ----------
+    summaries : dict
+        counts of "new", "updated", "unchanged" and "failed" journals by
+        collection domain
+    """
+
+    def __init__(self, user, batch_size=None, run=None):
+        self.user = user
+        self.batch_size = batch_size or settings.HARVEST_BATCH_SIZE
+        self.batch = []
+        self.fingerprints = {}
+        self.run = run
+        # a resumed harvest keeps counting from the interruption
+        self.summaries = dict(run.summary) if run else {}
+        self.pending = 0
+        self.institutions = InstitutionResolver()
+
+    def summary(self, collection):
+        try:
+            return self.summaries[collection.domain]
+        except KeyError:
+            summary = self.summaries[collection.domain] = dict(new=0, updated=0, unchanged=0, failed=0)
+            return summary
+
+    def get_fingerprints(self, collection):
+        try:
+            return self.fingerprints[collection.id]
+        except KeyError:
+            fingerprints = self.fingerprints[collection.id] = dict(
+                ScieloJournal.objects.filter(collection=collection).values_list('issn_scielo', 'fingerprint'))
+            return fingerprints
+
+    def failed(self, collection):
+        self.summary(collection)['failed'] += 1
+
+    def add(self, journal_xml, collection):
+        fingerprints = self.get_fingerprints(collection)
+        try:
+            issn_scielo = journal_xml['SERIAL']['ISSN_AS_ID']
+            unchanged = fingerprints.get(issn_scielo, False) == get_fingerprint(journal_xml)
+        except Exception as e:
+            register_scielo_journal_error(journal_xml, e)
+            self.failed(collection)
+            return
+        if unchanged:
+            self.summary(collection)['unchanged'] += 1
+            return
+
+        self.batch.append((journal_xml, collection))
+
+    def advance(self, collection, issn):
+        """
+        Mark ``issn`` of ``collection`` as processed.
+        """
+        if self.run:
+            self.run.advance(collection.domain, issn)
+        self.pending += 1
+        if len(self.batch) >= self.batch_size or self.pending >= self.batch_size:
+            self.flush()
 
-def load(user):
-    for collection in Collection.objects.all().iterator():
+    def finish_collection(self, collection):
+        if self.run:
+            self.run.finish_collection(collection.domain)
+
+    def flush(self):
+        if self.batch:
+            self._write()
+        if self.run:
+            self.run.checkpoint(self.summaries)
+        self.pending = 0
+
+    def _write(self):
+        with self.institutions.atomic():
+            scielo_journals = get_scielo_journals(self.user, self.batch, self.institutions)
+        for (journal_xml, collection), scielo_journal in zip(self.batch, scielo_journals):
+            summary = self.summary(collection)
+            fingerprints = self.get_fingerprints(collection)
+            issn_scielo = journal_xml['SERIAL']['ISSN_AS_ID']
+            if scielo_journal is None:
+                summary['failed'] += 1
+                continue
+            summary['updated' if issn_scielo in fingerprints else 'new'] += 1
+            fingerprints[issn_scielo] = scielo_journal.fingerprint
+        self.batch = []
+
+
+def load(user, workers=None, workers_per_host=None, batch_size=None, replay_dir=None, capture_dir=None,
+         resume=False):
+    """
+    Harvest the journals of all collections.
+
+    With ``workers`` greater than 1, the ``sci_serial`` records are fetched by
+    a pool of threads (at most ``workers_per_host`` at the same time for each
+    collection site) while a single writer, the caller thread, records them
+    in the database in the same way of the serial harvest.
+
+    The journals are committed in batches of ``batch_size`` and the ones
+    whose record did not change since the last harvest are skipped.
+
+    With ``replay_dir``, the pages are read from a directory written by a
+    previous run with ``capture_dir`` (see core.utils.harvest_client), so the
+    harvest runs with no network.
+
+    The progress is recorded in a HarvestRun. With ``resume``, the last
+    harvest not finished continues from its cursor instead of starting again.
+
+    The rest of a collection whose site circuit opens (see
+    core.utils.rate_limit) is skipped. Then, after the other collections,
+    CircuitOpenError is raised and the run is left to be resumed. A
+    collection whose ISSN list fails (see get_issn) is left unfinished too,
+    and so is the run, to be resumed.
+    Return a dict with the counts of new, updated and unchanged journals by
+    collection domain.
+    """
+    workers = workers or settings.HARVEST_WORKERS
+    client = get_client(replay_dir, capture_dir)
+    run = HarvestRun.start('journal', user, resume)
+    writer = JournalWriter(user, batch_size, run)
+    try:
+        if workers > 1:
+            deferred = _load_concurrently(
+                writer, client, workers, workers_per_host or settings.HARVEST_WORKERS_PER_HOST)
+        else:
+            deferred = _load(writer, client)
+        writer.flush()
+    except BaseException:
+        run.interrupt()
+        raise
+    for domain, summary in writer.summaries.items():
+        logging.info("Journal harvest of %s: %s", domain, summary)
+    logging.info("Journal harvest HTTP stats: %s", client.stats)
+    if deferred:
+        # the run is resumed later for the collections which were skipped
+        run.interrupt()
+        raise CircuitOpenError(", ".join(deferred), max(deferred.values()))
+    unfinished = [domain for domain in writer.summaries if not (run.cursor.get(domain) or {}).get('finished')]
+    if unfinished:
+        logging.warning("Journal harvest left unfinished: %s", ", ".join(unfinished))
+        run.interrupt()
+        return writer.summaries
+    run.finish(writer.summaries)
+    return writer.summaries
+
+
+def load_issns(user, collection, issns, client=None):
+    """
+    Harvest the journals ``issns`` of ``collection`` in one batch.
+
+    It is the unit of work of the harvest split in tasks (see journal.tasks).
+    Return the counts of new, updated, unchanged and failed journals.
+    """
+    writer = JournalWriter(user, batch_size=len(issns) or 1)
+    summary = writer.summary(collection)
+    for issn in issns:
+        journal_xml = get_journal_xml(collection.domain, issn, client)
+        if journal_xml is None:
+            writer.failed(collection)
+            continue
+        writer.add(journal_xml, collection)
+    writer.flush()
+    return summary
+
+
+def register_collection_error(collection, e):
+    error = ProcessingError()
+    error.item = f"Journals of the {collection} collection"
+    error.step = "Collection journals harvest error"
+    error.description = str(e)[:509]
+    error.type = str(type(e))
+    error.save()
+
+
+def defer_collection(deferred, collection, e):
+    logging.warning("Journal harvest of %s deferred: %s", collection.domain, e)
+    deferred[collection.domain] = e.retry_after
+
+
+def _load(writer, client):
+    deferred = {}
+    for collection in Collection.objects.order_by('id').iterator():
+        writer.summary(collection)
         try:
-            for issn in get_issn(collection.domain):
-                journal_xml = get_journal_xml(collection.domain, issn)
-                get_scielo_journal(user, journal_xml, collection)
-        except:
-            pass
+            for issn in writer.run.remaining(collection.domain, get_issn(collection.domain, client)):
+                journal_xml = get_journal_xml(collection.domain, issn, client)
+                if journal_xml is None:
+                    writer.failed(collection)
+                else:
+                    writer.add(journal_xml, collection)
+                writer.advance(collection, issn)
+        except CircuitOpenError as e:
+            defer_collection(deferred, collection, e)
+        except Exception as e:
+            # the collection is left unfinished, so a resumed harvest retries it
+            logging.exception(e)
+            register_collection_error(collection.domain, e)
+        else:
+            writer.finish_collection(collection)
+    return deferred
+
+
+def _load_concurrently(writer, client, workers, workers_per_host):
+    host_limiter = HostLimiter(workers_per_host)
+    collections = list(Collection.objects.order_by('id'))
+    for collection in collections:
+        writer.summary(collection)
+
+    def list_issns(collection):
+        try:
+            for issn in writer.run.remaining(collection.domain, get_issn(collection.domain, client)):
+                yield collection, issn
+        except Exception as e:
+            # the list is incomplete: the writer leaves the collection unfinished
+            yield collection, e
+            return
+        # marks the end of the collection for the writer
+        yield collection, None
+
+    def fetch(item):
+        collection, issn = item
+        if issn is None or isinstance(issn, Exception):
+            return collection, None, None, issn
+        with host_limiter.slot(collection.domain):
+            try:
+                return collection, issn, fetch_journal_xml(collection.domain, issn, client), None
+            except Exception as e:
+                return collection, issn, None, e
+
+    deferred = {}
+    items = interleave(*[list_issns(collection) for collection in collections])
+    for collection, issn, journal_xml, error in ordered_map(fetch, items, workers):
+        if collection.domain in deferred:
+            continue
+        if isinstance(error, CircuitOpenError):
+            defer_collection(deferred, collection, error)
+            continue
+        if issn is None:
+            if error is None:
+                writer.finish_collection(collection)
+            else:
+                # registered by get_issn, the collection is left unfinished, so a resumed harvest retries it
+                logging.warning("Journal harvest of %s left unfinished: %s", collection.domain, error)
+            continue
+        if error is not None:
+            register_journal_xml_error(collection.domain, issn, error)
+            writer.failed(collection)
+        else:
+            writer.add(journal_xml, collection)
+        writer.advance(collection, issn)
+    return deferred
@@ -0,0 +1,20 @@
+# Generated by Django 4.1.6 on 2026-10-18 04:35
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('journal', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scielojournal',
+            name='fingerprint',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True, verbose_name='Fingerprint'),
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 4.1.6 on 2026-10-18 04:36
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def merge_duplicated_journals(apps, schema_editor):
+    """
+    Keep only the oldest record of each issnl (OfficialJournal) and of each
+    (official, collection) (ScieloJournal), so the unique constraints can be
+    added. The records that point to the removed ones are moved to the kept one.
+    """
+    OfficialJournal = apps.get_model('journal', 'OfficialJournal')
+    ScieloJournal = apps.get_model('journal', 'ScieloJournal')
+    Issue = apps.get_model('issue', 'Issue')
+
+    duplicated = (
+        OfficialJournal.objects.filter(issnl__isnull=False)
+        .values('issnl').annotate(total=Count('id'), keep=Min('id')).filter(total__gt=1)
+    )
+    for item in duplicated:
+        removed = OfficialJournal.objects.filter(issnl=item['issnl']).exclude(id=item['keep'])
+        ScieloJournal.objects.filter(official__in=removed).update(official_id=item['keep'])
+        removed.delete()
+
+    duplicated = (
+        ScieloJournal.objects.filter(official__isnull=False, collection__isnull=False)
+        .values('official', 'collection').annotate(total=Count('id'), keep=Min('id')).filter(total__gt=1)
+    )
+    for item in duplicated:
+        removed = list(
+            ScieloJournal.objects.filter(official=item['official'], collection=item['collection'])
+            .exclude(id=item['keep']).values_list('id', flat=True)
+        )
+        Issue.objects.filter(journal__in=removed).update(journal_id=item['keep'])
+        # SET_NULL foreign keys would be emptied by the deletion
+        apps.get_model('journal_and_collection', 'JournalAndCollection').objects.filter(
+            journal__in=removed).update(journal_id=item['keep'])
+        apps.get_model('journal', 'Mission').objects.filter(journal__in=removed).update(journal_id=item['keep'])
+        for model_name in ('Owner', 'EditorialManager', 'Publisher', 'Sponsor', 'JournalSocialNetwork'):
+            apps.get_model('journal', model_name).objects.filter(page__in=removed).update(page_id=item['keep'])
+        ScieloJournal.objects.filter(id__in=removed).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('journal', '0002_scielojournal_fingerprint'),
+        ('issue', '0001_initial'),
+        ('journal_and_collection', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicated_journals, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='officialjournal',
+            constraint=models.UniqueConstraint(fields=('issnl',), name='journal_officialjournal_unique_issnl'),
+        ),
+        migrations.AddConstraint(
+            model_name='scielojournal',
+            constraint=models.UniqueConstraint(fields=('official', 'collection'), name='journal_scielojournal_unique_official_collection'),
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 from wagtail.core.models import Orderable
@@ -17,6 +18,33 @@ from institution.models import InstitutionHistory
 from collection.models import Collection
 
 
+def update_changed(items, fields, user):
+    """
+    Apply the values of the records to the existing rows which differ, with
+    one bulk_update.
+
+    Param items: list of tuples (row, record), record being a dict
+    Param fields: names of the fields of the record to be compared
+    Return the list of the rows which were changed
+    """
+    changed = []
+    changed_fields = set()
+    now = timezone.now()
+    for row, record in items:
+        fields_to_update = [field for field in fields if getattr(row, field) != record[field]]
+        if fields_to_update:
+            for field in fields_to_update:
+                setattr(row, field, record[field])
+            row.updated_by = user
+            row.updated = now
+            changed_fields.update(fields_to_update)
+            changed.append(row)
+    if changed:
+        # a bulk_update does not run auto_now, so updated is set above
+        row.__class__.objects.bulk_update(changed, sorted(changed_fields) + ['updated_by', 'updated'])
+    return changed
+
+
 class OfficialJournal(CommonControlField):
     """
     Class that represent the Official Journal
@@ -44,6 +72,9 @@ class OfficialJournal(CommonControlField):
             models.Index(fields=['issn_electronic', ]),
             models.Index(fields=['issnl', ]),
         ]
+        constraints = [
+            models.UniqueConstraint(fields=['issnl', ], name='journal_officialjournal_unique_issnl'),
+        ]
 
     @property
     def data(self):
@@ -73,6 +104,33 @@ class OfficialJournal(CommonControlField):
 
         return official_journal
 
+    # foundation_year is not in the harvested record, so it is kept as edited
+    UPDATE_FIELDS = ('title', 'issn_print', 'issn_electronic')
+
+    @classmethod
+    def bulk_get_or_create(cls, records, user):
+        """
+        Create or update the official journals of ``records`` with two queries,
+        one insert and one update, whatever the number of records.
+
+        The existing official journals whose UPDATE_FIELDS differ from their
+        record are updated.
+
+        Param records: list of dicts with the parameters of get_or_create
+        Return a dict {issnl: OfficialJournal}
+        """
+        records = {record['issnl']: record for record in records}
+        official_journals = {item.issnl: item for item in cls.objects.filter(issnl__in=records)}
+        missing = [cls(creator=user, **record) for issnl, record in records.items() if issnl not in official_journals]
+        if missing:
+            # a concurrent harvest may have inserted some of them meanwhile
+            cls.objects.bulk_create(missing, ignore_conflicts=True)
+            official_journals.update(
+                {item.issnl: item for item in cls.objects.filter(issnl__in=[item.issnl for item in missing])})
+        update_changed(
+            [(official_journals[issnl], record) for issnl, record in records.items()], cls.UPDATE_FIELDS, user)
+        return official_journals
+
     base_form_class = CoreAdminModelForm
 
 
@@ -127,6 +185,8 @@ class ScieloJournal(CommonControlField, ClusterableModel, SocialNetwork):
     submission_online_url = models.URLField(_("Submission online URL"), max_length=255, null=True, blank=True)
     collection = models.ForeignKey(Collection, verbose_name=_('Collection'), null=True, blank=True,
                                    on_delete=models.SET_NULL, related_name='+')
+    # SHA-256 of the normalized source record of the last harvest
+    fingerprint = models.CharField(_('Fingerprint'), max_length=64, null=True, blank=True, editable=False)
 
     panels_identification = [
         FieldPanel('official'),
@@ -182,6 +242,10 @@ class ScieloJournal(CommonControlField, ClusterableModel, SocialNetwork):
             models.Index(fields=['short_title', ]),
             models.Index(fields=['submission_online_url', ]),
         ]
+        constraints = [
+            models.UniqueConstraint(fields=['official', 'collection', ],
+                                    name='journal_scielojournal_unique_official_collection'),
+        ]
 
     @property
     def data(self):
@@ -201,7 +265,7 @@ class ScieloJournal(CommonControlField, ClusterableModel, SocialNetwork):
 
     @classmethod
     def get_or_create(cls, official_journal, issn_scielo, title, short_title, collection, user):
-        scielo_journals = cls.objects.filter(official=official_journal)
+        scielo_journals = cls.objects.filter(official=official_journal, collection=collection)
         try:
             scielo_journal = scielo_journals[0]
         except IndexError:
@@ -215,6 +279,40 @@ class ScieloJournal(CommonControlField, ClusterableModel, SocialNetwork):
             scielo_journal.save()
         return scielo_journal
 
+    UPDATE_FIELDS = ('issn_scielo', 'title', 'short_title')
+
+    @classmethod
+    def bulk_get_or_create(cls, records, user):
+        """
+        Create or update the SciELO journals of ``records`` with two queries,
+        one insert and one update, whatever the number of records.
+
+        The existing SciELO journals whose UPDATE_FIELDS differ from their
+        record are updated.
+
+        Param records: list of dicts with the keys official, issn_scielo, title,
+            short_title and collection
+        Return a dict {(official id, collection id): ScieloJournal}
+        """
+        records = {(record['official'].id, record['collection'].id): record for record in records}
+        official_ids = {official_id for official_id, collection_id in records}
+
+        def load(official_ids):
+            return {
+                (item.official_id, item.collection_id): item
+                for item in cls.objects.filter(official__in=official_ids)
+                if (item.official_id, item.collection_id) in records
+            }
+
+        scielo_journals = load(official_ids)
+        missing = [cls(creator=user, **record) for key, record in records.items() if key not in scielo_journals]
+        if missing:
+            # a concurrent harvest may have inserted some of them meanwhile
+            cls.objects.bulk_create(missing, ignore_conflicts=True)
+            scielo_journals.update(load({item.official_id for item in missing}))
+        update_changed([(scielo_journals[key], record) for key, record in records.items()], cls.UPDATE_FIELDS, user)
+        return scielo_journals
+
     def __unicode__(self):
         return u'%s' % self.official or ''
 
@@ -257,6 +355,26 @@ class Mission(Orderable, RichTextWithLang, CommonControlField):
 
         return scielo_mission
 
+    @classmethod
+    def create_or_update(cls, scielo_journal, mission_text, language, user):
+        """
+        Return the mission of ``scielo_journal`` in ``language``, created or
+        updated with ``mission_text``.
+        """
+        scielo_mission = cls.objects.filter(journal=scielo_journal, language=language).order_by('id').first()
+        if scielo_mission is None:
+            scielo_mission = cls()
+            scielo_mission.language = language
+            scielo_mission.journal = scielo_journal
+            scielo_mission.creator = user
+        elif scielo_mission.text == mission_text:
+            return scielo_mission
+        else:
+            scielo_mission.updated_by = user
+        scielo_mission.text = mission_text
+        scielo_mission.save()
+        return scielo_mission
+
 
 class Owner(Orderable, InstitutionHistory):
     page = ParentalKey(ScieloJournal, on_delete=models.CASCADE, related_name='owner')
@@ -0,0 +1,77 @@
+import logging
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+
+
+SERIAL = (
+    '<SERIAL><TITLE ISSN="{issn}">Journal {number}</TITLE>'
+    '<PUBLISHERS><PUBLISHER><NAME>Publisher {number}</NAME></PUBLISHER></PUBLISHERS>'
+    '<journal-status-history><current-status date="20020101" status="C"/></journal-status-history>'
+    '</SERIAL>'
+)
+
+
+def write_serial_list(path, total):
+    with open(path, "w", encoding="iso-8859-1") as fp:
+        fp.write('<?xml version="1.0" encoding="ISO-8859-1"?>\n<SERIALLIST><LIST>')
+        for number in range(total):
+            fp.write(SERIAL.format(issn="%04d-%04d" % divmod(number, 10000), number=number))
+        fp.write("</LIST></SERIALLIST>")
+
+
+def _xmltodict_issns(path):
+    import xmltodict
+
+    with open(path, "rb") as fp:
+        data = xmltodict.parse(fp.read().decode("iso-8859-1"))
+    return [issn["TITLE"]["@ISSN"] for issn in data["SERIALLIST"]["LIST"]["SERIAL"]]
+
+
+def _streaming_issns(path):
+    from journal.controller import iter_serial_issns
+
+    with open(path, "rb") as fp:
+        return [issn for issn, error in iter_serial_issns(fp)]
+
+
+def _measure(strategy, path, queue):
+    import django
+
+    django.setup()
+    parse = {"xmltodict": _xmltodict_issns, "streaming": _streaming_issns}[strategy]
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    total = len(parse(path))
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    queue.put((strategy, total, elapsed, baseline, peak))
+
+
+def run(*args):
+    """
+    Compare the peak RSS and the time of xmltodict.parse and of
+    iter_serial_issns extracting the ISSNs of a synthetic SERIALLIST.
+
+    Usage: python manage.py runscript benchmark_issn_parser --script-args 50000
+    """
+    total = int(args[0]) if args else 50000
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "sci_alphabetic.xml")
+        write_serial_list(path, total)
+        logging.info("SERIALLIST with %s serials: %s bytes", total, os.path.getsize(path))
+
+        for strategy in ("xmltodict", "streaming"):
+            queue = context.Queue()
+            # each strategy runs in a new interpreter, so the peaks are not mixed
+            process = context.Process(target=_measure, args=(strategy, path, queue))
+            process.start()
+            strategy, issns, elapsed, baseline, peak = queue.get()
+            process.join()
+            logging.info(
+                "%s: %s ISSNs in %.2fs, peak RSS %.1f MiB (%.1f MiB above startup)",
+                strategy, issns, elapsed, peak / 1024, (peak - baseline) / 1024,
+            )
@@ -2,4 +2,4 @@ from journal import tasks
 
 
 def run():
-    tasks.load_journal.apply_async()
+    tasks.harvest_journals.apply_async()
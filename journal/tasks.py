@@ -1,21 +1,131 @@
+import logging
+
+from celery import chord
+from django.conf import settings
 from django.contrib.auth import get_user_model
 
 from config import celery_app
 
+from collection.models import Collection
+from core.models import HarvestRun
+from core.utils.rate_limit import CircuitOpenError
 from journal import controller
 
 
 User = get_user_model()
 
 
-@celery_app.task()
-def load_journal(*args):
+@celery_app.task(bind=True)
+def load_journal(self, *args, workers=None, replay_dir=None, capture_dir=None, resume=False):
     """
     Load journal record.
 
     Sync or Async function
+
+    Param workers: number of threads fetching the records (default: settings.HARVEST_WORKERS)
+    Param replay_dir: directory of captured pages to harvest from, instead of the SciELO sites
+    Param capture_dir: directory where the harvested pages are written
+    Param resume: continue the last harvest which was not finished
+
+    The collections skipped because their site is failing (circuit open) are
+    harvested again by a retry of the task, when the circuit closes.
     """
 
     user = User.objects.get(id=args[0] if args else 1)
 
-    controller.load(user)
+    try:
+        return controller.load(user, workers=workers, replay_dir=replay_dir, capture_dir=capture_dir,
+                               resume=resume)
+    except CircuitOpenError as e:
+        raise self.retry(exc=e, countdown=e.retry_after, kwargs=dict(self.request.kwargs, resume=True))
+
+
+@celery_app.task()
+def harvest_journals(*args, batch_size=None):
+    """
+    Load journal records split in tasks.
+
+    One task by collection lists its ISSNs and dispatches a task by batch of
+    ``batch_size`` ISSNs, joined by a chord which reports the summary of the
+    collection to a HarvestRun, so the summaries of all collections are
+    gathered in the run. The requests to each site are limited by
+    settings.HARVEST_RATE_LIMIT, so more workers do not overload any SciELO
+    site.
+    """
+    user_id = args[0] if args else 1
+
+    collections = list(Collection.objects.values_list('id', 'domain'))
+    run = HarvestRun.start('journal', User.objects.get(id=user_id))
+    run.dispatch([domain for collection_id, domain in collections])
+    for collection_id, domain in collections:
+        harvest_journal_collection.apply_async(
+            args=(user_id, collection_id), kwargs={'batch_size': batch_size, 'run_id': run.id})
+
+
+@celery_app.task(bind=True)
+def harvest_journal_collection(self, user_id, collection_id, batch_size=None, run_id=None):
+    collection = Collection.objects.get(id=collection_id)
+    batch_size = batch_size or settings.HARVEST_BATCH_SIZE
+
+    try:
+        issns = list(controller.get_issn(collection.domain))
+    except CircuitOpenError as e:
+        # the site is failing, the collection is harvested later
+        if self.request.retries < self.max_retries:
+            raise self.retry(exc=e, countdown=e.retry_after)
+        controller.register_collection_error(collection.domain, e)
+        return report_journal_harvest(collection, run_id, finished=False)
+    except Exception:
+        # registered by get_issn, the collection is reported as not finished
+        return report_journal_harvest(collection, run_id, finished=False)
+    batches = [issns[i:i + batch_size] for i in range(0, len(issns), batch_size)]
+    if not batches:
+        return summarize_journal_harvest([], collection_id, run_id)
+
+    chord(
+        harvest_journal_batch.s(user_id, collection_id, batch) for batch in batches
+    )(summarize_journal_harvest.s(collection_id, run_id))
+
+
+@celery_app.task(bind=True)
+def harvest_journal_batch(self, user_id, collection_id, issns):
+    """
+    Harvest a batch of journals. When it fails, after the retries of a
+    failing site, its journals are counted as failed, so the chord of the
+    collection still reports the summary.
+    """
+    user = User.objects.get(id=user_id)
+    collection = Collection.objects.get(id=collection_id)
+
+    try:
+        return controller.load_issns(user, collection, issns)
+    except CircuitOpenError as e:
+        if self.request.retries < self.max_retries:
+            raise self.retry(exc=e, countdown=e.retry_after)
+        error = e
+    except Exception as e:
+        logging.exception(e)
+        error = e
+    controller.register_collection_error(collection.domain, error)
+    return dict(new=0, updated=0, unchanged=0, failed=len(issns), unfinished=1)
+
+
+def report_journal_harvest(collection, run_id, summary=None, finished=True):
+    summary = summary or dict(new=0, updated=0, unchanged=0, failed=0)
+    logging.info("Journal harvest of %s: %s", collection.domain, summary)
+    if run_id:
+        HarvestRun.objects.get(id=run_id).report(collection.domain, summary, finished)
+    return {collection.domain: summary}
+
+
+@celery_app.task()
+def summarize_journal_harvest(summaries, collection_id, run_id=None):
+    collection = Collection.objects.get(id=collection_id)
+    summary = dict(new=0, updated=0, unchanged=0, failed=0, unfinished=0)
+    for item in summaries:
+        for key, value in item.items():
+            summary[key] += value
+
+    # the collection of a failed batch is left to be harvested again
+    unfinished = summary.pop('unfinished')
+    return report_journal_harvest(collection, run_id, summary, finished=not unfinished)
@@ -1,3 +1,254 @@
-from django.test import TestCase
+import os
 
-# Create your tests here.
+import pytest
+
+from config import celery_app
+from core.models import HarvestRun
+from core.users.tests.factories import UserFactory
+from core.utils.harvest_client import ReplayClient
+from core.utils.tests.harvest import (
+    DOMAINS, SERIAL, create_collections, get_issns, write, write_issn_list, write_replay,
+)
+from institution.models import Institution, InstitutionHistory
+from journal import controller, tasks
+from journal.models import OfficialJournal, ScieloJournal
+from processing_errors.models import ProcessingError
+
+pytestmark = pytest.mark.django_db
+
+
+def get_journals():
+    return sorted(ScieloJournal.objects.values_list("collection__domain", "issn_scielo", "title"))
+
+
+@pytest.fixture
+def user():
+    return UserFactory()
+
+
+@pytest.fixture
+def replay_dir(tmp_path):
+    return write_replay(str(tmp_path))
+
+
+def test_run_remaining_yields_the_items_after_the_cursor(user):
+    run = HarvestRun.start("journal", user)
+    assert list(run.remaining("a", ["1", "2", "3"])) == ["1", "2", "3"]
+
+    run.advance("a", "2")
+    assert list(run.remaining("a", ["1", "2", "3"])) == ["3"]
+    assert list(run.remaining("b", ["1", "2"])) == ["1", "2"]
+
+
+def test_run_remaining_yields_all_the_items_when_the_cursor_is_not_found(user):
+    run = HarvestRun.start("journal", user)
+    run.advance("a", "9")
+    assert list(run.remaining("a", ["1", "2"])) == ["1", "2"]
+
+
+def test_run_remaining_uses_key(user):
+    run = HarvestRun.start("journal", user)
+    run.advance("a", "2")
+    assert list(run.remaining("a", [(1, "1"), (2, "2"), (3, "3")], key=lambda item: item[1])) == [(3, "3")]
+
+
+def test_run_remaining_yields_nothing_of_a_finished_collection(user):
+    run = HarvestRun.start("journal", user)
+    run.finish_collection("a")
+    assert list(run.remaining("a", ["1", "2"])) == []
+
+
+def test_run_start_resumes_the_last_run_not_finished(user):
+    run = HarvestRun.start("journal", user)
+    run.advance("a", "2")
+    run.checkpoint({})
+    run.interrupt()
+
+    resumed = HarvestRun.start("journal", user, resume=True)
+    assert resumed.id == run.id
+    assert resumed.status == "running"
+    assert resumed.cursor == {"a": {"issn": "2", "finished": False}}
+
+    resumed.finish({})
+    assert HarvestRun.start("journal", user, resume=True).id != run.id
+
+
+def test_serial_and_concurrent_harvests_record_the_same_journals(user, replay_dir):
+    create_collections()
+
+    serial = controller.load(user, workers=1, batch_size=4, replay_dir=replay_dir)
+    journals = get_journals()
+    ScieloJournal.objects.all().delete()
+    concurrent = controller.load(user, workers=3, batch_size=4, replay_dir=replay_dir)
+
+    assert len(journals) == 12
+    assert get_journals() == journals
+    assert serial == concurrent
+    assert serial[DOMAINS[0]] == dict(new=6, updated=0, unchanged=0, failed=0)
+
+
+def test_a_second_harvest_skips_the_unchanged_journals(user, replay_dir):
+    create_collections()
+
+    controller.load(user, workers=1, replay_dir=replay_dir)
+    summaries = controller.load(user, workers=1, replay_dir=replay_dir)
+
+    assert summaries[DOMAINS[0]] == dict(new=0, updated=0, unchanged=6, failed=0)
+
+
+def test_a_changed_journal_record_is_written(user, replay_dir):
+    create_collections()
+    controller.load(user, workers=1, replay_dir=replay_dir)
+
+    domain, issn = DOMAINS[0], get_issns(DOMAINS[0])[0]
+    changed = SERIAL.format(issn=issn, n=1).replace(
+        f"Journal {issn}", "New title").replace(f"J {issn}", "New").replace(f"Mission of {issn}", "New mission")
+    write(os.path.join(replay_dir, domain, issn, "sci_serial.xml"), changed)
+    summaries = controller.load(user, workers=1, replay_dir=replay_dir)
+
+    assert summaries[domain] == dict(new=0, updated=1, unchanged=5, failed=0)
+    journal = ScieloJournal.objects.get(collection__domain=domain, issn_scielo=issn)
+    assert (journal.title, journal.short_title, journal.official.title) == ("New title", "New", "New title")
+    assert [mission.text for mission in journal.mission.all()] == ["New mission"]
+    assert controller.load(user, workers=1, replay_dir=replay_dir)[domain]["unchanged"] == 6
+
+
+@pytest.mark.parametrize("publisher", ["<PUBLISHER><NAME></NAME></PUBLISHER>", "<PUBLISHER/>"])
+def test_a_journal_with_no_publisher_name_creates_no_institution(user, replay_dir, publisher):
+    create_collections()
+    for domain in DOMAINS:
+        for n, issn in enumerate(get_issns(domain), 1):
+            content = SERIAL.format(issn=issn, n=n).replace(
+                f"<PUBLISHER><NAME>Publisher {n}</NAME></PUBLISHER>", publisher)
+            write(os.path.join(replay_dir, domain, issn, "sci_serial.xml"), content)
+
+    controller.load(user, workers=1, replay_dir=replay_dir)
+    controller.load(user, workers=1, replay_dir=replay_dir)
+
+    assert len(get_journals()) == 12
+    assert not Institution.objects.exists()
+    assert not InstitutionHistory.objects.exists()
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_an_interrupted_harvest_is_resumed_from_its_cursor(user, replay_dir, monkeypatch, workers):
+    create_collections()
+    fetch_journal_xml = controller.fetch_journal_xml
+    fetched = []
+    interrupt_at = [8]
+
+    def fetch(collection, issn, client=None):
+        fetched.append(issn)
+        if len(fetched) == interrupt_at[0]:
+            raise KeyboardInterrupt
+        return fetch_journal_xml(collection, issn, client)
+
+    monkeypatch.setattr(controller, "fetch_journal_xml", fetch)
+    with pytest.raises(KeyboardInterrupt):
+        controller.load(user, workers=workers, batch_size=2, replay_dir=replay_dir)
+
+    run = HarvestRun.objects.get(kind="journal")
+    assert run.status == "interrupted"
+    assert run.cursor
+
+    fetched.clear()
+    interrupt_at[0] = None
+    controller.load(user, workers=workers, batch_size=2, replay_dir=replay_dir, resume=True)
+
+    run.refresh_from_db()
+    assert run.status == "finished"
+    assert HarvestRun.objects.filter(kind="journal").count() == 1
+    assert len(get_journals()) == 12
+    # the journals committed before the interruption are not fetched again
+    assert len(fetched) < 12
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_a_truncated_issn_list_leaves_the_collection_unfinished(user, replay_dir, workers):
+    create_collections()
+    domain = DOMAINS[1]
+    write_issn_list(replay_dir, domain, get_issns(domain), truncated=True)
+
+    controller.load(user, workers=workers, replay_dir=replay_dir)
+
+    run = HarvestRun.objects.get(kind="journal")
+    assert run.status == "interrupted"
+    assert run.cursor[DOMAINS[0]]["finished"]
+    assert not run.cursor[domain]["finished"]
+    assert ProcessingError.objects.filter(step="Collection ISSN's list search error").exists()
+    assert get_issns(domain)[3] not in {issn for _, issn, _ in get_journals()}
+
+    write_issn_list(replay_dir, domain, get_issns(domain))
+    controller.load(user, workers=workers, replay_dir=replay_dir, resume=True)
+
+    run.refresh_from_db()
+    assert run.status == "finished"
+    assert run.cursor[domain]["finished"]
+    assert len(get_journals()) == 12
+
+
+@pytest.fixture
+def eager_tasks(monkeypatch, replay_dir):
+    monkeypatch.setattr(celery_app.conf, "task_always_eager", True)
+    monkeypatch.setattr(controller, "get_client", lambda *args, **kwargs: ReplayClient(replay_dir))
+
+
+def test_the_harvest_split_in_tasks_reports_to_a_run(user, eager_tasks):
+    create_collections()
+    tasks.harvest_journals(user.id, batch_size=4)
+
+    run = HarvestRun.objects.get(kind="journal")
+    assert run.status == "finished"
+    assert run.summary == {domain: dict(new=6, updated=0, unchanged=0, failed=0) for domain in DOMAINS}
+    assert len(get_journals()) == 12
+
+
+def test_a_failed_batch_is_counted_and_leaves_the_run_unfinished(user, eager_tasks, monkeypatch):
+    create_collections()
+    load_issns = controller.load_issns
+
+    def fail_the_first_batch(user, collection, issns, client=None):
+        if issns[0] == get_issns(DOMAINS[1])[0]:
+            raise ValueError("failed batch")
+        return load_issns(user, collection, issns, client)
+
+    monkeypatch.setattr(controller, "load_issns", fail_the_first_batch)
+    tasks.harvest_journals(user.id, batch_size=4)
+
+    run = HarvestRun.objects.get(kind="journal")
+    assert run.status == "interrupted"
+    assert run.summary[DOMAINS[0]] == dict(new=6, updated=0, unchanged=0, failed=0)
+    assert run.summary[DOMAINS[1]] == dict(new=2, updated=0, unchanged=0, failed=4)
+    assert not run.cursor[DOMAINS[1]]["finished"]
+    assert ProcessingError.objects.filter(step="Collection journals harvest error").exists()
+
+
+def test_a_truncated_issn_list_is_reported_as_unfinished_by_the_tasks(user, eager_tasks, replay_dir):
+    create_collections()
+    write_issn_list(replay_dir, DOMAINS[1], get_issns(DOMAINS[1]), truncated=True)
+    tasks.harvest_journals(user.id, batch_size=4)
+
+    run = HarvestRun.objects.get(kind="journal")
+    assert run.status == "interrupted"
+    assert run.cursor[DOMAINS[0]]["finished"]
+    assert not run.cursor[DOMAINS[1]]["finished"]
+
+
+def test_bulk_get_or_create_updates_the_journals_which_changed(user):
+    collection = create_collections()[0]
+    record = dict(title="Old", foundation_year=None, issn_print="0001-0001", issn_electronic=None, issnl="0001-0001")
+    official = OfficialJournal.bulk_get_or_create([record], user)["0001-0001"]
+    scielo_record = dict(
+        official=official, issn_scielo="0001-0001", title="Old", short_title="O", collection=collection)
+    ScieloJournal.bulk_get_or_create([scielo_record], user)
+
+    official_journals = OfficialJournal.bulk_get_or_create(
+        [dict(record, title="New", issn_electronic="0001-0002")], user)
+    scielo_journals = ScieloJournal.bulk_get_or_create([dict(scielo_record, title="New", short_title="N")], user)
+
+    official = OfficialJournal.objects.get()
+    assert (official.title, official.issn_electronic, official.updated_by) == ("New", "0001-0002", user)
+    assert official_journals["0001-0001"].title == "New"
+    scielo_journal = ScieloJournal.objects.get()
+    assert (scielo_journal.title, scielo_journal.short_title) == ("New", "N")
+    assert scielo_journals[(official.id, collection.id)].id == scielo_journal.id
@@ -1,7 +1,9 @@
 import os
 import csv
 
-from thematic_areas.models import GenericThematicArea
+from django.db import transaction
+
+from thematic_areas.models import GenericThematicArea, GenericThematicAreaPath
 
 
 # This script add bulk of thematic areas
@@ -12,28 +14,42 @@ SEPARATOR = ';'
 
 
 def load_thematic_area(user):
+    """
+    Record the tree of fixtures/thematic_areas.csv, one level at a time:
+    the missing areas of each level are inserted with one bulk_create and
+    indexed in GenericThematicAreaPath with bulk_add.
+
+    Return the number of created areas.
+    """
     lang, origin = 'pt', 'CAPES'
 
     with open(os.path.dirname(os.path.realpath(__file__)) + "/./fixtures/thematic_areas.csv", 'r') as csvfile:
-        data = csv.reader(csvfile, delimiter=SEPARATOR)
-        for row in data:
-            for level in range(len(row)):
-                if row[level]:
-                    if level > 0:
-                        level_up = GenericThematicArea.objects.get(
-                            text=row[level - 1].rstrip('\n'),
-                            lang=lang,
-                            origin=origin,
-                            level=level - 1
-                        )
-                    else:
-                        level_up = None
-
-                    GenericThematicArea.get_or_create(
-                        text=row[level].rstrip('\n'),
-                        lang=lang,
-                        origin=origin,
-                        level=level,
-                        level_up=level_up,
-                        user=user
-                    )
+        rows = [[text.rstrip('\n') for text in row] for row in csv.reader(csvfile, delimiter=SEPARATOR)]
+
+    areas = {}
+    for area in GenericThematicArea.objects.filter(lang=lang, origin=origin).order_by('id'):
+        areas.setdefault((area.level, area.text, area.level_up_id), area)
+
+    created = 0
+    # the area of each level of each row
+    chains = [[] for row in rows]
+    with transaction.atomic():
+        for level in range(max((len(row) for row in rows), default=0)):
+            new = []
+            for row, chain in zip(rows, chains):
+                text = row[level] if level < len(row) else None
+                if not text:
+                    chain.append(None)
+                    continue
+                level_up = chain[level - 1] if level > 0 else None
+                key = (str(level), text, level_up and level_up.id)
+                if key not in areas:
+                    areas[key] = GenericThematicArea(
+                        text=text, lang=lang, origin=origin, level=level, level_up=level_up, creator=user)
+                    new.append(areas[key])
+                chain.append(areas[key])
+            if new:
+                GenericThematicArea.objects.bulk_create(new)
+                GenericThematicAreaPath.bulk_add(new)
+                created += len(new)
+    return created
@@ -0,0 +1,62 @@
+# Generated by Django 4.1.6 on 2026-10-18 05:28
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def build_paths(apps, schema_editor):
+    """
+    Index the areas already recorded, following ``level_up`` from each area
+    up to its root.
+    """
+    GenericThematicArea = apps.get_model('thematic_areas', 'GenericThematicArea')
+    GenericThematicAreaPath = apps.get_model('thematic_areas', 'GenericThematicAreaPath')
+
+    parents = dict(GenericThematicArea.objects.values_list('id', 'level_up_id'))
+    paths = []
+    for area_id in parents:
+        ancestor_id, depth, seen = area_id, 0, set()
+        # stops at a root, at a parent which no longer exists or at a cycle
+        while ancestor_id is not None and ancestor_id in parents and ancestor_id not in seen:
+            seen.add(ancestor_id)
+            paths.append(GenericThematicAreaPath(ancestor_id=ancestor_id, descendant_id=area_id, depth=depth))
+            ancestor_id, depth = parents[ancestor_id], depth + 1
+    GenericThematicAreaPath.objects.bulk_create(paths, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('thematic_areas', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GenericThematicAreaPath',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.PositiveSmallIntegerField(verbose_name='Depth')),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='descendant_paths', to='thematic_areas.genericthematicarea', verbose_name='Ancestor')),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ancestor_paths', to='thematic_areas.genericthematicarea', verbose_name='Descendant')),
+            ],
+            options={
+                'verbose_name': 'Generic Thematic Area Path',
+                'verbose_name_plural': 'Generic Thematic Area Paths',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='genericthematicareapath',
+            index=models.Index(fields=['ancestor', 'depth'], name='thematic_ar_ancesto_09c163_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='genericthematicareapath',
+            index=models.Index(fields=['descendant', 'depth'], name='thematic_ar_descend_67c0dc_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='genericthematicareapath',
+            constraint=models.UniqueConstraint(fields=('ancestor', 'descendant'), name='unique_thematic_area_path'),
+        ),
+        migrations.RunPython(build_paths, migrations.RunPython.noop),
+    ]
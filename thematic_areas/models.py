@@ -1,6 +1,7 @@
 import os
 
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Count, Max, signals
 from django.utils.translation import gettext as _
 from core.models import CommonControlField
 from wagtail.documents.edit_handlers import DocumentChooserPanel
@@ -44,9 +45,235 @@ class GenericThematicArea(CommonControlField):
 
         return the_area
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # the parent as read, to know in save whether the area was moved
+        instance._loaded_level_up_id = instance.__dict__.get('level_up_id')
+        return instance
+
+    def save(self, *args, **kwargs):
+        """
+        Save the area and keep its GenericThematicAreaPath up to date when
+        it is created or its ``level_up`` changes.
+        """
+        moved = self._state.adding or self.level_up_id != getattr(self, '_loaded_level_up_id', self.level_up_id)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if moved:
+                GenericThematicAreaPath.attach(self)
+        self._loaded_level_up_id = self.level_up_id
+
+    def get_ancestors(self, include_self=False):
+        """
+        Return the areas above this one, from the root, with one query.
+        """
+        return GenericThematicArea.objects.filter(
+            descendant_paths__descendant=self,
+            descendant_paths__depth__gte=0 if include_self else 1,
+        ).order_by('-descendant_paths__depth')
+
+    def get_descendants(self, include_self=False, max_depth=None):
+        """
+        Return the areas below this one, up to ``max_depth`` levels, if any,
+        ordered by depth, with one query.
+        """
+        queryset = GenericThematicArea.objects.filter(
+            ancestor_paths__ancestor=self,
+            ancestor_paths__depth__gte=0 if include_self else 1,
+        )
+        if max_depth is not None:
+            queryset = queryset.filter(ancestor_paths__depth__lte=max_depth)
+        return queryset.order_by('ancestor_paths__depth', 'id')
+
+    def get_depth(self):
+        """
+        Return the number of areas above this one (0 for a root).
+        """
+        return self.get_depths([self.id]).get(self.id, 0)
+
+    def get_subtree_count(self):
+        """
+        Return the number of areas below this one.
+        """
+        return self.get_subtree_counts([self.id]).get(self.id, 0)
+
+    @classmethod
+    def get_ancestor_ids(cls, ids, include_self=False):
+        """
+        Return a dict {id: [ids of its ancestors, from the root]} of the
+        areas ``ids``, with one query, e.g. to classify many journals by
+        their top level areas.
+        """
+        ancestors = {id: [] for id in ids}
+        for descendant_id, ancestor_id in GenericThematicAreaPath.objects.filter(
+                descendant__in=ancestors, depth__gte=0 if include_self else 1,
+        ).order_by('descendant', '-depth').values_list('descendant_id', 'ancestor_id'):
+            ancestors[descendant_id].append(ancestor_id)
+        return ancestors
+
+    @classmethod
+    def get_descendant_ids(cls, ids, include_self=True):
+        """
+        Return the set of ids of the areas below the areas ``ids``, with one
+        query, e.g. to select the journals of an area and of all its subareas.
+        """
+        return set(GenericThematicAreaPath.objects.filter(
+            ancestor__in=ids, depth__gte=0 if include_self else 1,
+        ).values_list('descendant_id', flat=True))
+
+    @classmethod
+    def get_depths(cls, ids=None):
+        """
+        Return a dict {id: depth} of the areas ``ids`` (default: all), with
+        one query.
+        """
+        queryset = GenericThematicAreaPath.objects.all()
+        if ids is not None:
+            queryset = queryset.filter(descendant__in=ids)
+        return dict(queryset.values('descendant').annotate(
+            max_depth=Max('depth')).values_list('descendant', 'max_depth'))
+
+    @classmethod
+    def get_subtree_counts(cls, ids=None):
+        """
+        Return a dict {id: number of areas below it} of the areas ``ids``
+        (default: all), with one query. The leaves are not included.
+        """
+        queryset = GenericThematicAreaPath.objects.filter(depth__gt=0)
+        if ids is not None:
+            queryset = queryset.filter(ancestor__in=ids)
+        return dict(queryset.values('ancestor').annotate(
+            total=Count('id')).values_list('ancestor', 'total'))
+
     base_form_class = CoreAdminModelForm
 
 
+class GenericThematicAreaPath(models.Model):
+    """
+    Closure table of the tree of GenericThematicArea: one row for each area
+    and each of its ancestors (and itself, with depth 0), so the ancestors,
+    descendants and depths of any area are read with one indexed query.
+
+    Kept up to date by GenericThematicArea.save, bulk_add and the deletion
+    of areas; ``rebuild`` builds it again from ``level_up``.
+
+    Fields:
+        ancestor
+        descendant
+        depth: number of levels between ancestor and descendant
+    """
+    ancestor = models.ForeignKey(GenericThematicArea, verbose_name=_("Ancestor"),
+                                 related_name="descendant_paths", on_delete=models.CASCADE)
+    descendant = models.ForeignKey(GenericThematicArea, verbose_name=_("Descendant"),
+                                   related_name="ancestor_paths", on_delete=models.CASCADE)
+    depth = models.PositiveSmallIntegerField(_("Depth"))
+
+    class Meta:
+        verbose_name = _("Generic Thematic Area Path")
+        verbose_name_plural = _("Generic Thematic Area Paths")
+        constraints = [
+            models.UniqueConstraint(fields=['ancestor', 'descendant'], name='unique_thematic_area_path'),
+        ]
+        indexes = [
+            models.Index(fields=['ancestor', 'depth']),
+            models.Index(fields=['descendant', 'depth']),
+        ]
+
+    def __str__(self):
+        return u'%s > %s (%s)' % (self.ancestor_id, self.descendant_id, self.depth)
+
+    @classmethod
+    def attach(cls, area):
+        """
+        Link ``area`` and the areas below it to the ancestors of its current
+        ``level_up``, replacing the paths to its former ancestors.
+
+        Raise ValueError if ``level_up`` is the area itself or is below it.
+        """
+        with transaction.atomic():
+            subtree = dict(cls.objects.filter(ancestor=area).values_list('descendant_id', 'depth'))
+            if area.level_up_id is not None and area.level_up_id in subtree | {area.id: 0}:
+                raise ValueError(_("The thematic area %s can not be below itself") % area.id)
+            if subtree:
+                cls.objects.filter(descendant__in=list(subtree)).exclude(ancestor__in=list(subtree)).delete()
+            paths = []
+            if not subtree:
+                subtree = {area.id: 0}
+                paths.append(cls(ancestor_id=area.id, descendant_id=area.id, depth=0))
+            if area.level_up_id is not None:
+                for ancestor_id, depth in cls.objects.filter(
+                        descendant_id=area.level_up_id).values_list('ancestor_id', 'depth'):
+                    for descendant_id, descendant_depth in subtree.items():
+                        paths.append(cls(
+                            ancestor_id=ancestor_id, descendant_id=descendant_id,
+                            depth=depth + descendant_depth + 1))
+            cls.objects.bulk_create(paths)
+
+    @classmethod
+    def bulk_add(cls, areas):
+        """
+        Record the paths of the new ``areas`` (e.g. created by bulk_create),
+        whose parents are either already indexed or in ``areas`` themselves,
+        with one query for the paths of the parents.
+        """
+        parents = {area.id: area.level_up_id for area in areas}
+        ancestors = {}
+        for descendant_id, ancestor_id, depth in cls.objects.filter(
+                descendant__in={parent_id for parent_id in parents.values() if parent_id not in parents},
+        ).values_list('descendant_id', 'ancestor_id', 'depth'):
+            ancestors.setdefault(descendant_id, []).append((ancestor_id, depth))
+
+        def get_ancestors(area_id, path=()):
+            if area_id not in ancestors:
+                if area_id in path:
+                    raise ValueError(_("The thematic area %s can not be below itself") % area_id)
+                ancestors[area_id] = [(area_id, 0)]
+                # a parent which is neither indexed nor in areas is taken as a root
+                if parents.get(area_id) is not None:
+                    ancestors[area_id] += [
+                        (ancestor_id, depth + 1)
+                        for ancestor_id, depth in get_ancestors(parents[area_id], path + (area_id,))]
+            return ancestors[area_id]
+
+        cls.objects.bulk_create([
+            cls(ancestor_id=ancestor_id, descendant_id=area_id, depth=depth)
+            for area_id in parents
+            for ancestor_id, depth in get_ancestors(area_id)
+        ], batch_size=1000)
+
+    @classmethod
+    def rebuild(cls):
+        """
+        Build the closure table again from ``level_up`` of all the areas,
+        e.g. after they are changed with queryset updates.
+
+        Return the number of paths.
+        """
+        areas = [
+            GenericThematicArea(id=id, level_up_id=level_up_id)
+            for id, level_up_id in GenericThematicArea.objects.values_list('id', 'level_up_id')
+        ]
+        with transaction.atomic():
+            cls.objects.all().delete()
+            cls.bulk_add(areas)
+        return cls.objects.count()
+
+
+def detach_thematic_area(sender, instance, **kwargs):
+    """
+    Before an area is deleted, detach the areas below it from its ancestors,
+    as their ``level_up`` is set to null.
+    """
+    GenericThematicAreaPath.objects.filter(
+        descendant__in=GenericThematicAreaPath.objects.filter(ancestor=instance).values('descendant'),
+        ancestor__in=GenericThematicAreaPath.objects.filter(descendant=instance, depth__gt=0).values('ancestor'),
+    ).delete()
+
+
+signals.pre_delete.connect(detach_thematic_area, sender=GenericThematicArea)
+
+
 class GenericThematicAreaFile(CommonControlField):
     class Meta:
         verbose_name_plural = _('Generic Thematic Areas Upload')
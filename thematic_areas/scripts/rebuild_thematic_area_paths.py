@@ -0,0 +1,5 @@
+from thematic_areas import tasks
+
+
+def run():
+    tasks.rebuild_thematic_area_paths.apply_async()
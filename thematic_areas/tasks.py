@@ -3,6 +3,7 @@ from django.contrib.auth import get_user_model
 from config import celery_app
 
 from thematic_areas import controller
+from thematic_areas.models import GenericThematicAreaPath
 
 
 User = get_user_model()
@@ -19,3 +20,13 @@ def load_thematic_area(*args):
     user = User.objects.get(id=args[0] if args else 1)
 
     controller.load_thematic_area(user)
+
+
+@celery_app.task()
+def rebuild_thematic_area_paths():
+    """
+    Build again the hierarchy index of the generic thematic areas.
+
+    Sync or Async function
+    """
+    return GenericThematicAreaPath.rebuild()